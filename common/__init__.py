@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+# Модулі, спільні для working_bot і refactor_aiogram_bot: сховище, перенос днів, графіки, імена, черга запитів
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+
+# Скільки секунд збираємо правки одного повідомлення перед edit_text
+EDIT_DEBOUNCE = 1.5
+# Скільки останніх підтверджень показуємо під графіком
+MAX_CONFIRMATIONS = 10
+
+
+class PendingEdit:
+    __slots__ = ("render", "send", "on_error", "confirmations", "task")
+
+    def __init__(self, render, send, on_error):
+        self.render = render
+        self.send = send
+        self.on_error = on_error
+        self.confirmations = []
+        self.task = None
+
+
+class EditCoalescer:
+    """Debounces edits of the same message into one edit_text call.
+
+    The first ``submit`` for a key starts a timer; everything submitted for
+    that key until it fires is folded into a single edit that renders the
+    latest state and lists all confirmations underneath.
+    """
+
+    def __init__(self, delay=EDIT_DEBOUNCE, max_confirmations=MAX_CONFIRMATIONS):
+        self.delay = delay
+        self.max_confirmations = max_confirmations
+        self._pending = {}
+        self.submitted = 0
+        self.sent = 0
+
+    async def submit(self, key, confirmation, render, send, on_error=None):
+        """render() -> text of the message, send(text) edits it, on_error(e) reports a failed edit."""
+        self.submitted += 1
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = PendingEdit(render, send, on_error)
+            pending.task = asyncio.create_task(self._flush_later(key))
+        else:
+            # Answer through the latest reply, it is the one the user is looking at
+            pending.render, pending.send, pending.on_error = render, send, on_error
+        pending.confirmations.append(confirmation)
+
+    async def _flush_later(self, key):
+        await asyncio.sleep(self.delay)
+        pending = self._pending.pop(key)
+        confirmations = pending.confirmations[-self.max_confirmations:]
+        if len(pending.confirmations) > len(confirmations):
+            confirmations.insert(0, f"... і ще {len(pending.confirmations) - len(confirmations)} змін")
+        try:
+            text = await pending.render()
+            await pending.send(text + '\n' + '\n'.join(confirmations))
+            self.sent += 1
+            if len(pending.confirmations) > 1:
+                logging.info(f"Folded {len(pending.confirmations)} schedule edits of {key} into one message edit")
+        except Exception as e:
+            logging.error(f"Failed to edit message {key}: {e}")
+            if pending.on_error:
+                try:
+                    await pending.on_error(e)
+                except Exception as e:
+                    logging.error(f"Failed to report edit failure of {key}: {e}")
+
+
+schedule_edits = EditCoalescer()
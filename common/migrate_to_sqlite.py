@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Одноразовий перенос графіків, статистики та інших даних чатів з JSON-файлів у SQLite.
+# Використання (з каталогу бота, де лежать schedules/ і stats/): python ../common/migrate_to_sqlite.py [шлях_до_бази]
+import json
+import os
+import sys
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.storage import SCHEDULES_DIR, STATS_DIR, DB_FILE, DATA_KINDS, schedule_key, stats_key, data_key
+from common.sqlite_storage import SqliteBackend
+from common.schedule_mask import Schedule
+
+
+def iter_json_files(directory):
+    if not os.path.isdir(directory):
+        return
+    for file_name in sorted(os.listdir(directory)):
+        if file_name.endswith(".json"):
+            with open(os.path.join(directory, file_name), 'r', encoding='utf-8') as f:
+                yield file_name[:-len(".json")], json.load(f)
+
+
+def migrate(db_file=DB_FILE):
+    backend = SqliteBackend(db_file)
+    schedules = 0
+    stats = 0
+    records = 0
+
+    for name, schedule in iter_json_files(SCHEDULES_DIR):
+        chat_id, schedule_type = name.split("_", 1)
+        backend.write(schedule_key(chat_id, schedule_type), Schedule.from_legacy(schedule))
+        schedules += 1
+
+    for chat_id, chat_stats in iter_json_files(STATS_DIR):
+        backend.write(stats_key(chat_id), chat_stats)
+        stats += 1
+
+    # Мітки переносу, історія годин, зведена статистика, file_id, кеш чат-бота...
+    for kind in DATA_KINDS:
+        for chat_id, data in iter_json_files(kind):
+            backend.write(data_key(kind, chat_id), data)
+            records += 1
+
+    backend.close()
+    print(f"Migrated {schedules} schedules, {stats} statistics files and {records} other records into {db_file}")
+
+
+if __name__ == "__main__":
+    migrate(sys.argv[1] if len(sys.argv) > 1 else DB_FILE)
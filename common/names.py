@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import re
+import time
+from collections import OrderedDict
+
+import emoji
+
+# Скільки секунд вважаємо ім'я користувача актуальним
+NAME_TTL = 15 * 60
+# Максимальна кількість користувачів у кеші
+NAME_CACHE_SIZE = 5000
+# Скільки одночасних запитів get_chat дозволено при рендері графіка
+MAX_CONCURRENT_LOOKUPS = 8
+
+
+def remove_emoji(text):
+    return emoji.replace_emoji(text, replace='')
+
+
+def format_name(name):
+    first_emoji = ''
+    for c in name:
+        if emoji.is_emoji(c):
+            first_emoji = c
+            break
+
+    clean_name = remove_emoji(name).strip()
+
+    if '(' in clean_name:
+        match = re.search(r'[^()]*\)', clean_name)
+        if match:
+            clean_name = clean_name[:match.end()].strip()
+    else:
+        match = re.search(r'([^ ]+)', clean_name)
+        if match:
+            clean_name = match.group(1).strip()
+
+    return f"{first_emoji}{clean_name}".strip() if first_emoji else clean_name.strip()
+
+
+class CachedUser:
+    """What we keep from a get_chat() result; quacks like telegram User for get_user_name."""
+
+    __slots__ = ("id", "first_name", "username", "display_name")
+
+    def __init__(self, user_id, first_name, username):
+        self.id = user_id
+        self.first_name = first_name
+        self.username = username
+        self.display_name = format_name(first_name) if first_name else "–"
+
+
+class NameCache:
+    """LRU cache of resolved users with a per-entry time to live."""
+
+    def __init__(self, ttl=NAME_TTL, max_size=NAME_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        user_id = str(user_id)
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            self._entries.pop(user_id, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, user_id, user):
+        user_id = str(user_id)
+        self._entries[user_id] = (time.monotonic() + self.ttl, user)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id=None):
+        if user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(str(user_id), None)
+
+
+name_cache = NameCache()
+
+
+async def resolve_users(bot, user_ids, limit=MAX_CONCURRENT_LOOKUPS):
+    """Returns {str(user_id): CachedUser or None} fetching cache misses concurrently.
+
+    Duplicate ids are looked up once; users that get_chat cannot resolve map to None.
+    """
+    result = {}
+    misses = []
+    for user_id in dict.fromkeys(str(user_id) for user_id in user_ids):
+        user = name_cache.get(user_id)
+        if user is None:
+            misses.append(user_id)
+        result[user_id] = user
+
+    if not misses:
+        return result
+
+    semaphore = asyncio.Semaphore(limit)
+
+    async def fetch(user_id):
+        async with semaphore:
+            try:
+                chat = await bot.get_chat(user_id)
+            except Exception as e:
+                logging.warning(f"Failed to get chat for user_id {user_id}: {e}")
+                return user_id, None
+        user = CachedUser(chat.id, chat.first_name, chat.username)
+        name_cache.set(user_id, user)
+        return user_id, user
+
+    for user_id, user in await asyncio.gather(*(fetch(user_id) for user_id in misses)):
+        result[user_id] = user
+    return result
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import itertools
+import logging
+import time
+from datetime import timedelta
+
+# Загальний ліміт Telegram на вихідні повідомлення бота
+GLOBAL_RATE = 30  # повідомлень на секунду
+GLOBAL_BURST = 30
+# Ліміт на одну групу: ~20 повідомлень на хвилину
+GROUP_RATE = 20 / 60
+GROUP_BURST = 5
+# Ліміт на особистий чат: ~1 повідомлення на секунду
+PRIVATE_RATE = 1
+PRIVATE_BURST = 3
+# Скільки разів повторюємо запит після RetryAfter
+MAX_RETRIES = 2
+# Як часто пишемо метрики черги в лог, якщо був трафік (секунди)
+METRICS_LOG_INTERVAL = 300
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+# Bot API methods that post into a chat and count against its limits
+SEND_METHODS = {
+    "sendMessage", "sendPhoto", "sendMediaGroup", "sendDocument", "sendAnimation", "sendSticker",
+    "sendVideo", "sendVoice", "sendAudio", "copyMessage", "forwardMessage",
+    "editMessageText", "editMessageCaption", "editMessageMedia",
+}
+# Calls nobody is waiting for interactively, e.g. name lookups for the schedule
+BACKGROUND_METHODS = {"getChat", "getChatMember", "getUserProfilePhotos"}
+
+
+def method_priority(method):
+    return PRIORITY_BACKGROUND if method in BACKGROUND_METHODS else PRIORITY_INTERACTIVE
+
+
+def retry_after_seconds(error):
+    """RetryAfter delay of a PTB or aiogram flood error, None for any other error."""
+    retry_after = getattr(error, "_retry_after", None) or getattr(error, "retry_after", None)
+    if retry_after is None or isinstance(retry_after, bool):
+        return None
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    if isinstance(retry_after, (int, float)):
+        return float(retry_after)
+    return None
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity, now=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class Waiter:
+    __slots__ = ("priority", "seq", "chat_id", "future", "queued_at")
+
+    def __init__(self, priority, seq, chat_id, future):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.future = future
+        self.queued_at = time.monotonic()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OutboundDispatcher:
+    """Shapes outgoing Bot API calls with a global and per-chat token buckets.
+
+    ``run(call, chat_id, priority)`` waits for a send slot, calls ``call()``
+    and, on a RetryAfter error, pauses the chat (or everything) for the
+    requested time and queues the call again. Interactive calls are always
+    granted before background ones.
+    """
+
+    def __init__(self, global_rate=GLOBAL_RATE, global_burst=GLOBAL_BURST, max_retries=MAX_RETRIES):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.max_retries = max_retries
+        self._chat_buckets = {}
+        self._paused_until = {}  # chat_id (None - усі чати) -> monotonic time
+        self._queue = []
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._task = None
+        self._metrics_logged = time.monotonic()
+        self.granted = {PRIORITY_INTERACTIVE: 0, PRIORITY_BACKGROUND: 0}
+        self.wait_total = {PRIORITY_INTERACTIVE: 0.0, PRIORITY_BACKGROUND: 0.0}
+        self.wait_max = 0.0
+        self.retries = 0
+
+    def _chat_bucket(self, chat_id, now):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10000:
+                # Повні відра нічим не відрізняються від нових
+                for idle in [key for key, value in self._chat_buckets.items() if value.is_full(now)]:
+                    del self._chat_buckets[idle]
+            if str(chat_id).startswith('-'):
+                bucket = TokenBucket(GROUP_RATE, GROUP_BURST, now)
+            else:
+                bucket = TokenBucket(PRIVATE_RATE, PRIVATE_BURST, now)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._dispatch())
+
+    async def acquire(self, chat_id=None, priority=PRIORITY_INTERACTIVE):
+        """Waits until a message to chat_id (None - no per-chat limit) may be sent."""
+        self._ensure_started()
+        waiter = Waiter(priority, next(self._seq), chat_id, asyncio.get_running_loop().create_future())
+        self._queue.append(waiter)
+        self._wakeup.set()
+        await waiter.future
+
+    async def run(self, call, chat_id=None, priority=PRIORITY_INTERACTIVE):
+        attempt = 0
+        while True:
+            await self.acquire(chat_id, priority)
+            try:
+                return await call()
+            except Exception as e:
+                delay = retry_after_seconds(e)
+                if delay is None or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.retries += 1
+                self.pause(chat_id, delay)
+                logging.warning(f"Flood control for chat {chat_id}, retrying in {delay:.0f}s")
+
+    def pause(self, chat_id, seconds):
+        until = time.monotonic() + seconds
+        self._paused_until[chat_id] = max(until, self._paused_until.get(chat_id, 0))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _chat_wait(self, waiter, now):
+        wait = self._paused_until.get(waiter.chat_id, 0) - now
+        if waiter.chat_id is not None:
+            wait = max(wait, self._chat_bucket(waiter.chat_id, now).wait_time(now))
+        return wait
+
+    async def _dispatch(self):
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            wait = max(self._paused_until.get(None, 0) - now, self.global_bucket.wait_time(now))
+            picked = None
+            if wait <= 0:
+                wait = None
+                # Highest priority first; a chat that is out of tokens does not hold up the others
+                for waiter in sorted(self._queue):
+                    if waiter.future.cancelled():
+                        picked = waiter
+                        break
+                    chat_wait = self._chat_wait(waiter, now)
+                    if chat_wait <= 0:
+                        picked = waiter
+                        break
+                    wait = chat_wait if wait is None else min(wait, chat_wait)
+
+            if picked is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._queue.remove(picked)
+            if picked.future.cancelled():
+                continue
+            self.global_bucket.consume(now)
+            if picked.chat_id is not None:
+                self._chat_bucket(picked.chat_id, now).consume(now)
+            waited = now - picked.queued_at
+            self.granted[picked.priority] += 1
+            self.wait_total[picked.priority] += waited
+            self.wait_max = max(self.wait_max, waited)
+            picked.future.set_result(None)
+
+            if now - self._metrics_logged > METRICS_LOG_INTERVAL:
+                self._metrics_logged = now
+                logging.info(self.summary())
+
+    def metrics(self):
+        return {
+            "queue_depth": len(self._queue),
+            "granted": dict(self.granted),
+            "avg_wait": {priority: self.wait_total[priority] / count if count else 0.0
+                         for priority, count in self.granted.items()},
+            "max_wait": self.wait_max,
+            "retries": self.retries,
+        }
+
+    def summary(self):
+        metrics = self.metrics()
+        return (f"Outbound queue: depth {metrics['queue_depth']}, "
+                f"sent {metrics['granted'][PRIORITY_INTERACTIVE]} interactive / "
+                f"{metrics['granted'][PRIORITY_BACKGROUND]} background, "
+                f"avg wait {metrics['avg_wait'][PRIORITY_INTERACTIVE]:.3f}s / "
+                f"{metrics['avg_wait'][PRIORITY_BACKGROUND]:.3f}s, "
+                f"max wait {metrics['max_wait']:.3f}s, retries {metrics['retries']}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+outbound = OutboundDispatcher()
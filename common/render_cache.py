@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import time
+from collections import OrderedDict
+
+from common.names import NAME_TTL
+
+# Скільки відрендерених графіків тримаємо в пам'яті
+RENDER_CACHE_SIZE = 1000
+
+
+def render_key(chat_id, schedule, date_label, names_version=0):
+    # A new revision is issued on every edit and on every reload after a rollover
+    return str(chat_id), schedule.revision, date_label, names_version
+
+
+class RenderCache:
+    """Rendered schedule texts keyed by chat, schedule revision, date label and names version.
+
+    Entries never go stale through schedule changes because every change
+    issues a new revision; they only expire after ``ttl`` so that telegram
+    names changed outside the bot show up eventually.
+    """
+
+    def __init__(self, ttl=NAME_TTL, max_size=RENDER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, text):
+        self._entries[key] = (time.monotonic() + self.ttl, text)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, chat_id=None):
+        if chat_id is None:
+            self._entries.clear()
+            return
+        for key in [key for key in self._entries if key[0] == str(chat_id)]:
+            del self._entries[key]
+
+
+render_cache = RenderCache()
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta
+
+from common.storage import store, data_key
+
+# Скільки чатів переносимо одночасно
+ROLLOVER_WORKERS = 8
+# "thread" - потоки в процесі бота, "process" - окремі процеси
+ROLLOVER_EXECUTOR = "thread"
+
+# Пауза між чатами у фоновому обході, щоб не заважати обробникам (секунди)
+SWEEP_PAUSE = 0.05
+
+# Метрики останнього нічного переносу
+last_report = None
+
+# Per-chat locks are shared by every LazyRollover so a chat is never rolled twice at once
+_chat_locks = {}
+_chat_locks_guard = threading.Lock()
+# Chats being rolled over on the current thread
+_local = threading.local()
+
+
+def _chat_lock(chat_id):
+    with _chat_locks_guard:
+        return _chat_locks.setdefault(chat_id, threading.RLock())
+
+
+@contextmanager
+def rolling_over(chat_id):
+    """Holds the chat's lock while it is rolled over on this thread.
+
+    rollover_chat loads the chat's schedules itself, so ``LazyRollover.ensure``
+    skips a chat that is being rolled over instead of replaying missed days into it.
+    """
+    chat_id = str(chat_id)
+    rolling = getattr(_local, "rolling", None)
+    if rolling is None:
+        rolling = _local.rolling = set()
+    with _chat_lock(chat_id):
+        if chat_id in rolling:
+            yield
+            return
+        rolling.add(chat_id)
+        try:
+            yield
+        finally:
+            rolling.discard(chat_id)
+
+
+def _is_rolling(chat_id):
+    return chat_id in getattr(_local, "rolling", ())
+
+
+class RolloverReport:
+    def __init__(self, timings, failed, duration):
+        self.timings = timings
+        self.failed = failed
+        self.duration = duration
+
+    @property
+    def chats(self):
+        return len(self.timings) + len(self.failed)
+
+    def slowest(self, count=3):
+        return sorted(self.timings.items(), key=lambda x: x[1], reverse=True)[:count]
+
+    def summary(self):
+        text = f"Rollover finished: {self.chats} chats in {self.duration:.2f}s"
+        if self.timings:
+            average = sum(self.timings.values()) / len(self.timings)
+            slowest = ', '.join(f"{chat_id} ({seconds:.3f}s)" for chat_id, seconds in self.slowest())
+            text += f", avg {average:.3f}s per chat, slowest: {slowest}"
+        if self.failed:
+            text += f", failed: {', '.join(self.failed)}"
+        return text
+
+
+def _timed(rollover_chat, chat_id, *args):
+    started = time.perf_counter()
+    try:
+        # The forced rollover is the day's rollover, the lazy one must not run inside it too
+        with rolling_over(chat_id):
+            rollover_chat(chat_id, *args)
+    except Exception as e:
+        logging.error(f"Rollover failed for chat {chat_id}: {e}")
+        return chat_id, None
+    return chat_id, time.perf_counter() - started
+
+
+def _init_process_worker():
+    # Locks held by other threads of the bot at the fork would stay locked here forever
+    global _chat_locks, _chat_locks_guard, _local
+    _chat_locks = {}
+    _chat_locks_guard = threading.Lock()
+    _local = threading.local()
+    store.detach()
+
+
+def _timed_in_process(rollover_chat, chat_id, *args):
+    # The worker changes its own copy of the store, the parent applies what it wrote
+    return _timed(rollover_chat, chat_id, *args) + (store.take_changes(),)
+
+
+def run_rollover(rollover_chat, chat_ids, *args, workers=ROLLOVER_WORKERS, executor=ROLLOVER_EXECUTOR):
+    """Runs rollover_chat(chat_id, *args) for every chat on a worker pool and returns a RolloverReport."""
+    global last_report
+    started = time.perf_counter()
+    timings = {}
+    failed = []
+
+    if executor == "process":
+        # Forked workers start from the bot's memory and write nothing themselves. Their changes
+        # go through the parent's store, so leaderboards, aggregates and history stay in sync
+        context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_process_worker) as pool:
+            futures = [pool.submit(_timed_in_process, rollover_chat, chat_id, *args) for chat_id in chat_ids]
+            results = []
+            for future in futures:
+                chat_id, seconds, changes = future.result()
+                for key, data in changes:
+                    store.put(key, data)
+                results.append((chat_id, seconds))
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rollover") as pool:
+            futures = [pool.submit(_timed, rollover_chat, chat_id, *args) for chat_id in chat_ids]
+            results = [future.result() for future in futures]
+
+    for chat_id, seconds in results:
+        if seconds is None:
+            failed.append(chat_id)
+        else:
+            timings[chat_id] = seconds
+
+    last_report = RolloverReport(timings, failed, time.perf_counter() - started)
+    logging.info(last_report.summary())
+    return last_report
+
+
+def meta_key(chat_id):
+    return data_key("meta", chat_id)
+
+
+def mark_rolled_through(chat_id, day):
+    """Records that the chat was rolled over into ``day``; every way of rolling a chat over calls it."""
+    meta = store.get(meta_key(chat_id)) or {}
+    meta["rolled_through"] = day.isoformat()
+    store.put(meta_key(chat_id), meta)
+
+
+class LazyRollover:
+    """Rolls a chat over the first time it is touched after a day boundary.
+
+    Every chat remembers the date it was rolled over through. ``ensure`` is
+    called on each access and replays every missed day through
+    ``rollover_chat(chat_id, day_start)``, so a bot that was down at midnight
+    catches up on its own. ``sweep`` does the same for idle chats in the
+    background. ``rollover_chat`` records each day with ``mark_rolled_through``,
+    and ``run_rollover`` holds every chat with ``rolling_over``, so a forced
+    rollover is neither preceded by a catch-up nor replayed here.
+    """
+
+    def __init__(self, rollover_chat, tz, before_rollover=None):
+        self.rollover_chat = rollover_chat
+        self.tz = tz
+        self.before_rollover = before_rollover
+        self._checked = {}
+
+    def is_current(self, chat_id):
+        """True when the chat was already checked today, so ``ensure`` returns at once."""
+        return self._checked.get(str(chat_id)) == datetime.now(self.tz).date()
+
+    def ensure(self, chat_id):
+        """Blocking: may replay missed days or wait for the sweep, run it off the event loop."""
+        chat_id = str(chat_id)
+        today = datetime.now(self.tz).date()
+        if self._checked.get(chat_id) == today:
+            return
+        # rollover_chat itself loads schedules of the chat, don't recurse into it
+        if _is_rolling(chat_id):
+            return
+
+        with _chat_lock(chat_id):
+            if self._checked.get(chat_id) == today:
+                return
+            meta = store.get(meta_key(chat_id))
+            if meta is None:
+                # Chat we have not tracked yet: it is up to date as of today
+                mark_rolled_through(chat_id, today)
+                self._checked[chat_id] = today
+                return
+
+            rolled_through = date.fromisoformat(meta["rolled_through"])
+            if rolled_through < today:
+                with rolling_over(chat_id):
+                    if self.before_rollover:
+                        self.before_rollover(chat_id)
+                    day = rolled_through
+                    while day < today:
+                        day += timedelta(days=1)
+                        self.rollover_chat(chat_id, self.tz.localize(datetime.combine(day, datetime.min.time())))
+                logging.info(f"Chat {chat_id} rolled over from {rolled_through} to {today}")
+            self._checked[chat_id] = today
+
+    def sweep(self):
+        """Background pass over idle chats that nobody opened since midnight."""
+        today = datetime.now(self.tz).date()
+        rolled = 0
+        for chat_id in store.backend.list_chats():
+            if self._checked.get(chat_id) == today:
+                continue
+            try:
+                self.ensure(chat_id)
+            except Exception as e:
+                logging.error(f"Rollover failed for chat {chat_id}: {e}")
+            rolled += 1
+            time.sleep(SWEEP_PAUSE)
+        if rolled:
+            logging.info(f"Rollover sweep checked {rolled} chats")
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+import re
+from functools import lru_cache
+
+from common.schedule_mask import hour_bit, range_mask, mask_slots, mask_ranges, range_label
+
+# +9-12, -14, +20!, +9:00-12:00
+OP_RE = re.compile(r'^([+-])\s*(\d{1,2})(?::\d{2})?\s*(?:-\s*(\d{1,2})(?::\d{2})?\s*)?(!?)$')
+# Скільки різних текстів правок тримаємо скомпільованими
+COMPILED_CACHE_SIZE = 1024
+
+
+class EditOp:
+    """One compiled operation of an edit message: add or remove a user in the hours of ``mask``."""
+
+    __slots__ = ("text", "sign", "mask", "force")
+
+    def __init__(self, text, sign, mask, force):
+        self.text = text
+        self.sign = sign
+        self.mask = mask
+        # "+9!" creates missing hours, "-9!" deletes the hours themselves (admins only)
+        self.force = force
+
+    @property
+    def is_add(self):
+        return self.sign == '+'
+
+
+class CompiledEdit:
+    __slots__ = ("ops", "invalid")
+
+    def __init__(self, ops, invalid):
+        self.ops = ops
+        self.invalid = invalid
+
+
+class MissingSlotsError(Exception):
+    """An add operation refers to hours the schedule does not have; nothing was changed."""
+
+    def __init__(self, op, missing):
+        super().__init__(op.text)
+        self.op = op
+        self.missing = missing
+
+
+@lru_cache(maxsize=COMPILED_CACHE_SIZE)
+def compile_op(text):
+    match = OP_RE.match(text)
+    if not match:
+        raise ValueError(text)
+    sign, start, end, force = match.groups()
+    start_hour = int(start)
+    if end is None:
+        if start_hour > 24:
+            raise ValueError(text)
+        mask = hour_bit(start_hour)
+    else:
+        end_hour = int(end)
+        if end_hour > 24 or start_hour >= end_hour:
+            raise ValueError(text)
+        mask = range_mask(start_hour, end_hour)
+    return EditOp(text, sign, mask, bool(force))
+
+
+@lru_cache(maxsize=COMPILED_CACHE_SIZE)
+def compile_edit(message):
+    """Parses '+9-12, -14, +20!' once; parts that are not +/- operations are ignored."""
+    ops = []
+    invalid = []
+    for part in message.split(','):
+        part = part.strip()
+        if not part.startswith(('+', '-')):
+            continue
+        try:
+            ops.append(compile_op(part))
+        except ValueError:
+            invalid.append(part)
+    return CompiledEdit(tuple(ops), tuple(invalid))
+
+
+class OpDiff:
+    __slots__ = ("op", "changed", "slots_added", "slots_removed")
+
+    def __init__(self, op, changed=0, slots_added=0, slots_removed=None):
+        self.op = op
+        self.changed = changed  # години, в яких користувача додано або видалено
+        self.slots_added = slots_added
+        self.slots_removed = slots_removed or {}
+
+    def journal_ops(self):
+        ops = []
+        if self.slots_added:
+            ops.append({"op": "add_slot", "slots": {time_slot: [] for time_slot in mask_slots(self.slots_added)}})
+        if self.slots_removed:
+            ops.append({"op": "remove_slot", "slots": self.slots_removed})
+        if self.changed:
+            ops.append({"op": "add" if self.op.is_add else "remove", "slots": mask_slots(self.changed)})
+        return ops
+
+
+class EditDiff:
+    """What an applied edit changed, per operation."""
+
+    def __init__(self, ops):
+        self.ops = ops
+
+    def journal_ops(self):
+        return [entry for op_diff in self.ops for entry in op_diff.journal_ops()]
+
+    def describe(self, user_name):
+        parts = []
+        for op_diff in self.ops:
+            if op_diff.changed:
+                ranges = ', '.join(range_label(start, end) for start, end in mask_ranges(op_diff.changed))
+                parts.append(f"{'додано до' if op_diff.op.is_add else 'видалено з'} графіка на {ranges}")
+        if parts:
+            return f"{user_name} було {', '.join(parts)}."
+        last_add = not self.ops or self.ops[-1].op.is_add
+        return f"Не вдалося {'додати години' if last_add else 'видалити години'}."
+
+
+def apply_edit(schedule, user_id, compiled, allow_force_remove=False):
+    """Validates every operation against the schedule's hours, then applies all of them.
+
+    Raises MissingSlotsError before touching the schedule if an operation
+    adds the user to an hour the schedule does not have.
+    """
+    enabled = schedule.enabled
+    for op in compiled.ops:
+        if op.is_add:
+            if op.force:
+                enabled |= op.mask
+            elif op.mask & ~enabled:
+                raise MissingSlotsError(op, op.mask & ~enabled)
+        elif op.force and allow_force_remove:
+            enabled &= ~op.mask
+
+    diffs = []
+    for op in compiled.ops:
+        op_diff = OpDiff(op)
+        if op.is_add:
+            if op.force:
+                op_diff.slots_added = schedule.enable(op.mask)
+            op_diff.changed = schedule.add(user_id, op.mask)
+        else:
+            if op.force and allow_force_remove:
+                dropped_slots = mask_slots(op.mask & schedule.enabled)
+                op_diff.slots_removed = {time_slot: users for time_slot, users in schedule.items()
+                                         if time_slot in dropped_slots}
+                schedule.disable(op.mask)
+            op_diff.changed = schedule.remove(user_id, op.mask)
+        diffs.append(op_diff)
+    return EditDiff(diffs)
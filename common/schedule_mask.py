@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+import itertools
+import logging
+import re
+from functools import lru_cache
+
+HOURS = 24
+ALL_HOURS = (1 << HOURS) - 1
+# Порядок годин у графіку: 00:00 - 01:00 завжди в кінці, як у старих JSON-файлах
+HOUR_ORDER = list(range(1, HOURS)) + [0]
+
+SLOT_RE = re.compile(r'^(\d{2}):00 - (\d{2}):00$')
+SLOT_NAMES = [f"{hour:02d}:00 - {(hour + 1) % HOURS:02d}:00" for hour in range(HOURS)]
+
+# Revisions are unique within the process, so a copy or a reloaded schedule never reuses one
+_revisions = itertools.count(1)
+
+
+def slot_name(hour):
+    return SLOT_NAMES[hour % HOURS]
+
+
+def parse_slot(time_slot):
+    """'15:00 - 16:00' -> 15, None for anything that is not a whole hour slot."""
+    match = SLOT_RE.match(time_slot)
+    if not match:
+        return None
+    hour = int(match.group(1))
+    if hour >= HOURS or int(match.group(2)) != (hour + 1) % HOURS:
+        return None
+    return hour
+
+
+def hour_bit(hour):
+    return 1 << (hour % HOURS)
+
+
+def range_mask(start_hour, end_hour):
+    """Bits of hours start_hour .. end_hour - 1 (hour 24 is 00:00)."""
+    if end_hour <= HOURS:
+        return ((1 << end_hour) - 1) ^ ((1 << start_hour) - 1)
+    mask = 0
+    for hour in range(start_hour, end_hour):
+        mask |= hour_bit(hour)
+    return mask
+
+
+def slots_mask(time_slots):
+    mask = 0
+    for time_slot in time_slots:
+        hour = parse_slot(time_slot)
+        if hour is not None:
+            mask |= hour_bit(hour)
+    return mask
+
+
+def mask_slots(mask):
+    """Slot names of the set bits in display order."""
+    return [SLOT_NAMES[hour] for hour in HOUR_ORDER if mask >> hour & 1]
+
+
+def normalize_user_id(user_id):
+    # JSON keeps telegram ids as numbers, SQLite may hand them back as text
+    if isinstance(user_id, str) and user_id.lstrip('-').isdigit():
+        return int(user_id)
+    return user_id
+
+
+class Schedule:
+    """One chat schedule as bit masks: which hours exist and which hours each user works.
+
+    Bit ``h`` stands for the slot ``h:00 - h+1:00``. Users keep the order in
+    which they first joined the schedule. The legacy ``{slot: [user_ids]}``
+    layout is only produced by ``to_legacy`` when the schedule is written out.
+    ``revision`` changes with every modification.
+    """
+
+    __slots__ = ("enabled", "users", "revision")
+
+    def __init__(self, enabled=0, users=None):
+        self.enabled = enabled
+        self.users = users if users is not None else {}
+        self.revision = next(_revisions)
+
+    def _touch(self):
+        self.revision = next(_revisions)
+
+    @classmethod
+    def from_legacy(cls, data):
+        schedule = cls()
+        for time_slot, user_ids in data.items():
+            hour = parse_slot(time_slot)
+            if hour is None:
+                logging.warning(f"Skipping unknown schedule slot {time_slot!r}")
+                continue
+            schedule.enabled |= hour_bit(hour)
+            for user_id in user_ids:
+                user_id = normalize_user_id(user_id)
+                schedule.users[user_id] = schedule.users.get(user_id, 0) | hour_bit(hour)
+        return schedule
+
+    def to_legacy(self):
+        return dict(self.items())
+
+    def copy(self):
+        return Schedule(self.enabled, dict(self.users))
+
+    def __eq__(self, other):
+        return isinstance(other, Schedule) and self.to_legacy() == other.to_legacy()
+
+    def items(self):
+        """(slot name, [user_ids]) for every enabled hour in display order."""
+        for hour in HOUR_ORDER:
+            if self.enabled >> hour & 1:
+                yield SLOT_NAMES[hour], self.slot_users(hour)
+
+    def slot_users(self, hour):
+        bit = hour_bit(hour)
+        return [user_id for user_id, mask in self.users.items() if mask & bit]
+
+    def user_ids(self):
+        """Users that work at least one enabled hour."""
+        return [user_id for user_id, mask in self.users.items() if mask & self.enabled]
+
+    def user_mask(self, user_id):
+        return self.users.get(normalize_user_id(user_id), 0) & self.enabled
+
+    def hours(self):
+        """{user_id: worked hours}, one popcount per user."""
+        result = {}
+        for user_id, mask in self.users.items():
+            count = bin(mask & self.enabled).count("1")
+            if count:
+                result[user_id] = count
+        return result
+
+    def enable(self, mask):
+        """Adds empty hours, returns the bits that were new."""
+        added = mask & ~self.enabled & ALL_HOURS
+        if added:
+            self.enabled |= added
+            self._touch()
+        return added
+
+    def disable(self, mask):
+        """Removes hours together with their users, returns {user_id: removed bits}."""
+        mask &= self.enabled
+        removed = {}
+        for user_id, user_mask in list(self.users.items()):
+            if user_mask & mask:
+                removed[user_id] = user_mask & mask
+                self._set_user(user_id, user_mask & ~mask)
+        if mask:
+            self.enabled &= ~mask
+            self._touch()
+        return removed
+
+    def add(self, user_id, mask):
+        """Puts the user into the enabled hours of mask, returns the bits that were new."""
+        user_id = normalize_user_id(user_id)
+        current = self.users.get(user_id, 0)
+        added = mask & self.enabled & ~current
+        if added:
+            self.users[user_id] = current | added
+            self._touch()
+        return added
+
+    def remove(self, user_id, mask):
+        """Takes the user out of the hours of mask, returns the bits that were removed."""
+        user_id = normalize_user_id(user_id)
+        current = self.users.get(user_id, 0)
+        removed = mask & current & self.enabled
+        if removed:
+            self._set_user(user_id, current & ~removed)
+            self._touch()
+        return removed
+
+    def remove_user(self, user_id):
+        return self.remove(user_id, ALL_HOURS)
+
+    def _set_user(self, user_id, mask):
+        if mask:
+            self.users[user_id] = mask
+        else:
+            del self.users[user_id]
+
+
+@lru_cache(maxsize=4096)
+def mask_ranges(mask):
+    """Contiguous runs of set bits as (start_hour, end_hour) in display order, 23-24 joins 00-01."""
+    ranges = []
+    for hour in HOUR_ORDER:
+        if not mask >> hour & 1:
+            continue
+        if ranges and ranges[-1][1] % HOURS == hour:
+            ranges[-1][1] += 1
+        else:
+            ranges.append([hour, hour + 1])
+    return tuple((start, end) for start, end in ranges)
+
+
+def range_label(start_hour, end_hour):
+    return f"{start_hour % HOURS:02d}:00 - {end_hour % HOURS:02d}:00"
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import sqlite3
+import threading
+
+from common.schedule_mask import Schedule
+
+# Поля статистики, що зберігаються в окремих колонках/таблицях
+STATS_COLUMNS = ("total", "yesterday", "name")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS schedule_slots (
+    chat_id TEXT NOT NULL,
+    schedule_type TEXT NOT NULL,
+    time_slot TEXT NOT NULL,
+    PRIMARY KEY (chat_id, schedule_type, time_slot)
+);
+CREATE TABLE IF NOT EXISTS schedule_users (
+    chat_id TEXT NOT NULL,
+    schedule_type TEXT NOT NULL,
+    time_slot TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    user_id NOT NULL,
+    PRIMARY KEY (chat_id, schedule_type, time_slot, user_id)
+);
+CREATE INDEX IF NOT EXISTS idx_schedule_users_user ON schedule_users (chat_id, user_id);
+
+CREATE TABLE IF NOT EXISTS users (
+    chat_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    total INTEGER,
+    yesterday INTEGER,
+    name TEXT,
+    data TEXT NOT NULL DEFAULT '{}',
+    PRIMARY KEY (chat_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS idx_users_total ON users (chat_id, total);
+CREATE INDEX IF NOT EXISTS idx_users_name ON users (chat_id, name);
+
+CREATE TABLE IF NOT EXISTS balances (
+    chat_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    currency INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (chat_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS idx_balances_currency ON balances (chat_id, currency);
+
+CREATE TABLE IF NOT EXISTS chat_data (
+    kind TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (kind, chat_id)
+);
+
+CREATE TABLE IF NOT EXISTS daily_hours (
+    chat_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    weekday TEXT NOT NULL,
+    hours INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (chat_id, user_id, weekday)
+);
+"""
+
+
+class SqliteBackend:
+    """Keeps schedules and statistics in one SQLite database (WAL mode).
+
+    Drop-in replacement for ``storage.JsonBackend``: the store still reads and
+    writes whole schedules/statistics dicts, but single users can be written
+    with ``write_rows`` and the nightly rollover runs as a few SQL statements.
+    """
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def read(self, key):
+        kind, chat_id, name = key
+        with self._lock:
+            if kind == "schedule":
+                return self._read_schedule(chat_id, name)
+            if kind == "stats":
+                return self._read_stats(chat_id)
+            row = self.conn.execute(
+                "SELECT data FROM chat_data WHERE kind = ? AND chat_id = ?", (kind, chat_id)).fetchone()
+            return json.loads(row[0]) if row else None
+
+    def list_chats(self):
+        with self._lock:
+            return [chat_id for chat_id, in self.conn.execute(
+                "SELECT DISTINCT chat_id FROM schedule_slots WHERE schedule_type = 'today'")]
+
+    def write(self, key, data):
+        kind, chat_id, name = key
+        with self._lock, self.conn:
+            if kind == "schedule":
+                self._write_schedule(chat_id, name, data)
+            elif kind != "stats":
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO chat_data (kind, chat_id, data) VALUES (?, ?, ?)",
+                    (kind, chat_id, json.dumps(data, ensure_ascii=False)))
+            else:
+                self.conn.execute(
+                    f"DELETE FROM users WHERE chat_id = ? AND user_id NOT IN ({','.join('?' * len(data))})",
+                    (chat_id, *data.keys()))
+                for table in ("balances", "daily_hours"):
+                    self.conn.execute(
+                        f"DELETE FROM {table} WHERE chat_id = ? AND user_id NOT IN (SELECT user_id FROM users WHERE chat_id = ?)",
+                        (chat_id, chat_id))
+                self._write_users(chat_id, data, data.keys())
+
+    def write_rows(self, key, data, rows):
+        # Only the listed users changed, so update just their rows
+        kind, chat_id, name = key
+        with self._lock, self.conn:
+            for user_id in rows:
+                if user_id not in data:
+                    for table in ("users", "balances", "daily_hours"):
+                        self.conn.execute(f"DELETE FROM {table} WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
+            self._write_users(chat_id, data, [user_id for user_id in rows if user_id in data])
+
+    def _read_schedule(self, chat_id, schedule_type):
+        slots = self.conn.execute(
+            "SELECT time_slot FROM schedule_slots WHERE chat_id = ? AND schedule_type = ?",
+            (chat_id, schedule_type)).fetchall()
+        if not slots:
+            return None
+        schedule = {time_slot: [] for time_slot, in slots}
+        for time_slot, user_id in self.conn.execute(
+                "SELECT time_slot, user_id FROM schedule_users WHERE chat_id = ? AND schedule_type = ? "
+                "ORDER BY time_slot, position", (chat_id, schedule_type)):
+            schedule.setdefault(time_slot, []).append(user_id)
+        return Schedule.from_legacy(schedule)
+
+    def read_today_schedules(self, chat_id=None):
+        """{chat_id: today's Schedule} of every chat (or only chat_id) in two queries, e.g. before a rollover."""
+        schedules = {}
+        with self._lock:
+            for chat, time_slot in self.conn.execute(
+                    "SELECT chat_id, time_slot FROM schedule_slots WHERE schedule_type = 'today' "
+                    "AND (? IS NULL OR chat_id = ?)", (chat_id, chat_id)):
+                schedules.setdefault(chat, {})[time_slot] = []
+            for chat, time_slot, user_id in self.conn.execute(
+                    "SELECT chat_id, time_slot, user_id FROM schedule_users WHERE schedule_type = 'today' "
+                    "AND (? IS NULL OR chat_id = ?) ORDER BY chat_id, time_slot, position", (chat_id, chat_id)):
+                schedules.setdefault(chat, {}).setdefault(time_slot, []).append(user_id)
+        return {chat: Schedule.from_legacy(schedule) for chat, schedule in schedules.items()}
+
+    def _write_schedule(self, chat_id, schedule_type, schedule):
+        schedule = schedule.to_legacy()
+        self.conn.execute("DELETE FROM schedule_slots WHERE chat_id = ? AND schedule_type = ?", (chat_id, schedule_type))
+        self.conn.execute("DELETE FROM schedule_users WHERE chat_id = ? AND schedule_type = ?", (chat_id, schedule_type))
+        self.conn.executemany(
+            "INSERT INTO schedule_slots (chat_id, schedule_type, time_slot) VALUES (?, ?, ?)",
+            [(chat_id, schedule_type, time_slot) for time_slot in schedule])
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO schedule_users (chat_id, schedule_type, time_slot, position, user_id) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(chat_id, schedule_type, time_slot, position, user_id)
+             for time_slot, users in schedule.items() for position, user_id in enumerate(users)])
+
+    def _read_stats(self, chat_id):
+        rows = self.conn.execute(
+            "SELECT user_id, total, yesterday, name, data FROM users WHERE chat_id = ?", (chat_id,)).fetchall()
+        if not rows:
+            return None
+        stats = {}
+        for user_id, total, yesterday, name, data in rows:
+            user_stats = {}
+            for field, value in zip(STATS_COLUMNS, (total, yesterday, name)):
+                if value is not None:
+                    user_stats[field] = value
+            user_stats.update(json.loads(data))
+            stats[user_id] = user_stats
+        for user_id, currency in self.conn.execute(
+                "SELECT user_id, currency FROM balances WHERE chat_id = ?", (chat_id,)):
+            if user_id in stats:
+                stats[user_id]["currency"] = currency
+        for user_id, weekday, hours in self.conn.execute(
+                "SELECT user_id, weekday, hours FROM daily_hours WHERE chat_id = ? ORDER BY rowid", (chat_id,)):
+            if user_id in stats:
+                stats[user_id].setdefault("daily", {})[weekday] = hours
+        return stats
+
+    def _write_users(self, chat_id, stats, user_ids):
+        users, balances, daily = [], [], []
+        for user_id in user_ids:
+            user_stats = stats[user_id]
+            extra = {field: value for field, value in user_stats.items()
+                     if field not in STATS_COLUMNS and field not in ("currency", "daily")}
+            users.append((chat_id, user_id, user_stats.get("total"), user_stats.get("yesterday"),
+                          user_stats.get("name"), json.dumps(extra, ensure_ascii=False)))
+            balances.append((chat_id, user_id, user_stats.get("currency", 0)))
+            daily.extend((chat_id, user_id, weekday, hours) for weekday, hours in user_stats.get("daily", {}).items())
+
+        self.conn.executemany(
+            "INSERT INTO users (chat_id, user_id, total, yesterday, name, data) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (chat_id, user_id) DO UPDATE SET total = excluded.total, yesterday = excluded.yesterday, "
+            "name = excluded.name, data = excluded.data", users)
+        self.conn.executemany(
+            "INSERT INTO balances (chat_id, user_id, currency) VALUES (?, ?, ?) "
+            "ON CONFLICT (chat_id, user_id) DO UPDATE SET currency = excluded.currency", balances)
+        self.conn.executemany(
+            "DELETE FROM daily_hours WHERE chat_id = ? AND user_id = ?", [(chat_id, user_id) for user_id in user_ids])
+        self.conn.executemany(
+            "INSERT INTO daily_hours (chat_id, user_id, weekday, hours) VALUES (?, ?, ?, ?)", daily)
+
+    def rollover(self, weekday, tomorrow_is_weekend, chat_id=None, fallbacks=None):
+        """Counts today's hours into statistics and shifts tomorrow -> today -> default.
+
+        Rolls every chat at once, or only ``chat_id`` when given. ``fallbacks``
+        maps a schedule type to the Schedule stored first for every chat that
+        has none of that type, as ``load_schedule`` does with the JSON backend.
+        """
+        default_type = "weekend_default" if tomorrow_is_weekend else "weekday_default"
+        with self._lock, self.conn:
+            self.conn.execute("DROP TABLE IF EXISTS temp.rollover_chats")
+            self.conn.execute(
+                "CREATE TEMP TABLE rollover_chats AS "
+                "SELECT DISTINCT chat_id FROM schedule_slots WHERE schedule_type = 'today' "
+                "AND (? IS NULL OR chat_id = ?)", (chat_id, chat_id))
+            chats = [row[0] for row in self.conn.execute("SELECT chat_id FROM rollover_chats")]
+
+            for schedule_type, schedule in (fallbacks or {}).items():
+                missing = [row[0] for row in self.conn.execute(
+                    "SELECT chat_id FROM rollover_chats WHERE chat_id NOT IN "
+                    "(SELECT chat_id FROM schedule_slots WHERE schedule_type = ?)", (schedule_type,))]
+                for missing_chat in missing:
+                    self._write_schedule(missing_chat, schedule_type, schedule)
+
+            self.conn.execute("UPDATE users SET yesterday = 0 WHERE chat_id IN (SELECT chat_id FROM rollover_chats)")
+            self.conn.execute(
+                "INSERT INTO users (chat_id, user_id, total, yesterday) "
+                "SELECT chat_id, CAST(user_id AS TEXT), COUNT(*), COUNT(*) FROM schedule_users "
+                "WHERE schedule_type = 'today' AND chat_id IN (SELECT chat_id FROM rollover_chats) "
+                "GROUP BY chat_id, CAST(user_id AS TEXT) "
+                "ON CONFLICT (chat_id, user_id) DO UPDATE SET "
+                "total = COALESCE(users.total, 0) + excluded.total, yesterday = excluded.yesterday")
+            self.conn.execute(
+                "INSERT INTO daily_hours (chat_id, user_id, weekday, hours) "
+                "SELECT chat_id, CAST(user_id AS TEXT), ?, COUNT(*) FROM schedule_users "
+                "WHERE schedule_type = 'today' AND chat_id IN (SELECT chat_id FROM rollover_chats) "
+                "GROUP BY chat_id, CAST(user_id AS TEXT) "
+                "ON CONFLICT (chat_id, user_id, weekday) DO UPDATE SET hours = hours + excluded.hours",
+                (str(weekday),))
+
+            # tomorrow -> today, default -> tomorrow
+            for table in ("schedule_slots", "schedule_users"):
+                self.conn.execute(
+                    f"DELETE FROM {table} WHERE schedule_type = 'today' "
+                    f"AND chat_id IN (SELECT chat_id FROM rollover_chats)")
+                self.conn.execute(
+                    f"UPDATE {table} SET schedule_type = 'today' WHERE schedule_type = 'tomorrow' "
+                    f"AND chat_id IN (SELECT chat_id FROM rollover_chats)")
+            self.conn.execute(
+                "INSERT INTO schedule_slots (chat_id, schedule_type, time_slot) "
+                "SELECT chat_id, 'tomorrow', time_slot FROM schedule_slots "
+                "WHERE schedule_type = ? AND chat_id IN (SELECT chat_id FROM rollover_chats)",
+                (default_type,))
+            self.conn.execute(
+                "INSERT INTO schedule_users (chat_id, schedule_type, time_slot, position, user_id) "
+                "SELECT chat_id, 'tomorrow', time_slot, position, user_id FROM schedule_users "
+                "WHERE schedule_type = ? AND chat_id IN (SELECT chat_id FROM rollover_chats)",
+                (default_type,))
+            self.conn.execute("DROP TABLE temp.rollover_chats")
+
+        logging.info(f"Rolled over schedules for {len(chats)} chats")
+        return chats
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import threading
+
+from common.schedule_mask import Schedule
+
+SCHEDULES_DIR = "schedules"
+STATS_DIR = "stats"
+DB_FILE = "bot.db"
+
+# Як часто фоновий потік скидає змінені дані на диск (секунди)
+FLUSH_INTERVAL = 5
+# Скільки змінених записів може накопичитись до примусового запису
+MAX_DIRTY = 50
+
+
+def schedule_key(chat_id, schedule_type):
+    return "schedule", str(chat_id), schedule_type
+
+
+def stats_key(chat_id):
+    return "stats", str(chat_id), None
+
+
+# Інші дані чатів (data_key): каталоги JSON-бекенду, які переносить migrate_to_sqlite
+DATA_KINDS = ("meta", "directory", "hours_history", "aggregates", "file_ids", "llm_cache")
+
+
+def data_key(kind, chat_id):
+    # Any other per-chat data; JSON backend keeps it in <kind>/<chat_id>.json
+    return kind, str(chat_id), None
+
+
+class JsonBackend:
+    """Stores every key as a separate JSON file, same layout as before the cache."""
+
+    def __init__(self, schedules_dir=SCHEDULES_DIR, stats_dir=STATS_DIR):
+        self.schedules_dir = schedules_dir
+        self.stats_dir = stats_dir
+        for directory in (schedules_dir, stats_dir):
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+
+    def path(self, key):
+        kind, chat_id, name = key
+        if kind == "schedule":
+            return os.path.join(self.schedules_dir, f"{chat_id}_{name}.json")
+        if kind == "stats":
+            return os.path.join(self.stats_dir, f"{chat_id}.json")
+        return os.path.join(kind, f"{chat_id}.json")
+
+    def read(self, key):
+        file_name = self.path(key)
+        if not os.path.exists(file_name):
+            return None
+        with open(file_name, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return Schedule.from_legacy(data) if key[0] == "schedule" else data
+
+    def list_chats(self):
+        return [file_name.split("_")[0] for file_name in os.listdir(self.schedules_dir)
+                if file_name.endswith("_today.json")]
+
+    def write(self, key, data):
+        if key[0] == "schedule":
+            data = data.to_legacy()
+        payload = json.dumps(data, ensure_ascii=False, indent=4)
+
+        # Write to a temporary file first so a crash never leaves a half-written JSON behind
+        file_name = self.path(key)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        tmp_name = file_name + ".tmp"
+        with open(tmp_name, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        os.replace(tmp_name, file_name)
+
+
+class ChangeCollector:
+    """Backend of a detached store: reads go to the real backend, writes are kept for the parent process."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.changes = []
+
+    def read(self, key):
+        return self.backend.read(key)
+
+    def list_chats(self):
+        return self.backend.list_chats()
+
+    def write(self, key, data):
+        self.changes.append((key, data))
+
+
+class Store:
+    """In-memory cache of schedules and statistics with write-behind flushing.
+
+    Reads are served from memory after the first load, writes only mark the
+    key dirty. Dirty keys are written by a background thread every
+    ``flush_interval`` seconds, or as soon as ``max_dirty`` keys pile up; the
+    writer itself never waits for the disk.
+    Writes that name the changed ``rows`` (user ids) are flushed row by row
+    when the backend supports it.
+    """
+
+    def __init__(self, backend=None, flush_interval=FLUSH_INTERVAL, max_dirty=MAX_DIRTY):
+        self.backend = backend or JsonBackend()
+        self.flush_interval = flush_interval
+        self.max_dirty = max_dirty
+        self.lock = threading.RLock()
+        self._cache = {}
+        self._dirty = set()
+        self._dirty_rows = {}
+        self._flushing = set()  # keys popped by a flush that are still being written
+        self._listeners = []
+        self._flush_hooks = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_listener(self, listener):
+        """listener(key, data, rows) is called after every put, e.g. to keep indexes in sync."""
+        self._listeners.append(listener)
+
+    def add_flush_hook(self, hook):
+        """hook() is called at the start of every flush, e.g. to put a record changed too often to put each time."""
+        self._flush_hooks.append(hook)
+
+    def get(self, key):
+        with self.lock:
+            if key not in self._cache:
+                self._cache[key] = self.backend.read(key)
+            return self._cache[key]
+
+    def put(self, key, data, rows=None):
+        with self.lock:
+            self._cache[key] = data
+            if rows is None:
+                self._dirty.add(key)
+                self._dirty_rows.pop(key, None)
+            elif key not in self._dirty:
+                self._dirty_rows.setdefault(key, set()).update(rows)
+            flush_now = len(self._dirty) + len(self._dirty_rows) >= self.max_dirty
+        for listener in self._listeners:
+            listener(key, data, rows)
+        if flush_now:
+            # Пише фоновий потік, а не обробник, що змінив дані
+            self._wake.set()
+
+    def is_dirty(self, key):
+        return key in self._dirty or key in self._dirty_rows or key in self._flushing
+
+    def invalidate(self, key=None):
+        with self.lock:
+            if key is None:
+                self._cache = {k: data for k, data in self._cache.items() if self.is_dirty(k)}
+            elif not self.is_dirty(key):
+                self._cache.pop(key, None)
+
+    def invalidate_chat(self, chat_id):
+        with self.lock:
+            for key in [key for key in self._cache if key[1] == str(chat_id) and not self.is_dirty(key)]:
+                del self._cache[key]
+
+    def flush(self):
+        for hook in self._flush_hooks:
+            hook()
+        with self.lock:
+            pending = [(key, self._cache[key], None) for key in self._dirty]
+            pending += [(key, self._cache[key], rows) for key, rows in self._dirty_rows.items()]
+            self._dirty.clear()
+            self._dirty_rows = {}
+            self._flushing.update(key for key, _, _ in pending)
+
+        for key, data, rows in pending:
+            try:
+                if rows is not None and hasattr(self.backend, "write_rows"):
+                    self.backend.write_rows(key, data, rows)
+                else:
+                    self.backend.write(key, data)
+            except RuntimeError:
+                # Handler changed the dict while we were serializing it, retry on the next flush
+                with self.lock:
+                    self._dirty.add(key)
+            except Exception as e:
+                logging.error(f"Failed to flush {key}: {e}")
+                with self.lock:
+                    self._dirty.add(key)
+            finally:
+                with self.lock:
+                    self._flushing.discard(key)
+
+        if pending:
+            logging.info(f"Flushed {len(pending)} changed records to storage")
+
+    def detach(self):
+        """Turns the copy of the store in a forked worker process into a private scratch copy.
+
+        The worker keeps the cache it inherited, but gets a fresh lock (the
+        thread holding the parent's may not exist here), runs no listeners or
+        flush hooks and writes nothing: ``take_changes`` hands its writes over to the parent.
+        """
+        self.lock = threading.RLock()
+        self._dirty = set()
+        self._dirty_rows = {}
+        self._flushing = set()
+        self._listeners = []
+        self._flush_hooks = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.backend = ChangeCollector(self.backend)
+
+    def take_changes(self):
+        """[(key, data), ...] written to a detached store since the last call."""
+        self.flush()
+        changes, self.backend.changes = self.backend.changes, []
+        return changes
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self.flush()
+
+    def _run(self):
+        # Wakes up every flush_interval seconds, or early once max_dirty keys pile up
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if not self._stop.is_set():
+                self.flush()
+
+
+store = Store()
+
+
+def configure(backend_name="json", db_file=DB_FILE):
+    """Switches the shared store to another backend before the bot starts."""
+    if backend_name == "sqlite":
+        from common.sqlite_storage import SqliteBackend
+        store.backend = SqliteBackend(db_file)
+    elif backend_name != "json":
+        raise ValueError(f"Unknown storage backend: {backend_name}")
@@ -1,17 +1,51 @@
+import asyncio
+import os
+import secrets
+import sys
+
+from aiohttp import web
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.types import BotCommand
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
 from config import TELEGRAM_TOKEN
+try:
+    from config import STORAGE_BACKEND  # "json" (за замовчуванням) або "sqlite"
+except ImportError:
+    STORAGE_BACKEND = "json"
+try:
+    from config import WEBHOOK_URL  # напр. "https://bot.example.com"; без нього бот сам опитує Telegram
+except ImportError:
+    WEBHOOK_URL = None
+try:
+    from config import WEBHOOK_SECRET  # перевіряється в заголовку кожного оновлення
+except ImportError:
+    WEBHOOK_SECRET = secrets.token_urlsafe(32)
+try:
+    from config import WEBHOOK_LISTEN, WEBHOOK_PORT
+except ImportError:
+    WEBHOOK_LISTEN, WEBHOOK_PORT = "0.0.0.0", int(os.environ.get("PORT", 8443))
+WEBHOOK_PATH = "/telegram"
+# Спільні з working_bot модулі лежать у пакеті common поруч з каталогом бота
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from handlers import router
 from scheduler import start_scheduler
+from common import storage
+from common.storage import store
+from rate_limiter import OutboundMiddleware
+from utils import RolloverMiddleware
 
 
 class MyBot:
     def __init__(self):
+        storage.configure(STORAGE_BACKEND)
         self.bot = Bot(token=TELEGRAM_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+        # Усі запити до Telegram проходять через спільну чергу з лімітами
+        self.bot.session.middleware(OutboundMiddleware())
         self.dp = Dispatcher()
+        self.dp.update.outer_middleware(RolloverMiddleware())
         self.dp.include_router(router)
 
     async def set_commands(self):
@@ -31,7 +65,38 @@ class MyBot:
         ]
         await self.bot.set_my_commands(commands)
 
+    async def start(self):
+        if WEBHOOK_URL:
+            await self.start_webhook()
+        else:
+            await self.start_polling()
+
     async def start_polling(self):
         await self.set_commands()
         start_scheduler()
-        await self.dp.start_polling(self.bot)
+        store.start()
+        try:
+            # Вебхук з попереднього запуску не дасть отримувати оновлення опитуванням
+            await self.bot.delete_webhook()
+            await self.dp.start_polling(self.bot)
+        finally:
+            store.stop()
+
+    async def start_webhook(self):
+        """Telegram pushes every update to WEBHOOK_URL; requests without the secret token are rejected."""
+        await self.set_commands()
+        start_scheduler()
+        store.start()
+        app = web.Application()
+        SimpleRequestHandler(dispatcher=self.dp, bot=self.bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+        setup_application(app, self.dp, bot=self.bot)
+        runner = web.AppRunner(app)
+        try:
+            await self.bot.set_webhook(f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET,
+                                       allowed_updates=self.dp.resolve_used_update_types())
+            await runner.setup()
+            await web.TCPSite(runner, WEBHOOK_LISTEN, WEBHOOK_PORT).start()
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+            store.stop()
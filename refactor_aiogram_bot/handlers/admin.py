@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import asyncio
+
 # from aiogram import types
 from aiogram.filters import Command
 from aiogram.types import Message
@@ -15,4 +17,6 @@ async def mechanical_update_schedules(message: Message):
         await message.reply("У вас немає прав доступу до цієї команди.")
         return
 
-    await message.reply("Графік змінено", update_schedules())
+    # Перенос усіх чатів триває довго, цикл подій тим часом обслуговує інші оновлення
+    summary = await asyncio.get_running_loop().run_in_executor(None, update_schedules)
+    await message.reply(f"Графік змінено\n{summary}")
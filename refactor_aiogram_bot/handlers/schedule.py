@@ -1,27 +1,28 @@
-import asyncio
-
 from aiogram import types
 from aiogram.filters import Command
 from aiogram.types import Message
 
 from . import router
-from refactor_aiogram_bot.utils import load_schedule, get_schedule_text, empty_weekday, empty_weekend, pytz, timedelta, datetime, format_name
+from refactor_aiogram_bot.utils import load_schedule, get_schedule_text, get_schedule_names, empty_weekday, empty_weekend, pytz, timedelta, datetime
 
 from refactor_aiogram_bot.utils import save_schedule
+from refactor_aiogram_bot.config import ADMIN_IDS
+from common.schedule_edit import compile_edit, apply_edit, MissingSlotsError
+from common.message_edits import schedule_edits
 
 
 @router.message(Command("today"))
 async def show_today_schedule(message: Message):
     chat_id = message.chat.id
     today_schedule = load_schedule(chat_id, "today", empty_weekday, empty_weekend)
-    text = await get_schedule_text(today_schedule, datetime.now(pytz.timezone('Europe/Kiev')).strftime("%d.%m.%Y"), message.bot)
+    text = await get_schedule_text(today_schedule, datetime.now(pytz.timezone('Europe/Kiev')).strftime("%d.%m.%Y"), message.bot, chat_id)
     await message.reply(text)
 
 @router.message(Command("tomorrow"))
 async def show_tomorrow_schedule(message: Message):
     chat_id = message.chat.id
     tomorrow_schedule = load_schedule(chat_id, "tomorrow", empty_weekday, empty_weekend)
-    text = await get_schedule_text(tomorrow_schedule, (datetime.now(pytz.timezone('Europe/Kiev')) + timedelta(days=1)).strftime("%d.%m.%Y"), message.bot)
+    text = await get_schedule_text(tomorrow_schedule, (datetime.now(pytz.timezone('Europe/Kiev')) + timedelta(days=1)).strftime("%d.%m.%Y"), message.bot, chat_id)
     await message.reply(text)
 
 @router.message(Command("default"))
@@ -30,24 +31,24 @@ async def show_default_schedule(message: Message):
     current_day = datetime.now(pytz.timezone('Europe/Kiev')).weekday()
     if current_day < 5:
         schedule = load_schedule(chat_id, "weekday_default", empty_weekday, empty_weekend)
-        text = await get_schedule_text(schedule, "стандартний графік (будній день)", message.bot)
+        text = await get_schedule_text(schedule, "стандартний графік (будній день)", message.bot, chat_id)
     else:
         schedule = load_schedule(chat_id, "weekend_default", empty_weekday, empty_weekend)
-        text = await get_schedule_text(schedule, "стандартний графік (вихідний день)", message.bot)
+        text = await get_schedule_text(schedule, "стандартний графік (вихідний день)", message.bot, chat_id)
     await message.reply(text)
 
 @router.message(Command("weekday"))
 async def show_weekday_default_schedule(message: Message):
     chat_id = message.chat.id
     schedule = load_schedule(chat_id, "weekday_default", empty_weekday, empty_weekend)
-    text = await get_schedule_text(schedule, "стандартний графік (будній день)", message.bot)
+    text = await get_schedule_text(schedule, "стандартний графік (будній день)", message.bot, chat_id)
     await message.reply(text)
 
 @router.message(Command("weekend"))
 async def show_weekend_default_schedule(message: Message):
     chat_id = message.chat.id
     schedule = load_schedule(chat_id, "weekend_default", empty_weekend, empty_weekend)
-    text = await get_schedule_text(schedule, "стандартний графік (вихідний день)", message.bot)
+    text = await get_schedule_text(schedule, "стандартний графік (вихідний день)", message.bot, chat_id)
     await message.reply(text)
 
 @router.message()
@@ -87,83 +88,20 @@ async def edit_schedule(message: Message):
     else:
         return
 
-    operation = 'remove' if message_text[0] == '-' else 'add'
-    hours_range = message_text[1:].strip()
-
-    updated_hours = []
-    if '-' in hours_range:
-        try:
-            start_hour, end_hour = map(int, hours_range.split('-'))
-
-            if start_hour < 0:
-                start_hour += 24
-            if end_hour < 0:
-                end_hour += 24
-
-            if start_hour < 0 or end_hour > 24 or start_hour >= end_hour:
-                await message.reply("Будь ласка, введіть правильний час (9-24).\n ")
-                return
-
-            for hour in range(start_hour, end_hour):
-                if hour == 23:
-                    time_slot = f"{hour:02d}:00 - 00:00"
-                else:
-                    time_slot = f"{hour:02d}:00 - {hour + 1:02d}:00"
-
-                if operation == 'add':
-                    if user_id not in schedule[time_slot]:
-                        schedule[time_slot].append(user_id)
-                        updated_hours.append(time_slot)
-                elif operation == 'remove':
-                    if user_id in schedule[time_slot]:
-                        schedule[time_slot].remove(user_id)
-                        updated_hours.append(time_slot)
-        except ValueError:
-            await message.reply("Будь ласка, введіть правильний час (9-24).")
-            return
-    else:
-        try:
-            hour = int(hours_range)
-
-            if hour < 0:
-                hour += 24
-
-            if hour == 24:
-                hour = 0
-
-            time_slot = f"{hour:02d}:00 - {hour + 1:02d}:00"
-
-            if hour == 23:
-                time_slot = f"{hour:02d}:00 - 00:00"
-
-            if operation == 'add':
-                if user_id not in schedule[time_slot]:
-                    schedule[time_slot].append(user_id)
-                    updated_hours.append(time_slot)
-            elif operation == 'remove':
-                if user_id in schedule[time_slot]:
-                    schedule[time_slot].remove(user_id)
-                    updated_hours.append(time_slot)
-        except ValueError:
-            await message.reply("Будь ласка, введіть правильний час (9-24).")
-            return
+    compiled = compile_edit(message_text)
+    if compiled.invalid or not compiled.ops:
+        await message.reply("Будь ласка, введіть правильний час (9-24).")
+        return
 
-    save_schedule(chat_id, schedule_type, schedule)
+    try:
+        diff = apply_edit(schedule, user_id, compiled, allow_force_remove=user_id in ADMIN_IDS)
+    except MissingSlotsError as e:
+        await message.reply("Будь ласка, введіть правильний час (9-24). "
+                            f"Для додавання неіснуючої години використовуйте ! в кінці, наприклад: {e.op.text}!")
+        return
 
-    if operation == 'add':
-        if updated_hours:
-            start_time = updated_hours[0].split('-')[0]
-            end_time = updated_hours[-1].split('-')[1]
-            response_message = f"{user_name} було додано до графіка на {start_time} - {end_time}."
-        else:
-            response_message = "Не вдалося додати години."
-    else:
-        if updated_hours:
-            start_time = updated_hours[0].split('-')[0]
-            end_time = updated_hours[-1].split('-')[1]
-            response_message = f"{user_name} було видалено з графіка на {start_time} - {end_time}."
-        else:
-            response_message = "Не вдалося видалити години."
+    save_schedule(chat_id, schedule_type, schedule)
+    response_message = diff.describe(user_name)
 
     # Set the correct date label
     if schedule_type == "today":
@@ -177,19 +115,19 @@ async def edit_schedule(message: Message):
     else:
         date_label = "незнайомий графік"
 
-    updated_schedule_message = f"Графік роботи Адміністраторів на {date_label}\n\n"
-    for time_slot in schedule:
-        users = schedule[time_slot]
-
-        user_name_tasks = [message.bot.get_chat_member(chat_id=message.chat.id, user_id=user) for user in users]
-
-        user_names_results = await asyncio.gather(*user_name_tasks)
-
-        user_names = ' – '.join([format_name(member.user.first_name) for member in user_names_results]) or "–"
-        updated_schedule_message += f"{time_slot}: {user_names}\n"
-
-    try:
-        await message.reply_to_message.edit_text(updated_schedule_message + '\n' + response_message)
-    except Exception as e:
+    async def render():
+        # Рендеримо на момент відправки, щоб у повідомленні були всі зібрані правки
+        current = load_schedule(chat_id, schedule_type, empty_weekday, empty_weekend)
+        names, _ = await get_schedule_names(current, message.bot)
+        updated_schedule_message = f"Графік роботи Адміністраторів на {date_label}\n\n"
+        for time_slot, users in current.items():
+            user_names = ' – '.join([names[str(user)] for user in users]) or "–"
+            updated_schedule_message += f"{time_slot}: {user_names}\n"
+        return updated_schedule_message
+
+    async def on_error(e):
         await message.reply("Не вдалося редагувати повідомлення. Спробуйте ще раз.")
-        print(e)
+
+    # Правки одного повідомлення від кількох людей підряд йдуть одним edit_text
+    reply_to = message.reply_to_message
+    await schedule_edits.submit((chat_id, reply_to.message_id), response_message, render, reply_to.edit_text, on_error)
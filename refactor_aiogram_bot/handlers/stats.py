@@ -3,20 +3,19 @@ from aiogram.filters import Command
 from aiogram.types import Message
 
 from . import router
-from refactor_aiogram_bot.utils import load_statistics
+from refactor_aiogram_bot.utils import load_statistics, resolve_users
 
 @router.message(Command("stat"))
 async def stat(message: Message):
     chat_id = message.chat.id
     chat_stats = load_statistics(chat_id)
 
+    users = await resolve_users(message.bot, chat_stats.keys())
+
     text = "Статистика чату:\n"
     for user_id, stats in chat_stats.items():
-        try:
-            chat = await message.bot.get_chat(user_id)
-            user_name = chat.first_name or "unknown"
-        except Exception:
-            user_name = "unknown"
+        user = users[user_id]
+        user_name = user.first_name if user and user.first_name else "unknown"
 
         text += f"{user_name}: {stats.get('total', 0)} годин\n"
 
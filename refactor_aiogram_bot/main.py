@@ -4,7 +4,7 @@ from bot import MyBot
 
 async def main():
     bot = MyBot()
-    await bot.start_polling()
+    await bot.start()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,15 @@
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+from common.outbound import outbound, method_priority, SEND_METHODS
+
+
+class OutboundMiddleware(BaseRequestMiddleware):
+    """Session middleware that sends every Bot API request through the outbound dispatcher."""
+
+    def __init__(self, dispatcher=outbound):
+        self.dispatcher = dispatcher
+
+    async def __call__(self, make_request, bot, method):
+        api_method = method.__api_method__
+        chat_id = getattr(method, "chat_id", None) if api_method in SEND_METHODS else None
+        return await self.dispatcher.run(lambda: make_request(bot, method), chat_id, method_priority(api_method))
@@ -1,8 +1,11 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from utils import update_schedules
+from utils import lazy_rollover
+
+SWEEP_INTERVAL_MINUTES = 10  # Як часто фоново переносимо графіки неактивних чатів
 
 scheduler = AsyncIOScheduler()
 
 def start_scheduler():
-    scheduler.add_job(update_schedules, 'cron', hour=0, minute=0, timezone='Europe/Kiev')
+    # Активні чати переносяться при першому зверненні, тут лише неактивні
+    scheduler.add_job(lazy_rollover.sweep, 'interval', minutes=SWEEP_INTERVAL_MINUTES)
     scheduler.start()
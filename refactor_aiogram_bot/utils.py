@@ -1,98 +1,53 @@
-import emoji
-import re
-import json
+import asyncio
 import os
 import pytz
 from datetime import datetime, timedelta
 import logging
-import copy
-
-LOCK_FILE = 'bot.lock'
-SCHEDULES_DIR = "schedules"
-STATS_DIR = "stats"
-
-if not os.path.exists(SCHEDULES_DIR):
-    os.makedirs(SCHEDULES_DIR)
-
-if not os.path.exists(STATS_DIR):
-    os.makedirs(STATS_DIR)
+import time
 
+from aiogram import BaseMiddleware
 
-def remove_emoji(text):
-    return emoji.replace_emoji(text, replace='')
+from common.storage import store, schedule_key, stats_key
+from common.names import format_name, resolve_users
+from common.schedule_mask import Schedule
+from common.render_cache import render_cache, render_key
+from common.rollover import run_rollover, LazyRollover, mark_rolled_through
 
-def format_name(name):
-    first_emoji = ''
-    for c in name:
-        if emoji.is_emoji(c):
-            first_emoji = c
-            break
+try:
+    from config import ROLLOVER_WORKERS, ROLLOVER_EXECUTOR  # напр. 8, "thread" або "process"
+except ImportError:
+    from common.rollover import ROLLOVER_WORKERS, ROLLOVER_EXECUTOR
 
-    clean_name = remove_emoji(name).strip()
-
-    if '(' in clean_name:
-        match = re.search(r'[^()]*\)', clean_name)
-        if match:
-            clean_name = clean_name[:match.end()].strip()
-    else:
-        match = re.search(r'([^ ]+)', clean_name)
-        if match:
-            clean_name = match.group(1).strip()
-
-    return f"{first_emoji}{clean_name}".strip() if first_emoji else clean_name.strip()
+LOCK_FILE = 'bot.lock'
 
-def get_schedule_file_name(chat_id, schedule_type):
-    return os.path.join(SCHEDULES_DIR, f"{chat_id}_{schedule_type}.json")
 
 def load_schedule(chat_id, schedule_type, weekday_default, weekend_default):
-    file_name = get_schedule_file_name(chat_id, schedule_type)
-    if os.path.exists(file_name):
-        with open(file_name, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    else:
+    lazy_rollover.ensure(chat_id)
+    key = schedule_key(chat_id, schedule_type)
+    schedule = store.get(key)
+    if schedule is None:
         kyiv_tz = pytz.timezone('Europe/Kiev')
         today = datetime.now(kyiv_tz).weekday()
         if today < 5:
-            schedule = weekday_default
+            schedule = Schedule.from_legacy(weekday_default)
         else:
-            schedule = weekend_default
-
-        with open(file_name, 'w', encoding='utf-8') as f:
-            json.dump(schedule, f, ensure_ascii=False, indent=4)
-        return schedule
+            schedule = Schedule.from_legacy(weekend_default)
+        store.put(key, schedule)
+    return schedule
 
 def save_schedule(chat_id, schedule_type, schedule):
-    file_name = get_schedule_file_name(chat_id, schedule_type)
-    try:
-        with open(file_name, 'w', encoding='utf-8') as f:
-            json.dump(schedule, f, ensure_ascii=False, indent=4)
-        logging.info(f"Schedule saved successfully: {file_name}")
-    except Exception as e:
-        logging.error(f"Failed to save schedule: {file_name}, Error: {e}")
-
-def get_stats_file_name(chat_id):
-    return os.path.join(STATS_DIR, f"{chat_id}.json")
+    store.put(schedule_key(chat_id, schedule_type), schedule)
 
 def load_statistics(chat_id):
-    file_name = get_stats_file_name(chat_id)
-    if os.path.exists(file_name):
-        try:
-            with open(file_name, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            logging.error(f"Error loading statistics from {file_name}: {e}")
-            return {}
-    else:
+    try:
+        lazy_rollover.ensure(chat_id)
+        return store.get(stats_key(chat_id)) or {}
+    except Exception as e:
+        logging.error(f"Error loading statistics for chat {chat_id}: {e}")
         return {}
 
 def save_statistics(chat_id, stats):
-    file_name = get_stats_file_name(chat_id)
-    try:
-        with open(file_name, 'w', encoding='utf-8') as f:
-            json.dump(stats, f, ensure_ascii=False, indent=4)
-        logging.info(f"Statistics saved successfully: {file_name}")
-    except Exception as e:
-        logging.error(f"Failed to save statistics: {file_name}, Error: {e}")
+    store.put(stats_key(chat_id), stats)
 
 def is_weekend(date):
     return date.weekday() in (5, 6)
@@ -129,78 +84,138 @@ empty_weekend = {
     "00:00 - 01:00": []
 }
 
+def rollover_fallbacks(today_date):
+    """Templates of the schedules a rollover into today_date reads, for chats that have none of them stored."""
+    tomorrow_date = today_date + timedelta(days=1)
+    default_type = "weekend_default" if is_weekend(tomorrow_date) else "weekday_default"
+    return {
+        "tomorrow": empty_weekend if is_weekend(today_date) else empty_weekday,
+        default_type: empty_weekend if is_weekend(tomorrow_date) else empty_weekday,
+    }
+
+def sqlite_fallbacks(today_date):
+    return {schedule_type: Schedule.from_legacy(template)
+            for schedule_type, template in rollover_fallbacks(today_date).items()}
+
+def rollover_chat(chat_id, today_date):
+    tomorrow_date = today_date + timedelta(days=1)
+    previos_date = today_date - timedelta(days=1)
+    fallbacks = rollover_fallbacks(today_date)
+
+    # SQLite backend rolls the chat over with a few set-based queries
+    if hasattr(store.backend, "rollover"):
+        with store.lock:
+            store.flush()
+            store.backend.rollover(previos_date.weekday(), is_weekend(tomorrow_date), chat_id,
+                                   sqlite_fallbacks(today_date))
+            store.invalidate_chat(chat_id)
+        mark_rolled_through(chat_id, today_date.date())
+        return
+
+    today_schedule = load_schedule(chat_id, "today", empty_weekday, empty_weekend)
+    tomorrow_schedule = load_schedule(chat_id, "tomorrow", fallbacks["tomorrow"], fallbacks["tomorrow"])
+
+    # Calculate statistics for today's schedule
+    today_stats = {str(user_id): hours for user_id, hours in today_schedule.hours().items()}
+
+    # Load previous statistics for the chat
+    chat_stats = load_statistics(chat_id)
+
+    # Update total hours worked for each user
+    for user_id, hours in today_stats.items():
+        # Initialize user statistics if not already present
+        if user_id not in chat_stats:
+            chat_stats[user_id] = {"total": 0, "daily": {}}
+
+        chat_stats[user_id]["total"] += hours
+
+        # Update daily statistics for the user
+        weekday = previos_date.weekday()  # Це індекс дня тижня (0 для Понеділка і т.д.)
+        daily_stats = chat_stats[user_id].get('daily', {})
+        if str(weekday) not in daily_stats:
+            daily_stats[str(weekday)] = hours
+        else:
+            daily_stats[str(weekday)] += hours
+        chat_stats[user_id]['daily'] = daily_stats
+
+    # Save updated statistics for the chat
+    save_statistics(chat_id, chat_stats)
+
+    # Update schedules for today and tomorrow
+    today_schedule = tomorrow_schedule.copy()
+    default_type = "weekend_default" if is_weekend(tomorrow_date) else "weekday_default"
+    default_for_tomorrow = load_schedule(chat_id, default_type, fallbacks[default_type], fallbacks[default_type])
+    tomorrow_schedule = default_for_tomorrow.copy()
+
+    save_schedule(chat_id, "today", today_schedule)
+    save_schedule(chat_id, "tomorrow", tomorrow_schedule)
+    mark_rolled_through(chat_id, today_date.date())
+
+# Кожен чат переноситься на новий день при першому зверненні після півночі
+lazy_rollover = LazyRollover(rollover_chat, pytz.timezone('Europe/Kiev'))
+
+class RolloverMiddleware(BaseMiddleware):
+    """Catches the chat up on missed days in a thread before its update is handled.
+
+    The catch-up writes files and may wait for the sweep; after it, load_schedule
+    and load_statistics in the handlers find the chat current and return at once.
+    """
+
+    async def __call__(self, handler, event, data):
+        chat = data.get("event_chat")
+        if chat and not lazy_rollover.is_current(chat.id):
+            await asyncio.to_thread(lazy_rollover.ensure, chat.id)
+        return await handler(event, data)
+
 def update_schedules():
+    """Forced rollover of every chat at once, used by /update."""
     kyiv_tz = pytz.timezone('Europe/Kiev')
     today_date = datetime.now(kyiv_tz)
     tomorrow_date = today_date + timedelta(days=1)
+    previos_date = today_date - timedelta(days=1)
+
+    # SQLite backend rolls every chat over with a few set-based queries
+    if hasattr(store.backend, "rollover"):
+        started = time.perf_counter()
+        with store.lock:
+            store.flush()
+            chats = store.backend.rollover(previos_date.weekday(), is_weekend(tomorrow_date),
+                                           fallbacks=sqlite_fallbacks(today_date))
+            store.invalidate()
+        for chat_id in chats:
+            mark_rolled_through(chat_id, today_date.date())
+        return f"Rollover finished: {len(chats)} chats in {time.perf_counter() - started:.2f}s"
+
+    # Make sure chats created since the last flush are visible on disk
+    store.flush()
+
+    # Every chat is independent, so they are rolled over in parallel
+    report = run_rollover(rollover_chat, store.backend.list_chats(), today_date,
+                          workers=ROLLOVER_WORKERS, executor=ROLLOVER_EXECUTOR)
+    return report.summary()
+
+
+async def get_schedule_names(schedule, bot):
+    """(names, resolved); resolved is False when some user could not be looked up and is shown as "unknown"."""
+    users = await resolve_users(bot, schedule.user_ids())
+    names = {user_id: user.display_name if user else "unknown" for user_id, user in users.items()}
+    return names, all(user is not None for user in users.values())
+
+async def get_schedule_text(schedule, date_label, bot, chat_id):
+    key = render_key(chat_id, schedule, date_label)
+    text = render_cache.get(key)
+    if text is not None:
+        return text
 
-    for file_name in os.listdir(SCHEDULES_DIR):
-        if file_name.endswith("_today.json"):
-            chat_id = file_name.split("_")[0]
-            today_schedule = load_schedule(chat_id, "today", empty_weekday, empty_weekend)
-            tomorrow_schedule = load_schedule(chat_id, "tomorrow", empty_weekday, empty_weekend)
-
-            # Calculate statistics for today's schedule
-            today_stats = {}
-            for time_slot, user_ids in today_schedule.items():
-                for user_id in user_ids:
-                    user_id = str(user_id)  # Ensure user_id is string
-                    if user_id not in today_stats:
-                        today_stats[user_id] = 1
-                    else:
-                        today_stats[user_id] += 1
-
-            # Load previous statistics for the chat
-            chat_stats = load_statistics(chat_id)
-
-            # Update total hours worked for each user
-            for user_id, hours in today_stats.items():
-                # Initialize user statistics if not already present
-                if user_id not in chat_stats:
-                    chat_stats[user_id] = {"total": 0, "daily": {}}
-
-                chat_stats[user_id]["total"] += hours
-
-                # Update daily statistics for the user
-                weekday = today_date.weekday()  # Це індекс дня тижня (0 для Понеділка і т.д.)
-                daily_stats = chat_stats[user_id].get('daily', {})
-                if str(weekday) not in daily_stats:
-                    daily_stats[str(weekday)] = hours
-                else:
-                    daily_stats[str(weekday)] += hours
-                chat_stats[user_id]['daily'] = daily_stats
-
-            # Save updated statistics for the chat
-            save_statistics(chat_id, chat_stats)
-
-            # Update schedules for today and tomorrow
-            today_schedule = copy.deepcopy(tomorrow_schedule)
-            if is_weekend(tomorrow_date):
-                default_for_tomorrow = load_schedule(chat_id, "weekend_default", empty_weekday, empty_weekend)
-            else:
-                default_for_tomorrow = load_schedule(chat_id, "weekday_default", empty_weekday, empty_weekend)
-            tomorrow_schedule = copy.deepcopy(default_for_tomorrow)
-
-            save_schedule(chat_id, "today", today_schedule)
-            save_schedule(chat_id, "tomorrow", tomorrow_schedule)
-
-
-async def get_schedule_text(schedule, date_label, bot):
     text = f"Графік роботи Адміністраторів на {date_label}\n\n"
+    names, resolved = await get_schedule_names(schedule, bot)
 
     for time_slot, user_ids in schedule.items():
-        admins = []
-        for user_id in user_ids:
-            try:
-                chat = await bot.get_chat(user_id)
-                if chat.first_name:
-                    admins.append(format_name(chat.first_name))
-                else:
-                    admins.append("–")
-            except Exception:
-                admins.append("unknown")
-
+        admins = [names[str(user_id)] for user_id in user_ids]
         admins_str = ' – '.join(admins) if admins else "–"
         text += f"{time_slot} – {admins_str}\n"
 
-    return text
\ No newline at end of file
+    # Текст з "unknown" після збою get_chat не кешуємо, наступного разу ім'я знайдеться
+    if resolved:
+        render_cache.set(key, text)
+    return text
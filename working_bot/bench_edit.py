@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# Порівняння швидкості правок графіка: старий розбір рядків по словниках проти скомпільованих правок.
+# Використання: python bench_edit.py [кількість_правок] [кількість_користувачів]
+import copy
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.schedule_mask import Schedule
+from common.schedule_edit import compile_edit, apply_edit, MissingSlotsError
+
+EMPTY_WEEKEND = {f"{hour:02d}:00 - {(hour + 1) % 24:02d}:00": [] for hour in list(range(9, 24)) + [0]}
+
+
+def legacy_edit(schedule, user_id, message, is_admin=False):
+    """edit_schedule before the compiled edits: dict of lists, one f-string key per hour."""
+    updated_hours = []
+    op_type = None
+    for operation in message.split(','):
+        operation = operation.strip()
+        if not (operation.startswith('+') or operation.startswith('-')):
+            continue
+        op_type = 'remove' if operation[0] == '-' else 'add'
+        hours_range = operation[1:].strip().rstrip('!')
+        add_hours = operation.endswith('!') and op_type == 'add'
+        remove_hours = operation.endswith('!') and op_type == 'remove' and is_admin
+        try:
+            if '-' in hours_range:
+                start_time, end_time = hours_range.split('-')
+                start_hour = int(start_time.split(':')[0])
+                end_hour = int(end_time.split(':')[0])
+                if start_hour < 0 or end_hour > 24 or start_hour >= end_hour:
+                    raise ValueError
+                hours = range(start_hour, end_hour)
+            else:
+                hour = int(hours_range.split(':')[0])
+                if hour < 0 or hour > 24:
+                    raise ValueError
+                hours = [hour]
+            for hour in hours:
+                time_slot = f"{hour % 24:02d}:00 - {(hour + 1) % 24:02d}:00"
+                if op_type == 'add':
+                    if add_hours and time_slot not in schedule:
+                        schedule[time_slot] = []
+                    if user_id not in schedule[time_slot]:
+                        schedule[time_slot].append(user_id)
+                        updated_hours.append(time_slot)
+                elif op_type == 'remove':
+                    if remove_hours and time_slot in schedule:
+                        schedule.pop(time_slot)
+                    if time_slot in schedule and user_id in schedule[time_slot]:
+                        schedule[time_slot].remove(user_id)
+                        updated_hours.append(time_slot)
+        except (ValueError, KeyError):
+            break
+    schedule = dict(sorted(schedule.items(), key=lambda x: (x[0] == '00:00 - 01:00', x[0])))
+    if updated_hours:
+        start_time = updated_hours[0].split('-')[0]
+        end_time = updated_hours[-1].split('-')[1]
+        return f"було {'додано до' if op_type == 'add' else 'видалено з'} графіка на {start_time} - {end_time}."
+    return "Не вдалося."
+
+
+def compiled_edit(schedule, user_id, message, is_admin=False):
+    try:
+        diff = apply_edit(schedule, user_id, compile_edit(message), allow_force_remove=is_admin)
+    except MissingSlotsError:
+        return "Не вдалося."
+    return diff.describe("")
+
+
+def random_op(rng):
+    sign = rng.choice('+-')
+    start = rng.randint(9, 23)
+    if rng.random() < 0.5:
+        return f"{sign}{start}"
+    return f"{sign}{start}-{rng.randint(start + 1, 24)}"
+
+
+def synthetic_edits(count, users, seed=1):
+    rng = random.Random(seed)
+    return [(rng.randrange(users) + 100000000, ', '.join(random_op(rng) for _ in range(rng.randint(1, 3))))
+            for _ in range(count)]
+
+
+def populated(users, seed=2):
+    rng = random.Random(seed)
+    schedule = copy.deepcopy(EMPTY_WEEKEND)
+    for users_in_slot in schedule.values():
+        users_in_slot.extend(rng.sample(range(100000000, 100000000 + users), min(users, 5)))
+    return schedule
+
+
+def bench(name, edit, schedule, edits):
+    started = time.perf_counter()
+    for user_id, message in edits:
+        edit(schedule, user_id, message)
+    elapsed = time.perf_counter() - started
+    print(f"{name:>9}: {len(edits)} edits in {elapsed:.3f}s, {len(edits) / elapsed:,.0f} edits/s")
+    return elapsed
+
+
+def main(count=100000, users=50):
+    edits = synthetic_edits(count, users)
+    legacy = bench("legacy", legacy_edit, populated(users), edits)
+    compiled = bench("compiled", compiled_edit, Schedule.from_legacy(populated(users)), edits)
+    print(f"speedup: x{legacy / compiled:.1f}")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
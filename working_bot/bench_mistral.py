@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Скільки запитів до Mistral встигаємо за раз і чи не блокують вони цикл подій (через локальну заглушку).
+# Використання: python bench_mistral.py [кількість_запитів] [затримка_відповіді]
+import asyncio
+import sys
+import time
+
+from mistral_client import MistralClient
+from mistral_stub import start_stub
+
+
+async def measure_loop_lag(stop, interval=0.01):
+    """Worst delay of a 10 ms timer while the requests run, i.e. how long the loop was blocked."""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def main(count, delay):
+    server, api_url = start_stub(delay=delay)
+    client = MistralClient(api_url, "stub")
+    client.start()
+    stop = asyncio.Event()
+    lag = asyncio.create_task(measure_loop_lag(stop))
+
+    started = time.perf_counter()
+    answers = await asyncio.gather(*(client.ask(f"питання {number}") for number in range(count)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+
+    print(f"{count} requests, {delay}s each: {elapsed:.2f}s (one by one: {count * delay:.2f}s)")
+    print(f"answered: {sum(1 for answer in answers if answer)}, worst event loop lag: {await lag * 1000:.1f} ms")
+    await client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20,
+                     float(sys.argv[2]) if len(sys.argv) > 2 else 0.5))
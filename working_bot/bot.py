@@ -1,10 +1,8 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import random
-import emoji
+import secrets
 import sys
-import re
-import copy
-import json
 import logging
 import os
 import threading
@@ -13,14 +11,40 @@ import signal
 from datetime import datetime, timedelta
 
 import pytz
-import requests
-from telegram import Update
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, ContextTypes, \
-    CallbackQueryHandler, CallbackContext
+    CallbackQueryHandler, CallbackContext, TypeHandler
 from telegram.error import BadRequest, NetworkError
 from apscheduler.schedulers.background import BackgroundScheduler
 
+# Спільні з refactor_aiogram_bot модулі лежать у пакеті common поруч з каталогом бота
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 from responses import responses_easy, responses_username
+from common import storage
+from common.storage import store, schedule_key, stats_key
+from journal import journal
+from common.schedule_mask import Schedule, mask_slots
+from common.schedule_edit import compile_edit, apply_edit, MissingSlotsError
+from common.names import format_name, resolve_users
+from directory import user_directory
+from stats_index import name_index
+from leaderboards import leaderboards
+from global_stats import global_stats
+from hours_history import hours_history, HISTORY_DAYS
+from coverage import compute_coverage, render_coverage, COVERAGE_DAYS
+from common.render_cache import render_cache, render_key
+from common.message_edits import schedule_edits
+from rate_limiter import OutboundRateLimiter
+from update_processor import ChatUpdateProcessor
+from photo_cache import photo_cache
+from skins import skin_catalog, SKIN_CATEGORIES
+from shop_pages import render_page
+from common.rollover import run_rollover, LazyRollover, mark_rolled_through
+from mistral_client import MistralClient
+from llm_scheduler import llm_scheduler, LlmBusyError
+from llm_cache import PromptCache, context_digest
+from conversation import ConversationMemory
 
 # Додаємо шлях до секретного файлу у Python шлях (для хостингу)
 sys.path.append('/etc/secrets')
@@ -30,27 +54,53 @@ from config import ADMIN_IDS  # Імпорт списку з айдішками
 from config import MISTRAL_API_KEY
 from config import MISTRAL_API_URL
 
-LOCK_FILE = 'bot.lock'
+try:
+    from config import STORAGE_BACKEND  # "json" (за замовчуванням) або "sqlite"
+except ImportError:
+    STORAGE_BACKEND = "json"
+
+try:
+    from config import LLM_CACHE_PERSIST  # зберігати відповіді чат-бота між перезапусками
+except ImportError:
+    LLM_CACHE_PERSIST = True
+
+try:
+    from config import LLM_ROLLING_SUMMARY  # підсумовувати моделлю репліки, що випали з пам'яті чат-бота
+except ImportError:
+    LLM_ROLLING_SUMMARY = False
+
+try:
+    from config import WEBHOOK_URL  # напр. "https://bot.example.com"; без нього бот сам опитує Telegram
+except ImportError:
+    WEBHOOK_URL = None
+
+try:
+    from config import WEBHOOK_SECRET  # перевіряється в заголовку кожного оновлення
+except ImportError:
+    WEBHOOK_SECRET = secrets.token_urlsafe(32)
+
+try:
+    from config import WEBHOOK_LISTEN, WEBHOOK_PORT
+except ImportError:
+    WEBHOOK_LISTEN, WEBHOOK_PORT = "0.0.0.0", int(os.environ.get("PORT", 8443))
+
+WEBHOOK_PATH = "telegram"
 
-SKINS_DIR = "skins"
-PROFILE_SKINS_DIR = "skins/profile_skins"
-KISS_SKINS_DIR = "skins/kiss_skins"
-HUG_SKINS_DIR = "skins/hug_skins"
-DANCE_SKINS_DIR = "skins/dance_skins"
+try:
+    from config import ROLLOVER_WORKERS, ROLLOVER_EXECUTOR  # напр. 8, "thread" або "process"
+except ImportError:
+    from common.rollover import ROLLOVER_WORKERS, ROLLOVER_EXECUTOR
+
+SWEEP_INTERVAL_MINUTES = 10  # Як часто фоново переносимо графіки неактивних чатів
+
+LOCK_FILE = 'bot.lock'
 
 SKINS_PER_PAGE = 5
+TOP_SIZE = 10  # Скільки місць показують рейтинги
+GLOBAL_TOP_CHATS = 5  # Скільки чатів показує /global_top
 
 kyiv_tz = pytz.timezone('Europe/Kiev')
 
-# Імена файлів для графіків
-SCHEDULES_DIR = "schedules"
-if not os.path.exists(SCHEDULES_DIR):
-    os.makedirs(SCHEDULES_DIR)
-
-STATS_DIR = "stats"
-# Create directory for statistics if not exists
-if not os.path.exists(STATS_DIR):
-    os.makedirs(STATS_DIR)
 
 
 chat_states = {}
@@ -58,38 +108,63 @@ chat_states = {}
 async def start_chatbot(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
     chat_states[chat_id] = True
+    conversations.clear(chat_id)
     await update.message.reply_text("Чат-бот активовано.")
 
 async def stop_chatbot(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
     chat_states[chat_id] = False
+    conversations.clear(chat_id)
     await update.message.reply_text("Чат-бот деактивовано.")
 
-async def get_mistral_response(message: str) -> str:
-    headers = {
-        "Authorization": f"Bearer {MISTRAL_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": "open-mistral-nemo",
-        "messages": [{"role": "user", "content": message}]
-    }
+# Один клієнт з пулом з'єднань на весь бот, запити не блокують цикл подій
+mistral = MistralClient(MISTRAL_API_URL, MISTRAL_API_KEY)
+# Однакові питання (привітання, "що таке графік") не йдуть до моделі вдруге.
+# Ключ містить хеш історії розмови, тож відповідь повторюється лише в тому самому контексті
+prompt_cache = PromptCache(persist=LLM_CACHE_PERSIST)
+# Останні репліки кожного чату, щоб модель бачила контекст розмови
+conversations = ConversationMemory(keep_dropped=LLM_ROLLING_SUMMARY)
+# Фонові задачі (підсумки розмов): цикл подій тримає лише слабкі посилання, тож тримаємо їх тут
+background_tasks = set()
+
+
+async def get_mistral_response(chat_id, message: str) -> str:
+    messages = conversations.build_prompt(chat_id, message)
+    response = await mistral.complete(messages)
+    if response:
+        prompt_cache.set(mistral.model, message, response, context_digest(messages[:-1]))
+    return response
+
+
+async def summarize_conversation(chat_id) -> None:
     try:
-        response = requests.post(MISTRAL_API_URL, headers=headers, json=data)
-        response.raise_for_status()
-        response_data = response.json()
-        return response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error occurred during Mistral API request: {e}")
-        return ""
+        await llm_scheduler.submit(chat_id, lambda: conversations.summarize(chat_id, mistral.complete))
+    except LlmBusyError as e:
+        logging.info(f"Postponing conversation summary: {e}")
 
 
 async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
     if update.message.reply_to_message and chat_states.get(chat_id, False):
-        response = await get_mistral_response(update.message.text)
+        message = update.message.text
+        history = context_digest(conversations.build_prompt(chat_id, message)[:-1])
+        response = prompt_cache.get(mistral.model, message, history)
+        if response is None:
+            try:
+                # Спільна черга: обмежена кількість одночасних запитів і почергово між чатами
+                response = await llm_scheduler.submit(chat_id, lambda: get_mistral_response(chat_id, message))
+            except LlmBusyError as e:
+                logging.info(f"Skipping chatbot reply: {e}")
+                return
         logging.info(f"Mistral response: {response}")
         if response:
+            # Чат-бот могли вимкнути, поки модель відповідала
+            if chat_states.get(chat_id, False):
+                conversations.remember(chat_id, message, response)
+                if conversations.needs_summary(chat_id):
+                    task = asyncio.create_task(summarize_conversation(chat_id))
+                    background_tasks.add(task)
+                    task.add_done_callback(background_tasks.discard)
             await update.message.reply_text(response)
         else:
             logging.warning("Empty response from Mistral.ai API")
@@ -111,6 +186,8 @@ def remove_lock():
 
 
 def signal_handler(sig, frame):
+    journal.stop()
+    store.stop()
     remove_lock()
     sys.exit(0)
 
@@ -121,31 +198,6 @@ def keep_alive():
         time.sleep(1800)  # 1800 секунд = 30 хвилин
 
 
-def remove_emoji(text):
-    return emoji.replace_emoji(text, replace='')
-
-
-def format_name(name):
-    first_emoji = ''
-    for c in name:
-        if emoji.is_emoji(c):
-            first_emoji = c
-            break
-
-    clean_name = remove_emoji(name).strip()
-
-    if '(' in clean_name:
-        match = re.search(r'[^()]*\)', clean_name)
-        if match:
-            clean_name = clean_name[:match.end()].strip()
-    else:
-        match = re.search(r'([^ ]+)', clean_name)
-        if match:
-            clean_name = match.group(1).strip()
-
-    return f"{first_emoji}{clean_name}".strip() if first_emoji else clean_name.strip()
-
-
 def get_user_name(stats, user):
     # Check if the name is set in the statistics
     if "name" in stats:
@@ -178,36 +230,22 @@ async def error_handler(update: Update, context: CallbackContext) -> None:
 
 
 
-def get_schedule_file_name(chat_id, schedule_type):
-    return os.path.join(SCHEDULES_DIR, f"{chat_id}_{schedule_type}.json")
-
-
 def load_schedule(chat_id, schedule_type, weekday_default, weekend_default):
-    file_name = get_schedule_file_name(chat_id, schedule_type)
-    if os.path.exists(file_name):
-        with open(file_name, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    else:
+    lazy_rollover.ensure(chat_id)
+    key = schedule_key(chat_id, schedule_type)
+    schedule = store.get(key)
+    if schedule is None:
         today = datetime.now(kyiv_tz).weekday()
         if today < 5:
-            schedule = weekday_default
+            schedule = Schedule.from_legacy(weekday_default)
         else:
-            schedule = weekend_default
-
-        with open(file_name, 'w', encoding='utf-8') as f:
-            json.dump(schedule, f, ensure_ascii=False, indent=4)
-        return schedule
+            schedule = Schedule.from_legacy(weekend_default)
+        store.put(key, schedule)
+    return schedule
 
 
 def save_schedule(chat_id, schedule_type, schedule):
-    file_name = get_schedule_file_name(chat_id, schedule_type)
-    sorted_schedule = dict(sorted(schedule.items(), key=lambda x: (x[0] == '00:00 - 01:00', x[0])))
-    try:
-        with open(file_name, 'w', encoding='utf-8') as f:
-            json.dump(sorted_schedule, f, ensure_ascii=False, indent=4)
-        logging.info(f"Schedule saved successfully: {file_name}")
-    except Exception as e:
-        logging.error(f"Failed to save schedule: {file_name}, Error: {e}")
+    store.put(schedule_key(chat_id, schedule_type), schedule)
 
 
 empty_weekday = {
@@ -247,46 +285,71 @@ def is_weekend(date):
     return date.weekday() in (5, 6)
 
 
-def get_stats_file_name(chat_id):
-    return os.path.join(STATS_DIR, f"{chat_id}.json")
-
-
 def load_statistics(chat_id):
-    file_name = get_stats_file_name(chat_id)
-    if os.path.exists(file_name):
-        try:
-            with open(file_name, 'r', encoding='utf-8') as f:
-                stats = json.load(f)
-                # Ensure each user has a currency field
-                for user_id, user_stats in stats.items():
-                    if 'currency' not in user_stats:
-                        user_stats['currency'] = 0
-                return stats
-        except Exception as e:
-            logging.error(f"Error loading statistics from {file_name}: {e}")
-            return {}
-    else:
+    key = stats_key(chat_id)
+    try:
+        lazy_rollover.ensure(chat_id)
+        stats = store.get(key)
+    except Exception as e:
+        logging.error(f"Error loading statistics for chat {chat_id}: {e}")
         return {}
+    if stats is None:
+        stats = {}
+        store.put(key, stats)
+    # Ensure each user has a currency field
+    for user_id, user_stats in stats.items():
+        if 'currency' not in user_stats:
+            user_stats['currency'] = 0
+    return stats
 
 
 def load_user_stats(chat_id, user_id):
-    file_name = os.path.join(STATS_DIR, f"{chat_id}.json")
-    if os.path.exists(file_name):
-        with open(file_name, 'r', encoding='utf-8') as f:
-            stats = json.load(f)
-            return stats.get(str(user_id), {})
-    return {}
+    return load_statistics(chat_id).get(str(user_id), {})
+
 
 def save_user_stats(chat_id, user_id, user_stats):
-    file_name = os.path.join(STATS_DIR, f"{chat_id}.json")
-    if os.path.exists(file_name):
-        with open(file_name, 'r', encoding='utf-8') as f:
-            stats = json.load(f)
-    else:
-        stats = {}
+    stats = load_statistics(chat_id)
     stats[str(user_id)] = user_stats
-    with open(file_name, 'w', encoding='utf-8') as f:
-        json.dump(stats, f, ensure_ascii=False, indent=4)
+    store.put(stats_key(chat_id), stats, rows=[str(user_id)])
+
+
+async def catch_up_rollover(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Перенос пропущених днів пише файли і може чекати на фоновий обхід - робимо це в потоці,
+    # тоді load_schedule/load_statistics в обробниках бачать чат уже перенесеним
+    chat = update.effective_chat
+    if chat and not lazy_rollover.is_current(chat.id):
+        await asyncio.to_thread(lazy_rollover.ensure, chat.id)
+
+
+async def track_users(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Passively fill the user directory from every update the bot sees
+    if not update.effective_chat:
+        return
+    chat_id = update.effective_chat.id
+    user_directory.remember(chat_id, update.effective_user)
+    if update.message and update.message.reply_to_message:
+        user_directory.remember(chat_id, update.message.reply_to_message.from_user)
+
+
+async def find_user_id(context, chat_id, username, chat_stats):
+    if not username:
+        return None
+    user_id = user_directory.find(chat_id, username)
+    if user_id:
+        return user_id
+
+    # Fall back to asking Telegram, but only about users we have not seen yet
+    for user in chat_stats:
+        if user_directory.knows(chat_id, user):
+            continue
+        try:
+            chat = await context.bot.get_chat(user)
+        except BadRequest:
+            continue
+        user_directory.remember(chat_id, chat)
+        if chat.username and chat.username.lower() == username.lower():
+            return user
+    return None
 
 
 def has_earned_today(user_stats):
@@ -329,7 +392,7 @@ async def earn(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_stats[user_id]["currency"] += earned_currency
     chat_stats[user_id]["last_earn"] = now.strftime("%Y-%m-%d %H:%M:%S")
 
-    save_statistics(chat_id, chat_stats)
+    save_user_stats(chat_id, user_id, chat_stats[user_id])
     await update.message.reply_text(f"Ви заробили {earned_currency} сяйва✨ з"
                                     f"а {hours_worked_yesterday} годин роботи вчора. Загальний баланс: {chat_stats[user_id]['currency']} сяйва✨.")
 
@@ -358,15 +421,7 @@ async def add_money_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     chat_stats = load_statistics(chat_id)
 
     # Find the target user ID by username
-    target_user_id = None
-    for user in chat_stats:
-        try:
-            chat = await context.bot.get_chat(user)
-            if chat.username == target_username:
-                target_user_id = user
-                break
-        except BadRequest:
-            continue
+    target_user_id = await find_user_id(context, chat_id, target_username, chat_stats)
 
     if not target_user_id:
         await update.message.reply_text(f"Користувача з ім'ям @{target_username} не знайдено.")
@@ -376,7 +431,7 @@ async def add_money_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         chat_stats[target_user_id] = {"total": 0, "daily": {}, "currency": 0, "name": "", "last_earn": None}
 
     chat_stats[target_user_id]["currency"] += amount
-    save_statistics(chat_id, chat_stats)
+    save_user_stats(chat_id, target_user_id, chat_stats[target_user_id])
 
     await update.message.reply_text(f"Користувачу @{target_username} було додано {amount} сяйва✨. Новий баланс: {chat_stats[target_user_id]['currency']} сяйва✨.")
 
@@ -405,15 +460,7 @@ async def set_money_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     chat_stats = load_statistics(chat_id)
 
     # Find the target user ID by username
-    target_user_id = None
-    for user in chat_stats:
-        try:
-            chat = await context.bot.get_chat(user)
-            if chat.username == target_username:
-                target_user_id = user
-                break
-        except BadRequest:
-            continue
+    target_user_id = await find_user_id(context, chat_id, target_username, chat_stats)
 
     if not target_user_id:
         await update.message.reply_text(f"Користувача з ім'ям @{target_username} не знайдено.")
@@ -423,7 +470,7 @@ async def set_money_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         chat_stats[target_user_id] = {"total": 0, "daily": {}, "currency": 0, "name": "", "last_earn": None}
 
     chat_stats[target_user_id]["currency"] = amount
-    save_statistics(chat_id, chat_stats)
+    save_user_stats(chat_id, target_user_id, chat_stats[target_user_id])
 
     await update.message.reply_text(f"Користувачу @{target_username} було встановлено {amount} сяйва✨. Новий баланс: {chat_stats[target_user_id]['currency']} сяйва✨.")
 
@@ -454,10 +501,9 @@ async def set_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             return
 
         # Check if the name is unique
-        for user_stats in chat_stats.values():
-            if user_stats.get("name") == custom_name:
-                await update.message.reply_text("Це ім'я вже використовується іншим користувачем.")
-                return
+        if name_index.is_taken(chat_id, custom_name, user_id):
+            await update.message.reply_text("Це ім'я вже використовується іншим користувачем.")
+            return
 
         # Check if the user has enough currency
         if chat_stats[user_id]["currency"] < 100:
@@ -467,43 +513,78 @@ async def set_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         # Deduct 100 currency units
         chat_stats[user_id]["currency"] -= 100
         chat_stats[user_id]["name"] = custom_name
-        save_statistics(chat_id, chat_stats)
+        save_user_stats(chat_id, user_id, chat_stats[user_id])
         await update.message.reply_text(f"Ваше ім'я було змінено на {custom_name}. Ваш новий баланс: {chat_stats[user_id]['currency']} сяйва✨.")
     else:
         await update.message.reply_text("Будь ласка, введіть ім'я після команди /setname.")
 
 
-def list_skins(directory):
-    skins = []
-    try:
-        for file_name in os.listdir(directory):
-            if file_name.endswith(('.png', '.jpg', '.jpeg')):
-                skins.append(file_name)
-        logger.info(f"Found skins in {directory}: {skins}")
-    except Exception as e:
-        logger.error(f"Error loading skins from {directory}: {e}")
-    return skins
+def get_skin_page(category, page_number):
+    return skin_catalog.page(SKIN_CATEGORIES.get(category), page_number, SKINS_PER_PAGE)
 
 
-def get_skin_page(category, page_number):
-    if category == "profile":
-        skins = list_skins(PROFILE_SKINS_DIR)
-    elif category == "kiss":
-        skins = list_skins(KISS_SKINS_DIR)
-    elif category == "hug":
-        skins = list_skins(HUG_SKINS_DIR)
-    elif category == "dance":
-        skins = list_skins(DANCE_SKINS_DIR)
-    else:
-        skins = []
+def shop_caption(category, skins, page_number, total_pages):
+    text = f"Available skins for {category} ({page_number + 1}/{total_pages}):\n"
+    # Номери - ті самі, що на картинці сторінки
+    for index, skin in enumerate(skins, 1):
+        text += f"{index}. `{skin.name}` - {skin.price} сяйва \n"
+    text += "\nUse `/buy_skin `*skin_name* to purchase a skin.\n"
+    return text
+
+
+def shop_keyboard(category, page_number, total_pages):
+    buttons = []
+    if page_number > 0:
+        buttons.append(InlineKeyboardButton("⬅️ Previous", callback_data=f"shop {page_number - 1} {category}"))
+    if page_number < total_pages - 1:
+        buttons.append(InlineKeyboardButton("Next ➡️", callback_data=f"shop {page_number + 1} {category}"))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+async def send_shop_page(context, chat_id, category, skins, page_number, total_pages):
+    """The whole page is one picture with the skin list and page buttons: a single request."""
+    path, version = await asyncio.to_thread(render_page, category, page_number, skins)
+    await photo_cache.send(lambda **kwargs: context.bot.send_photo(chat_id, **kwargs), path, version,
+                           caption=shop_caption(category, skins, page_number, total_pages), parse_mode='Markdown',
+                           reply_markup=shop_keyboard(category, page_number, total_pages))
 
-    start_index = page_number * SKINS_PER_PAGE
-    end_index = start_index + SKINS_PER_PAGE
-    return skins[start_index:end_index], len(skins)
+
+async def turn_shop_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    _, page, category = query.data.split()
+    page_number = int(page)
+    skins, total_skins = get_skin_page(category, page_number)
+    total_pages = (total_skins + SKINS_PER_PAGE - 1) // SKINS_PER_PAGE
+
+    if not skins:
+        await query.answer("Цієї сторінки більше немає.")
+        return
+
+    if not query.message.photo:
+        # Кнопки під текстом лишились від альбомів старої версії магазину - надсилаємо сторінку заново
+        await send_shop_page(context, chat_id, category, skins, page_number, total_pages)
+        await query.answer()
+        return
+
+    # Одна заміна фото разом з підписом і кнопками - один запит на сторінку
+    path, version = await asyncio.to_thread(render_page, category, page_number, skins)
+    try:
+        await photo_cache.edit(query.edit_message_media, path, version,
+                               caption=shop_caption(category, skins, page_number, total_pages), parse_mode='Markdown',
+                               reply_markup=shop_keyboard(category, page_number, total_pages))
+    except BadRequest as e:
+        if "not modified" not in str(e):
+            raise
+    await query.answer()
 
 
 # python
 async def shop_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if update.callback_query:
+        await turn_shop_page(update, context)
+        return
+
     if not context.args:
         text = "Please choose a category:\n"
         text += "`/shop profile` - Skins for profiles\n"
@@ -514,7 +595,7 @@ async def shop_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         return
 
     category = context.args[0].lower()
-    if category not in ["profile", "kiss", "hug", "dance"]:
+    if category not in SKIN_CATEGORIES:
         await update.message.reply_text("Invalid category. Please choose from profile, kiss, hug, or dance.")
         return
 
@@ -522,19 +603,11 @@ async def shop_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     skins, total_skins = get_skin_page(category, page_number)
     total_pages = (total_skins + SKINS_PER_PAGE - 1) // SKINS_PER_PAGE
 
-    text = f"Available skins for {category}:\n"
-    for skin in skins:
-        text += f"`{skin}` - 100 сяйва \n"
-
-    text += "\nUse `/buy_skin `*skin_name* to purchase a skin.\n"
-    text += "Use `/preview_skin `*skin_name* to preview.\n"
-
-    if page_number > 0:
-        text += f"`/shop {category} {page_number - 1}` - Previous\n"
-    if page_number < total_pages - 1:
-        text += f"`/shop {category} {page_number + 1}` - Next\n"
+    if not skins:
+        await update.message.reply_text(f"No skins for {category} on this page.")
+        return
 
-    await update.message.reply_text(text, parse_mode='Markdown')
+    await send_shop_page(context, update.effective_chat.id, category, skins, page_number, total_pages)
 
 
 async def buy_skin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -551,25 +624,17 @@ async def buy_skin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         return
 
     skin_name = context.args[0]
-    skin_found = False
-    skin_category = None
-
-    # Check all skin categories
-    for category in ["profile_skins", "kiss_skins", "hug_skins", "dance_skins"]:
-        available_skins = list_skins(os.path.join(SKINS_DIR, category))
-        if skin_name in available_skins:
-            skin_found = True
-            skin_category = category
-            break
-
-    if not skin_found:
+    skin = skin_catalog.find(skin_name)
+
+    if not skin:
         await update.message.reply_text("Скін не знайдено.")
         return
+    skin_category = skin.category
 
     user_stats = chat_stats[user_id]
     balance = user_stats.get('currency', 0)
 
-    skin_cost = 100
+    skin_cost = skin.price
     if balance < skin_cost:
         await update.message.reply_text("Недостатньо сяйва✨ для покупки цього скіна.")
         return
@@ -581,7 +646,7 @@ async def buy_skin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         user_stats['purchased_skins'][skin_category] = []
     user_stats['purchased_skins'][skin_category].append(skin_name)
     user_stats[f'{skin_category[:-1]}_skin'] = skin_name  # Set the last purchased skin as active
-    save_statistics(chat_id, chat_stats)
+    save_user_stats(chat_id, user_id, user_stats)
 
     await update.message.reply_text(f"Ви успішно придбали скіна {skin_name} з категорії {skin_category}.")
 
@@ -590,22 +655,13 @@ async def preview_skin_command(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.message.reply_text("Please specify the skin name.")
         return
 
-    skin_name = context.args[0]
-    skin_found = False
-    skin_path = ""
-
-    # Check all skin categories
-    for root, dirs, files in os.walk(SKINS_DIR):
-        if skin_name in files:
-            skin_found = True
-            skin_path = os.path.join(root, skin_name)
-            break
+    skin = skin_catalog.find(context.args[0])
 
-    if not skin_found:
+    if not skin:
         await update.message.reply_text("Skin not found. Please choose another skin.")
         return
 
-    await update.message.reply_photo(photo=open(skin_path, 'rb'))
+    await photo_cache.send(update.message.reply_photo, skin.path, skin.version)
 
 async def set_skin_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
@@ -624,8 +680,7 @@ async def set_skin_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     category = context.args[1].lower()
     skin_name = context.args[2]
 
-    available_skins = list_skins(os.path.join(SKINS_DIR, f"{category}_skins"))
-    if skin_name not in available_skins:
+    if not skin_catalog.find(skin_name, f"{category}_skins"):
         await update.message.reply_text("Скін не знайдено. Будь ласка, виберіть інший скін.")
         return
 
@@ -633,15 +688,7 @@ async def set_skin_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     chat_stats = load_statistics(chat_id)
 
     # Find the target user ID by username
-    target_user_id = None
-    for user in chat_stats:
-        try:
-            chat = await context.bot.get_chat(user)
-            if chat.username == target_username:
-                target_user_id = user
-                break
-        except BadRequest:
-            continue
+    target_user_id = await find_user_id(context, chat_id, target_username, chat_stats)
 
     if not target_user_id:
         await update.message.reply_text(f"Користувача з ім'ям @{target_username} не знайдено.")
@@ -655,7 +702,7 @@ async def set_skin_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     else:
         chat_stats[target_user_id][f"{category}_skin"] = skin_name
 
-    save_statistics(chat_id, chat_stats)
+    save_user_stats(chat_id, target_user_id, chat_stats[target_user_id])
 
     await update.message.reply_text(f"Користувачу @{target_username} було встановлено скин: {skin_name} для категорії {category}.")
 
@@ -674,13 +721,8 @@ async def change_skin_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
 
     skin_name = context.args[0]
-    category = None
-
-    # Determine the category of the skin
-    for cat in ["profile_skins", "kiss_skins", "hug_skins", "dance_skins"]:
-        if skin_name in list_skins(os.path.join(SKINS_DIR, cat)):
-            category = cat
-            break
+    skin = skin_catalog.find(skin_name)
+    category = skin.category if skin else None
 
     if not category:
         await update.message.reply_text("Скін не знайдено. Будь ласка, виберіть інший скін.")
@@ -696,24 +738,18 @@ async def change_skin_command(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     skin = skin_name
     user_stats[f'{category[:-1]}_skin'] = skin  # Set the selected skin as active
-    save_statistics(chat_id, chat_stats)
+    save_user_stats(chat_id, user_id, user_stats)
 
     await update.message.reply_text(f"Ви успішно змінили активний скін на {skin} з категорії {category}.")
 
 
 def save_statistics(chat_id, stats):
-    file_name = get_stats_file_name(chat_id)
-    try:
-        with open(file_name, 'w', encoding='utf-8') as f:
-            json.dump(stats, f, ensure_ascii=False, indent=4)
-        logging.info(f"Statistics saved successfully: {file_name}")
-    except Exception as e:
-        logging.error(f"Failed to save statistics: {file_name}, Error: {e}")
+    store.put(stats_key(chat_id), stats)
 
 
 async def get_user_stats_text(user_stats, user_name):
     profile_skin = user_stats.get('profile_skin_skin', None)
-    profile_skin_path = os.path.join(PROFILE_SKINS_DIR, profile_skin) if profile_skin else None
+    profile_skin = skin_catalog.find(profile_skin, "profile_skins") if profile_skin else None
 
     text = f"Статистика користувача {user_name}:\n"
     if user_stats.get("total", 0) > 0:
@@ -740,7 +776,7 @@ async def get_user_stats_text(user_stats, user_name):
         if skins:
             text += f"{category.capitalize()}: {', '.join(skins)}\n"
 
-    return text, profile_skin_path
+    return text, profile_skin
 
 
 async def my_stat(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -754,10 +790,10 @@ async def my_stat(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
     user_stats = chat_stats[user_id]
     user_name = get_user_name(user_stats, update.effective_user)
-    text, profile_skin_path = await get_user_stats_text(user_stats, user_name)
+    text, profile_skin = await get_user_stats_text(user_stats, user_name)
 
-    if profile_skin_path and os.path.exists(profile_skin_path):
-        await update.message.reply_photo(photo=open(profile_skin_path, 'rb'), caption=text)
+    if profile_skin:
+        await photo_cache.send(update.message.reply_photo, profile_skin.path, profile_skin.version, caption=text)
     else:
         await update.message.reply_text(text)
 
@@ -782,25 +818,17 @@ async def your_stat(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
     chat_stats = load_statistics(chat_id)
 
-    target_user_id = None
-    for user in chat_stats:
-        try:
-            chat = await context.bot.get_chat(user)
-            if chat.username == username:
-                target_user_id = user
-                break
-        except BadRequest:
-            continue
+    target_user_id = await find_user_id(context, chat_id, username, chat_stats)
 
     if not target_user_id or target_user_id not in chat_stats:
         await update.message.reply_text(f"У користувача @{username} немає статистики.")
         return
 
     user_stats = chat_stats[target_user_id]
-    text, profile_skin_path = await get_user_stats_text(user_stats, f"@{username}")
+    text, profile_skin = await get_user_stats_text(user_stats, f"@{username}")
 
-    if profile_skin_path and os.path.exists(profile_skin_path):
-        await update.message.reply_photo(photo=open(profile_skin_path, 'rb'), caption=text)
+    if profile_skin:
+        await photo_cache.send(update.message.reply_photo, profile_skin.path, profile_skin.version, caption=text)
     else:
         await update.message.reply_text(text)
 
@@ -812,13 +840,10 @@ async def remove_user_from_all_schedules(chat_id, user_id, update: Update, conte
 
     for schedule_type in ['today', 'tomorrow', 'default', 'weekday_default', 'weekend_default']:
         schedule = load_schedule(chat_id, schedule_type, empty_weekday, empty_weekend)
-        user_removed = False
-        for time_slot, users in schedule.items():
-            if user_id in users:
-                users.remove(user_id)
-                user_removed = True
-                logging.info(f"Removed user {user_id} from {time_slot} in {schedule_type} schedule.")
-        if user_removed:
+        removed = schedule.remove_user(user_id)
+        for time_slot in mask_slots(removed):
+            logging.info(f"Removed user {user_id} from {time_slot} in {schedule_type} schedule.")
+        if removed:
             save_schedule(chat_id, schedule_type, schedule)
             await update.message.reply_text(
                 f"{user_id} видалено з усіх графіків.")
@@ -862,15 +887,7 @@ async def confirm_reset_stat_text(update: Update, context: ContextTypes.DEFAULT_
         if target_identifier.isdigit():
             target_user_id = int(target_identifier)
         else:
-            target_user_id = None
-            for user in chat_stats:
-                try:
-                    chat = await context.bot.get_chat(user)
-                    if chat.username == target_identifier:
-                        target_user_id = user
-                        break
-                except BadRequest:
-                    continue
+            target_user_id = await find_user_id(context, chat_id, target_identifier, chat_stats)
         # Remove user from all schedules
         await remove_user_from_all_schedules(chat_id, target_user_id, update, context)
 
@@ -888,31 +905,84 @@ async def confirm_reset_stat_text(update: Update, context: ContextTypes.DEFAULT_
         await update.message.reply_text("Скидання статистики скасовано.")
 
 
+def get_display_name(stats, user, user_id):
+    if user:
+        return get_user_name(stats, user)
+    return stats.get("name") or f"unknown: {user_id}"
+
+
 async def top_earners(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
     chat_stats = load_statistics(chat_id)
 
-    top_users = sorted(chat_stats.items(), key=lambda x: x[1].get('currency', 0), reverse=True)[:10]
+    top_users = leaderboards.top(chat_id, "currency", TOP_SIZE)
+    users = await resolve_users(context.bot, [user_id for user_id, _ in top_users])
     text = "Топ користувачів за кількістю сяйва✨:\n"
-    for user_id, stats in top_users:
-        chat = await context.bot.get_chat(user_id)
-        user_name = get_user_name(stats, chat)
-        currency = stats.get('currency', 0)
+    for user_id, currency in top_users:
+        user_name = get_display_name(chat_stats.get(user_id, {}), users[user_id], user_id)
         text += f"{user_name}: {currency} сяйва✨\n"
 
     await update.message.reply_text(text)
 
 
+def parse_day(text):
+    for date_format in ("%d.%m.%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            pass
+    return None
+
+
+def parse_top_period(args):
+    """(first_day, last_day) of "week", "month" or "<from> [<to>]", None if the arguments are invalid."""
+    yesterday = datetime.now(kyiv_tz).date() - timedelta(days=1)
+    period = args[0].lower()
+    if period in ("week", "тиждень"):
+        return yesterday - timedelta(days=6), yesterday
+    if period in ("month", "місяць"):
+        return yesterday - timedelta(days=29), yesterday
+    first_day = parse_day(args[0])
+    last_day = parse_day(args[1]) if len(args) > 1 else yesterday
+    if not first_day or not last_day or first_day > last_day:
+        return None
+    return first_day, last_day
+
+
+async def top_workers_for_period(update: Update, context: ContextTypes.DEFAULT_TYPE, first_day, last_day) -> None:
+    chat_id = update.effective_chat.id
+    chat_stats = load_statistics(chat_id)
+
+    top_users = hours_history.top(chat_id, first_day, last_day, TOP_SIZE)
+    users = await resolve_users(context.bot, [user_id for user_id, _ in top_users])
+    text = f"Топ користувачів за кількістю годин з {first_day:%d.%m.%Y} по {last_day:%d.%m.%Y}:\n"
+    for user_id, hours in top_users:
+        user_name = get_display_name(chat_stats.get(user_id, {}), users[user_id], user_id)
+        text += f"{user_name}: {hours} годин\n"
+    if not top_users:
+        text += "Немає даних за цей період.\n"
+
+    await update.message.reply_text(text)
+
+
 async def top_workers(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if context.args:
+        period = parse_top_period(context.args)
+        if not period:
+            await update.message.reply_text(
+                "Будь ласка, використовуйте формат: /top week, /top month або /top дд.мм.рррр [дд.мм.рррр]")
+            return
+        await top_workers_for_period(update, context, *period)
+        return
+
     chat_id = update.effective_chat.id
     chat_stats = load_statistics(chat_id)
 
-    top_users = sorted(chat_stats.items(), key=lambda x: x[1].get('total', 0), reverse=True)[:10]
+    top_users = leaderboards.top(chat_id, "total", TOP_SIZE)
+    users = await resolve_users(context.bot, [user_id for user_id, _ in top_users])
     text = "Топ користувачів за загальною кількістю годин:\n"
-    for user_id, stats in top_users:
-        chat = await context.bot.get_chat(user_id)
-        user_name = get_user_name(stats, chat)
-        total_hours = stats.get('total', 0)
+    for user_id, total_hours in top_users:
+        user_name = get_display_name(chat_stats.get(user_id, {}), users[user_id], user_id)
         text += f"{user_name}: {total_hours} годин\n"
 
     await update.message.reply_text(text)
@@ -922,23 +992,19 @@ async def top_yesterday(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     chat_id = update.effective_chat.id
     chat_stats = load_statistics(chat_id)
 
+    # Skip users that Telegram no longer knows about, resolving only as many places as needed
     top_users = []
-    for user_id, stats in chat_stats.items():
-        total_day_hours = stats.get('yesterday', 0)
-        try:
-            chat = await context.bot.get_chat(user_id)
-            top_users.append((user_id, total_day_hours))
-        except BadRequest as e:
-            logging.error(f"Failed to get chat for user_id {user_id}: {e}")
+    start = 0
+    while len(top_users) < TOP_SIZE and start < leaderboards.size(chat_id, "yesterday"):
+        places = leaderboards.top(chat_id, "yesterday", TOP_SIZE, start)
+        start += len(places)
+        users = await resolve_users(context.bot, [user_id for user_id, _ in places])
+        top_users += [(user_id, hours, users[user_id]) for user_id, hours in places if users[user_id]]
 
-    top_users = sorted(top_users, key=lambda x: x[1], reverse=True)[:10]
     text = "Топ користувачів за кількістю годин за вчорашній день:\n"
-    for user_id, total_day_hours in top_users:
-        try:
-            user_name = get_user_name(chat_stats[user_id], await context.bot.get_chat(user_id))
-            text += f"{user_name}: {total_day_hours} годин\n"
-        except BadRequest as e:
-            logging.error(f"Failed to get chat for user_id {user_id}: {e}")
+    for user_id, total_day_hours, user in top_users[:TOP_SIZE]:
+        user_name = get_user_name(chat_stats.get(user_id, {}), user)
+        text += f"{user_name}: {total_day_hours} годин\n"
 
     await update.message.reply_text(text)
 
@@ -948,13 +1014,12 @@ async def all_stat(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_stats = load_statistics(chat_id)
 
     user_stats_summary = {}
+    users = await resolve_users(context.bot, chat_stats.keys())
 
     for user_id, stats in chat_stats.items():
-        try:
-            chat = await context.bot.get_chat(user_id)
-            user_name = get_user_name(chat_stats[user_id], await context.bot.get_chat(user_id))
-            # Update the name in the statistics if it has changed
-        except BadRequest:
+        if users[user_id]:
+            user_name = get_user_name(stats, users[user_id])
+        else:
             user_name = f"unknown: {user_id}"
 
         if user_name not in user_stats_summary:
@@ -977,84 +1042,204 @@ async def top_workers_weekly(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("Немає статистики для цього чату.")
         return
 
-    # Calculate weekly hours for all users
-    weekly_stats = {}
-    for user_id, stats in chat_stats.items():
-        weekly_hours = sum(stats.get('daily', {}).values())
-        weekly_stats[user_id] = weekly_hours
-
-    # Sort users by weekly hours
-    top_users = sorted(weekly_stats.items(), key=lambda x: x[1], reverse=True)[:5]
+    # Останні сім повних днів
+    yesterday = datetime.now(kyiv_tz).date() - timedelta(days=1)
+    top_users = hours_history.top(chat_id, yesterday - timedelta(days=6), yesterday, 5)
 
     text = "*Топ користувачів за тиждень:*\n"
     for rank, (user_id, hours) in enumerate(top_users, 1):
-        user_name = chat_stats[user_id].get('name', f"User {user_id}")
+        user_name = chat_stats.get(user_id, {}).get('name', f"User {user_id}")
         text += f"{rank}. {user_name}: *{hours}* годин\n"
 
     await update.message.reply_text(text, parse_mode='Markdown')
 
 
+async def coverage_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    chat_id = update.effective_chat.id
+    chat_stats = load_statistics(chat_id)
+
+    days = COVERAGE_DAYS
+    if context.args:
+        if not context.args[0].isdigit() or not 0 < int(context.args[0]) <= HISTORY_DAYS:
+            await update.message.reply_text(f"Будь ласка, використовуйте формат: /coverage [кількість днів до {HISTORY_DAYS}]")
+            return
+        days = int(context.args[0])
+
+    yesterday = datetime.now(kyiv_tz).date() - timedelta(days=1)
+    first_day, masks, enabled, user_ids = hours_history.window(chat_id, yesterday - timedelta(days=days - 1), yesterday)
+    defaults = {
+        "Будні": load_schedule(chat_id, "weekday_default", empty_weekday, empty_weekday),
+        "Вихідні": load_schedule(chat_id, "weekend_default", empty_weekend, empty_weekend),
+    }
+    coverage = compute_coverage(first_day, masks, enabled, user_ids, defaults)
+
+    shown = [user_id for user_id, _ in coverage.shares(TOP_SIZE)]
+    users = await resolve_users(context.bot, shown)
+    names = {user_id: get_display_name(chat_stats.get(user_id, {}), users[user_id], user_id) for user_id in shown}
+    await update.message.reply_text(render_coverage(coverage, names, shares_count=TOP_SIZE), parse_mode='HTML')
+
+
+async def get_chat_title(bot, chat_id):
+    try:
+        chat = await bot.get_chat(chat_id)
+    except Exception as e:
+        logger.warning(f"Failed to get chat {chat_id}: {e}")
+        return str(chat_id)
+    return chat.title or str(chat_id)
+
+
+async def global_top(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # /global_top - за годинами, /global_top сяйво - за сяйвом
+    metric = "currency" if context.args and context.args[0].lower() in ("сяйво", "currency") else "total"
+    unit = "сяйва✨" if metric == "currency" else "годин"
+
+    if not global_stats.ready:
+        # Суми ще будуються після запуску: чекаємо в потоці, а не в циклі подій
+        await asyncio.to_thread(global_stats.build)
+    top_users = global_stats.top("users", metric, TOP_SIZE)
+    top_chats = global_stats.top("chats", metric, GLOBAL_TOP_CHATS)
+    users = await resolve_users(context.bot, [user_id for user_id, _ in top_users])
+    titles = await asyncio.gather(*(get_chat_title(context.bot, chat_id) for chat_id, _ in top_chats))
+
+    text = "Топ користувачів у всіх чатах:\n"
+    for user_id, value in top_users:
+        user_name = get_display_name({}, users[user_id], user_id)
+        text += f"{user_name}: {value} {unit}\n"
+    text += "\nТоп чатів:\n"
+    for (chat_id, value), title in zip(top_chats, titles):
+        text += f"{title}: {value} {unit}\n"
+
+    await update.message.reply_text(text)
+
+
+def rollover_fallbacks(today_date):
+    """Templates of the schedules a rollover into today_date reads, for chats that have none of them stored."""
+    tomorrow_date = today_date + timedelta(days=1)
+    default_type = "weekend_default" if is_weekend(tomorrow_date) else "weekday_default"
+    return {
+        "tomorrow": empty_weekend if is_weekend(today_date) else empty_weekday,
+        default_type: empty_weekend if is_weekend(tomorrow_date) else empty_weekday,
+    }
+
+
+def sqlite_fallbacks(today_date):
+    return {schedule_type: Schedule.from_legacy(template)
+            for schedule_type, template in rollover_fallbacks(today_date).items()}
+
+
+def rollover_chat(chat_id, today_date):
+    tomorrow_date = today_date + timedelta(days=1)
+    previos_date = today_date - timedelta(days=1)
+    fallbacks = rollover_fallbacks(today_date)
+
+    # SQLite backend rolls the chat over with a few set-based queries
+    if hasattr(store.backend, "rollover"):
+        with store.lock:
+            store.flush()
+            today_schedule = store.backend.read_today_schedules(chat_id).get(str(chat_id))
+            store.backend.rollover(previos_date.weekday(), is_weekend(tomorrow_date), chat_id,
+                                   sqlite_fallbacks(today_date))
+            store.invalidate_chat(chat_id)
+        if today_schedule:
+            hours_history.record_day(chat_id, previos_date.date(), today_schedule)
+        leaderboards.invalidate(chat_id)
+        global_stats.sync_chat(chat_id)
+        mark_rolled_through(chat_id, today_date.date())
+        return
+
+    today_schedule = load_schedule(chat_id, "today", empty_weekday, empty_weekend)
+    tomorrow_schedule = load_schedule(chat_id, "tomorrow", fallbacks["tomorrow"], fallbacks["tomorrow"])
+    hours_history.record_day(chat_id, previos_date.date(), today_schedule)
+
+    # Calculate statistics for today's schedule
+    today_stats = {str(user_id): hours for user_id, hours in today_schedule.hours().items()}
+
+    # Load previous statistics for the chat
+    chat_stats = load_statistics(chat_id)
+
+    # Reset yesterday's hours for all users
+    for user_id in chat_stats:
+        chat_stats[user_id]['yesterday'] = 0
+
+    # Update total hours worked for each user
+    for user_id, hours in today_stats.items():
+        # Initialize user statistics if not already present
+        if user_id not in chat_stats:
+            chat_stats[user_id] = {"total": 0, "daily": {}, "yesterday": 0}
+
+        chat_stats[user_id]["total"] += hours
+
+        # Update daily statistics for the user
+        weekday = previos_date.weekday()  # Це індекс дня тижня (0 для Понеділка і т.д.)
+        daily_stats = chat_stats[user_id].get('daily', {})
+        if str(weekday) not in daily_stats:
+            daily_stats[str(weekday)] = hours
+        else:
+            daily_stats[str(weekday)] += hours
+        chat_stats[user_id]['daily'] = daily_stats
+
+        # Update yesterday's hours
+        chat_stats[user_id]['yesterday'] = hours
+
+    # Save updated statistics for the chat
+    save_statistics(chat_id, chat_stats)
+
+    # Update schedules for today and tomorrow
+    today_schedule = tomorrow_schedule.copy()
+    default_type = "weekend_default" if is_weekend(tomorrow_date) else "weekday_default"
+    default_for_tomorrow = load_schedule(chat_id, default_type, fallbacks[default_type], fallbacks[default_type])
+    tomorrow_schedule = default_for_tomorrow.copy()
+
+    save_schedule(chat_id, "today", today_schedule)
+    save_schedule(chat_id, "tomorrow", tomorrow_schedule)
+    mark_rolled_through(chat_id, today_date.date())
+
+
+def before_rollover(chat_id):
+    # Pending journal entries belong to the old day, write them out before shifting
+    journal.compact()
+    journal.clear_undo(chat_id)
+
+
+# Кожен чат переноситься на новий день при першому зверненні після півночі
+lazy_rollover = LazyRollover(rollover_chat, kyiv_tz, before_rollover)
+
+
 def update_schedules():
+    """Forced rollover of every chat at once, used by /update."""
     today_date = datetime.now(kyiv_tz)
     tomorrow_date = today_date + timedelta(days=1)
     previos_date = today_date - timedelta(days=1)
 
-    for file_name in os.listdir(SCHEDULES_DIR):
-        if file_name.endswith("_today.json"):
-            chat_id = file_name.split("_")[0]
-            today_schedule = load_schedule(chat_id, "today", empty_weekday, empty_weekend)
-            tomorrow_schedule = load_schedule(chat_id, "tomorrow", empty_weekday, empty_weekend)
-
-            # Calculate statistics for today's schedule
-            today_stats = {}
-            for time_slot, user_ids in today_schedule.items():
-                for user_id in user_ids:
-                    user_id = str(user_id)  # Ensure user_id is string
-                    if user_id not in today_stats:
-                        today_stats[user_id] = 1
-                    else:
-                        today_stats[user_id] += 1
-
-            # Load previous statistics for the chat
-            chat_stats = load_statistics(chat_id)
-
-            # Reset yesterday's hours for all users
-            for user_id in chat_stats:
-                chat_stats[user_id]['yesterday'] = 0
-
-            # Update total hours worked for each user
-            for user_id, hours in today_stats.items():
-                # Initialize user statistics if not already present
-                if user_id not in chat_stats:
-                    chat_stats[user_id] = {"total": 0, "daily": {}, "yesterday": 0}
-
-                chat_stats[user_id]["total"] += hours
-
-                # Update daily statistics for the user
-                weekday = previos_date.weekday()  # Це індекс дня тижня (0 для Понеділка і т.д.)
-                daily_stats = chat_stats[user_id].get('daily', {})
-                if str(weekday) not in daily_stats:
-                    daily_stats[str(weekday)] = hours
-                else:
-                    daily_stats[str(weekday)] += hours
-                chat_stats[user_id]['daily'] = daily_stats
-
-                # Update yesterday's hours
-                chat_stats[user_id]['yesterday'] = hours
-
-            # Save updated statistics for the chat
-            save_statistics(chat_id, chat_stats)
-
-            # Update schedules for today and tomorrow
-            today_schedule = copy.deepcopy(tomorrow_schedule)
-            if is_weekend(tomorrow_date):
-                default_for_tomorrow = load_schedule(chat_id, "weekend_default", empty_weekday, empty_weekend)
-            else:
-                default_for_tomorrow = load_schedule(chat_id, "weekday_default", empty_weekday, empty_weekend)
-            tomorrow_schedule = copy.deepcopy(default_for_tomorrow)
-
-            save_schedule(chat_id, "today", today_schedule)
-            save_schedule(chat_id, "tomorrow", tomorrow_schedule)
+    # SQLite backend rolls every chat over with a few set-based queries
+    if hasattr(store.backend, "rollover"):
+        started = time.perf_counter()
+        # Pending journal entries belong to the old day. Compaction, the shift and dropping the cache
+        # happen without a gap, or an edit made in between would be dropped with the cache
+        with journal.exclusive():
+            journal.compact()
+            journal.clear_undo()
+            store.flush()
+            today_schedules = store.backend.read_today_schedules()
+            chats = store.backend.rollover(previos_date.weekday(), is_weekend(tomorrow_date),
+                                           fallbacks=sqlite_fallbacks(today_date))
+            store.invalidate()
+        leaderboards.invalidate()
+        for chat_id, today_schedule in today_schedules.items():
+            hours_history.record_day(chat_id, previos_date.date(), today_schedule)
+        for chat_id in chats:
+            global_stats.sync_chat(chat_id)
+            mark_rolled_through(chat_id, today_date.date())
+        return f"Rollover finished: {len(chats)} chats in {time.perf_counter() - started:.2f}s"
+
+    # Pending journal entries belong to the old day, write them out before shifting
+    journal.compact()
+    journal.clear_undo()
+
+    # Every chat is independent, so they are rolled over in parallel
+    report = run_rollover(rollover_chat, store.backend.list_chats(), today_date,
+                          workers=ROLLOVER_WORKERS, executor=ROLLOVER_EXECUTOR)
+    return report.summary()
 
 
 # def process_hours(input_range):
@@ -1089,32 +1274,58 @@ def update_schedules():
 #     return time_slots
 
 
+async def get_schedule_names(schedule, chat_id, bot):
+    """(names, resolved): every user in the schedule mapped to the name shown in it, resolving all of them at once.
+
+    ``resolved`` is False when some user could not be looked up and is shown as "unknown".
+    """
+    chat_stats = load_statistics(chat_id)
+    user_ids = [str(user_id) for user_id in schedule.user_ids()]
+    names = {}
+    missing = []
+    for user_id in user_ids:
+        if user_id in chat_stats and chat_stats[user_id].get("name"):
+            names[user_id] = chat_stats[user_id]["name"]
+        else:
+            missing.append(user_id)
+
+    resolved = True
+    for user_id, user in (await resolve_users(bot, missing)).items():
+        names[user_id] = user.display_name if user else "unknown"
+        resolved = resolved and user is not None
+    return names, resolved
+
+
 async def get_schedule_text(schedule, date_label, context, update):
+    chat_id = update.effective_chat.id
+    key = render_key(chat_id, schedule, date_label, name_index.version(chat_id))
+    text = render_cache.get(key)
+    if text is not None:
+        return text
+
     text = f"Графік роботи Адміністраторів на {date_label}\n\n"
+    names, resolved = await get_schedule_names(schedule, chat_id, context.bot)
 
     for time_slot, user_ids in schedule.items():
-        admins = []
-        for user_id in user_ids:
-            user_id = str(user_id)
-            chat_stats = load_statistics(update.effective_chat.id)
-            if user_id in chat_stats and chat_stats[user_id].get("name"):
-                admins.append(chat_stats[user_id]["name"])
-            else:
-                try:
-                    chat = await context.bot.get_chat(user_id)
-                    if chat.first_name:
-                        admins.append(format_name(chat.first_name))
-                    else:
-                        admins.append("–")
-                except BadRequest:
-                    admins.append("unknown")
-
+        admins = [names[str(user_id)] for user_id in user_ids]
         admins_str = ' – '.join(admins) if admins else "–"
         text += f"{time_slot} – {admins_str}\n"
 
+    # Текст з "unknown" після збою get_chat не кешуємо, наступного разу ім'я знайдеться
+    if resolved:
+        render_cache.set(key, text)
     return text
 
 
+def get_date_label(schedule_type):
+    return {
+        "today": datetime.now(kyiv_tz).strftime("%d.%m.%Y"),
+        "tomorrow": (datetime.now(kyiv_tz) + timedelta(days=1)).strftime("%d.%m.%Y"),
+        "weekday_default": "стандартний графік (будній день)",
+        "weekend_default": "стандартний графік (вихідний день)"
+    }.get(schedule_type, "незнайомий графік")
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
     logging.info(f"Starting conversation with user: {user.first_name}")
@@ -1131,7 +1342,9 @@ async def mechanical_update_schedules_admin(update: Update, context: ContextType
         await update.message.reply_text("У вас немає прав доступу до цієї команди.")
         return
 
-    await update.message.reply_text("Графік змінено", update_schedules())
+    # Перенос усіх чатів триває довго, цикл подій тим часом обслуговує інші оновлення
+    summary = await asyncio.get_running_loop().run_in_executor(None, update_schedules)
+    await update.message.reply_text(f"Графік змінено\n{summary}")
 
 
 async def show_today_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1174,6 +1387,24 @@ async def show_weekend_default_schedule(update: Update, context: ContextTypes.DE
     await update.message.reply_text(text)
 
 
+def apply_schedule_edit(chat_id, schedule_type, user_id, compiled):
+    """Applies a compiled edit to the cached schedule and journals it; returns the diff.
+
+    Runs under the store lock like the forced /update rollover, so the day can
+    not be shifted between the edit and its journal entry.
+    """
+    key = schedule_key(chat_id, schedule_type)
+    schedule = load_schedule(chat_id, schedule_type, empty_weekday, empty_weekend)
+    with store.lock:
+        # Якщо тим часом /update переніс день, у кеші вже новий графік
+        current = store.get(key)
+        if current is not None:
+            schedule = current
+        diff = apply_edit(schedule, user_id, compiled, allow_force_remove=user_id in ADMIN_IDS)
+        journal.record(chat_id, schedule_type, user_id, diff.journal_ops())
+    return diff
+
+
 async def edit_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     message = update.message.text.strip()
     chat_id = update.effective_chat.id
@@ -1207,118 +1438,58 @@ async def edit_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     if not schedule_type:
         return
 
-    schedule = load_schedule(chat_id, schedule_type, empty_weekday, empty_weekend)
-    operations = message.split(',')
-    updated_hours = []
-    invalid_hours = []
-    op_type = None  # Initialize op_type
-
-    for operation in operations:
-        operation = operation.strip()
-        if not (operation.startswith('+') or operation.startswith('-')):
-            continue
-
-        op_type = 'remove' if operation[0] == '-' else 'add'
-        hours_range = operation[1:].strip().rstrip('!')
-        add_hours = operation.endswith('!') and op_type == 'add'
-        remove_hours = operation.endswith('!') and op_type == 'remove' and user_id in ADMIN_IDS
-
-        try:
-            if '-' in hours_range:
-                start_time, end_time = hours_range.split('-')
-                start_hour = int(start_time.split(':')[0])
-                end_hour = int(end_time.split(':')[0])
-                if start_hour < 0 or end_hour > 24 or start_hour >= end_hour:
-                    raise ValueError
-                for hour in range(start_hour, end_hour):
-                    time_slot = f"{hour % 24:02d}:00 - {(hour + 1) % 24:02d}:00"
-                    if op_type == 'add':
-                        if add_hours and time_slot not in schedule:
-                            schedule[time_slot] = []
-                        if user_id not in schedule[time_slot]:
-                            schedule[time_slot].append(user_id)
-                            updated_hours.append(time_slot)
-                    elif op_type == 'remove':
-                        if remove_hours and time_slot in schedule:
-                            del schedule[time_slot]
-                        if time_slot in schedule and user_id in schedule[time_slot]:
-                            schedule[time_slot].remove(user_id)
-                            updated_hours.append(time_slot)
-            else:
-                hour = int(hours_range.split(':')[0])
-                if hour < 0 or hour > 24:
-                    raise ValueError
-                time_slot = f"{hour % 24:02d}:00 - {(hour + 1) % 24:02d}:00"
-                if op_type == 'add':
-                    if add_hours and time_slot not in schedule:
-                        schedule[time_slot] = []
-                    if user_id not in schedule[time_slot]:
-                        schedule[time_slot].append(user_id)
-                        updated_hours.append(time_slot)
-                elif op_type == 'remove':
-                    if remove_hours and time_slot in schedule:
-                        del schedule[time_slot]
-                    if time_slot in schedule and user_id in schedule[time_slot]:
-                        schedule[time_slot].remove(user_id)
-                        updated_hours.append(time_slot)
-        except ValueError:
-            invalid_hours.append(operation)
-        except KeyError:
-            await update.message.reply_text(
-                f"Будь ласка, введіть правильний час(від 0 до 24). "
-                f"Для {'додавання' if op_type == 'add' else 'видалення'} неіснуючої години використовуйте ! "
-                f"в кінці, наприклад: {'+' if op_type == 'add' else '-'}{hours_range}!"
-            )
-            return
+    compiled = compile_edit(message)
 
-    save_schedule(chat_id, schedule_type, schedule)
+    try:
+        diff = apply_schedule_edit(chat_id, schedule_type, user_id, compiled)
+    except MissingSlotsError as e:
+        await update.message.reply_text(
+            f"Будь ласка, введіть правильний час(від 0 до 24). "
+            f"Для {'додавання' if e.op.is_add else 'видалення'} неіснуючої години використовуйте ! "
+            f"в кінці, наприклад: {e.op.text}!"
+        )
+        return
 
-    if updated_hours:
-        start_time = updated_hours[0].split('-')[0]
-        end_time = updated_hours[-1].split('-')[1]
-        response_message = f"{user_name} було {'додано до' if op_type == 'add' else 'видалено з'} графіка на {start_time} - {end_time}."
-    else:
-        response_message = f"Не вдалося {'додати години' if op_type == 'add' else 'видалити години'}."
+    response_message = diff.describe(user_name)
 
-    if invalid_hours:
+    if compiled.invalid:
         await update.message.reply_text(
             f"Будь ласка, введіть правильний час(від 0 до 24). "
         )
-    date_label = {
-        "today": datetime.now(kyiv_tz).strftime("%d.%m.%Y"),
-        "tomorrow": (datetime.now(kyiv_tz) + timedelta(days=1)).strftime("%d.%m.%Y"),
-        "weekday_default": "стандартний графік (будній день)",
-        "weekend_default": "стандартний графік (вихідний день)"
-    }.get(schedule_type, "незнайомий графік")
 
-    sorted_schedule = sorted(schedule.items(), key=lambda x: (x[0] == '00:00 - 01:00', x[0]))
-    updated_schedule_message = f"Графік роботи Адміністраторів на {date_label}\n\n"
-    for time_slot, users in sorted_schedule:
-        user_names = []
-        for user_id in users:
-            user_id = str(user_id)
-            chat_stats = load_statistics(update.effective_chat.id)
-            if user_id in chat_stats and chat_stats[user_id].get("name"):
-                user_names.append(chat_stats[user_id]["name"])
-            else:
-                try:
-                    chat = await context.bot.get_chat(user_id)
-                    if chat.first_name:
-                        user_names.append(format_name(chat.first_name))
-                    else:
-                        user_names.append("–")
-                except BadRequest:
-                    user_names.append("unknown")
-
-        user_names_str = ' – '.join(user_names) if user_names else "–"
-        updated_schedule_message += f"{time_slot}: {user_names_str}\n"
-
-    try:
-        await update.message.reply_to_message.edit_text(updated_schedule_message + '\n' + response_message)
-    except Exception as e:
+    async def render():
+        # Рендеримо на момент відправки, щоб у повідомленні були всі зібрані правки
+        current = load_schedule(chat_id, schedule_type, empty_weekday, empty_weekend)
+        names, _ = await get_schedule_names(current, chat_id, context.bot)
+        updated_schedule_message = f"Графік роботи Адміністраторів на {get_date_label(schedule_type)}\n\n"
+        for time_slot, users in current.items():
+            user_names = [names[str(user_id)] for user_id in users]
+            user_names_str = ' – '.join(user_names) if user_names else "–"
+            updated_schedule_message += f"{time_slot}: {user_names_str}\n"
+        return updated_schedule_message
+
+    async def on_error(e):
         await update.message.reply_text("Не вдалося редагувати повідомлення. Спробуйте ще раз.")
-        print(e)
 
+    # Правки одного повідомлення від кількох людей підряд йдуть одним edit_text
+    reply_to = update.message.reply_to_message
+    await schedule_edits.submit((chat_id, reply_to.message_id), response_message, render, reply_to.edit_text, on_error)
+
+
+
+async def undo_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    chat_id = update.effective_chat.id
+    user_id = update.effective_user.id
+
+    # Адміни можуть скасувати останню зміну будь-кого, інші - лише свою
+    entry = journal.undo(chat_id, None if user_id in ADMIN_IDS else user_id)
+    if not entry:
+        await update.message.reply_text("Немає змін графіка, які можна скасувати.")
+        return
+
+    schedule = load_schedule(chat_id, entry["type"], empty_weekday, empty_weekend)
+    text = await get_schedule_text(schedule, get_date_label(entry["type"]), context, update)
+    await update.message.reply_text(text + "\nОстанню зміну графіка скасовано.")
 
 
 async def leave(update: Update, context):
@@ -1340,7 +1511,7 @@ async def hug_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     target_username = command_text.split(" ", 1)[1].lstrip('@') if " " in command_text else None
 
     if target_username:
-        target_user_id = next((user_id for user_id, stats in chat_stats.items() if stats.get("name") == target_username), None)
+        target_user_id = name_index.find(chat_id, target_username)
     elif update.message.reply_to_message:
         target_user_id = str(update.message.reply_to_message.from_user.id)
     else:
@@ -1366,9 +1537,10 @@ async def hug_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     else:
         response_message = f"{source_user_link} обійня(ла/в) {target_user_link} 😘"
 
-    if source_user_id in chat_stats and "hug_skin" in chat_stats[source_user_id]:
-        skin = chat_stats[source_user_id]["hug_skin"]
-        await update.message.reply_photo(photo=open(os.path.join(HUG_SKINS_DIR, skin), 'rb'), caption=response_message, parse_mode='Markdown')
+    skin = skin_catalog.find(chat_stats[source_user_id]["hug_skin"], "hug_skins") \
+        if source_user_id in chat_stats and "hug_skin" in chat_stats[source_user_id] else None
+    if skin:
+        await photo_cache.send(update.message.reply_photo, skin.path, skin.version, caption=response_message, parse_mode='Markdown')
     else:
         await update.message.reply_text(response_message, parse_mode='Markdown')
 
@@ -1390,7 +1562,7 @@ async def kiss_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     logger.info(f"Target username: {target_username}")
 
     if target_username:
-        target_user_id = next((user_id for user_id, stats in chat_stats.items() if stats.get("name") == target_username), None)
+        target_user_id = name_index.find(chat_id, target_username)
     elif update.message.reply_to_message:
         target_user_id = str(update.message.reply_to_message.from_user.id)
     else:
@@ -1421,14 +1593,13 @@ async def kiss_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 
     if user_id in chat_stats and "kiss_skin_skin" in chat_stats[user_id]:
         kiss_skin = chat_stats[user_id]["kiss_skin_skin"]
-        kiss_skin_path = os.path.join(KISS_SKINS_DIR, kiss_skin)
-        logger.info(f"Kiss skin path: {kiss_skin_path}")
+        skin = skin_catalog.find(kiss_skin, "kiss_skins")
 
-        if os.path.exists(kiss_skin_path):
-            logger.info(f"Sending photo from path: {kiss_skin_path}")
-            await update.message.reply_photo(photo=open(kiss_skin_path, 'rb'), caption=response_message, parse_mode='Markdown')
+        if skin:
+            logger.info(f"Sending photo from path: {skin.path}")
+            await photo_cache.send(update.message.reply_photo, skin.path, skin.version, caption=response_message, parse_mode='Markdown')
         else:
-            logger.warning(f"Kiss skin path does not exist: {kiss_skin_path}")
+            logger.warning(f"Kiss skin does not exist: {kiss_skin}")
             await update.message.reply_text(response_message, parse_mode='Markdown')
     else:
         logger.info("No kiss skin found, sending text response.")
@@ -1459,7 +1630,7 @@ async def set_gender(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
             return
         user_stats['currency'] -= 100
     user_stats['gender'] = gender
-    save_statistics(chat_id, chat_stats)
+    save_user_stats(chat_id, user_id, user_stats)
 
     await update.message.reply_text(f"Ваша стать була встановлена на {gender}.")
 
@@ -1504,6 +1675,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "/default - Показати стандартний графік\n"
         "/weekday - Показати стандартний графік на будній день\n"
         "/weekend - Показати стандартний графік на вихідний день\n"
+        "/undo - Скасувати вашу останню зміну графіка\n"
         "\n"
         "/stat - Показати статистику чату\n"
         "/my_stat - Показати вашу статистику\n"
@@ -1511,7 +1683,10 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "/set_name - Встановити ваше ім'я\n"
         "/top_earners - Показати топ користувачів за кількістю сяйва✨\n"
         "/top_workers - Показати топ користувачів за кількістю годин\n"
+        "/top week, /top month, /top дд.мм.рррр дд.мм.рррр - Топ за годинами за період\n"
         "/top_yesterday - Показати топ користувачів за кількістю годин за вчорашній день\n"
+        "/global_top - Показати топ користувачів і чатів у всіх чатах бота\n"
+        "/coverage - Показати, які години найчастіше без людей\n"
         "/shop - Показати магазин скинів\n"
         "/buy_skin назва_скину - Придбати скин\n"
         "/preview_skin назва_скину- Переглянути скин\n"
@@ -1527,6 +1702,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 
 
 def add_handlers(app):
+    app.add_handler(TypeHandler(Update, catch_up_rollover), group=-2)
+    app.add_handler(TypeHandler(Update, track_users), group=-1)
     app.add_handler(CommandHandler("help", help_command))
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("today", show_today_schedule))
@@ -1535,6 +1712,7 @@ def add_handlers(app):
     app.add_handler(CommandHandler("weekday", show_weekday_default_schedule))
     app.add_handler(CommandHandler("weekend", show_weekend_default_schedule))
     app.add_handler(CommandHandler("update", mechanical_update_schedules_admin))
+    app.add_handler(CommandHandler("undo", undo_command))
 
     app.add_handler(CommandHandler("leavethisgroup", leave_username))
     app.add_handler(CommandHandler("leave", leave))
@@ -1553,6 +1731,8 @@ def add_handlers(app):
     app.add_handler(CommandHandler("top", top_workers))
     app.add_handler(CommandHandler("top_yesterday", top_yesterday))
     app.add_handler(CommandHandler("top_workers_weekly", top_workers_weekly))
+    app.add_handler(CommandHandler("global_top", global_top))
+    app.add_handler(CommandHandler("coverage", coverage_command))
     app.add_handler(CommandHandler("shop", shop_command))
     app.add_handler(CommandHandler("buy_skin", buy_skin_command))
     app.add_handler(CommandHandler("preview_skin", preview_skin_command))
@@ -1582,22 +1762,49 @@ def add_handlers(app):
 
     app.add_handler(CommandHandler("start_gpt", start_chatbot))
     app.add_handler(CommandHandler("stop_gpt", stop_chatbot))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, message_handler))
+    # Відповідь моделі може йти секундами: не тримаємо нею навіть інші оновлення свого чату
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, message_handler, block=False))
+
+
+async def post_init(app) -> None:
+    mistral.start()
+
+
+async def post_shutdown(app) -> None:
+    await mistral.close()
 
 
 def main() -> None:
     signal.signal(signal.SIGINT, signal_handler)  # Handle signal
-    app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+    storage.configure(STORAGE_BACKEND)
+    # Усі запити до Telegram проходять через спільну чергу з лімітами, а оновлення різних чатів
+    # обробляються паралельно: повільна відповідь чи ліміт однієї групи не тримає інші
+    app = ApplicationBuilder().token(TELEGRAM_TOKEN).rate_limiter(OutboundRateLimiter()) \
+        .concurrent_updates(ChatUpdateProcessor()) \
+        .post_init(post_init).post_shutdown(post_shutdown).build()
 
     add_handlers(app)
+    store.start()
+    journal.start()
+    # Перша побудова глобальних сум читає статистику всіх чатів - у фоні, поки бот уже працює
+    threading.Thread(target=global_stats.build, daemon=True).start()
+    skin_catalog.start()
 
     # Create scheduler
     scheduler = BackgroundScheduler()
-    scheduler.add_job(update_schedules, 'cron', hour=0, minute=0, timezone=kyiv_tz)
+    scheduler.add_job(lazy_rollover.sweep, 'interval', minutes=SWEEP_INTERVAL_MINUTES)
     scheduler.start()
     # Run keep_alive in a separate thread
     threading.Thread(target=keep_alive, daemon=True).start()
-    app.run_polling(poll_interval=1)
+    if WEBHOOK_URL:
+        # Telegram сам надсилає кожне оновлення, щойно воно з'являється
+        app.run_webhook(listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT, url_path=WEBHOOK_PATH,
+                        webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET)
+    else:
+        app.run_polling(poll_interval=1)
+    skin_catalog.stop()
+    journal.stop()
+    store.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+from collections import deque
+
+# Скільки останніх обмінів (питання + відповідь) пам'ятаємо в одному чаті
+MAX_TURNS = 10
+# Скільки токенів може займати історія разом з новим питанням
+PROMPT_TOKEN_BUDGET = 1500
+# Довше повідомлення обрізається перед тим, як потрапити в історію
+MAX_MESSAGE_TOKENS = 300
+SUMMARY_TOKENS = 200
+# Грубо, без токенізатора: ~4 символи на токен
+CHARS_PER_TOKEN = 4
+
+SUMMARY_PROMPT = ("Коротко (до {words} слів) підсумуй розмову нижче, зберігаючи імена, факти і домовленості. "
+                  "Відповідай лише підсумком.\n\n")
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def clip(text, tokens):
+    return text[:tokens * CHARS_PER_TOKEN]
+
+
+class Turn:
+    __slots__ = ("question", "answer", "tokens")
+
+    def __init__(self, question, answer):
+        self.question = clip(question, MAX_MESSAGE_TOKENS)
+        self.answer = clip(answer, MAX_MESSAGE_TOKENS)
+        self.tokens = estimate_tokens(self.question) + estimate_tokens(self.answer)
+
+    def messages(self):
+        return [{"role": "user", "content": self.question}, {"role": "assistant", "content": self.answer}]
+
+
+class Conversation:
+    __slots__ = ("turns", "summary", "dropped")
+
+    def __init__(self, max_turns):
+        self.turns = deque(maxlen=max_turns)
+        self.summary = ""
+        self.dropped = []  # turns pushed out of the ring that the summary does not cover yet
+
+
+class ConversationMemory:
+    """Recent turns of every chat in a ring buffer, trimmed to a token budget when a prompt is built.
+
+    Turns that fall out of the ring are kept aside until ``summarize`` folds
+    them into a short rolling summary (optional; without it they are simply
+    forgotten). A chat's memory is capped at ``max_turns`` clipped turns.
+    """
+
+    def __init__(self, max_turns=MAX_TURNS, token_budget=PROMPT_TOKEN_BUDGET, keep_dropped=False):
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.keep_dropped = keep_dropped
+        self._chats = {}
+
+    def build_prompt(self, chat_id, message):
+        """Messages for the model: summary, as many recent turns as fit the budget (newest kept), message."""
+        conversation = self._chats.get(chat_id)
+        prompt = [{"role": "user", "content": message}]
+        if conversation is None:
+            return prompt
+        budget = self.token_budget - estimate_tokens(message)
+        if conversation.summary:
+            budget -= estimate_tokens(conversation.summary)
+        history = []
+        for turn in reversed(conversation.turns):
+            if turn.tokens > budget:
+                break
+            budget -= turn.tokens
+            history[:0] = turn.messages()
+        if conversation.summary:
+            history.insert(0, {"role": "system", "content": f"Підсумок попередньої розмови: {conversation.summary}"})
+        return history + prompt
+
+    def remember(self, chat_id, question, answer):
+        conversation = self._chats.get(chat_id)
+        if conversation is None:
+            conversation = self._chats[chat_id] = Conversation(self.max_turns)
+        if self.keep_dropped and len(conversation.turns) == conversation.turns.maxlen:
+            conversation.dropped.append(conversation.turns[0])
+            del conversation.dropped[:-self.max_turns]
+        conversation.turns.append(Turn(question, answer))
+
+    def needs_summary(self, chat_id):
+        conversation = self._chats.get(chat_id)
+        return bool(conversation and conversation.dropped)
+
+    async def summarize(self, chat_id, complete):
+        """Folds the dropped turns into the rolling summary; complete(messages) asks the model."""
+        conversation = self._chats.get(chat_id)
+        if conversation is None or not conversation.dropped:
+            return
+        dropped = conversation.dropped
+        conversation.dropped = []
+        text = SUMMARY_PROMPT.format(words=SUMMARY_TOKENS // 2)
+        if conversation.summary:
+            text += f"Попередній підсумок: {conversation.summary}\n\n"
+        text += "\n".join(f"Питання: {turn.question}\nВідповідь: {turn.answer}" for turn in dropped)
+        summary = await complete([{"role": "user", "content": text}])
+        if not summary:
+            conversation.dropped[:0] = dropped
+            return
+        # Чат могли вимкнути, поки модель відповідала
+        if self._chats.get(chat_id) is conversation:
+            conversation.summary = clip(summary, SUMMARY_TOKENS)
+
+    def clear(self, chat_id):
+        self._chats.pop(chat_id, None)
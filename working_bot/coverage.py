@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import html
+from datetime import timedelta
+
+import numpy as np
+
+from common.schedule_mask import HOURS, slot_name
+
+# Скільки останніх днів бере /coverage за замовчуванням
+COVERAGE_DAYS = 30
+WEEKDAY_NAMES = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Нд")
+# Години без людей, далі - частка від найкраще закритої години
+SHADES = "·░▒▓█"
+HOUR_BITS = np.arange(HOURS, dtype=np.uint32)
+
+
+def unpack_hours(masks):
+    """uint32 hour masks of any shape -> 0/1 array with one more axis of 24 hours."""
+    return ((np.asarray(masks, dtype=np.uint32)[..., None] >> HOUR_BITS) & 1).astype(np.uint16)
+
+
+class Coverage:
+    """Staffing of a chat over a range of days and in its default schedules."""
+
+    def __init__(self, first_day, days, staff, gaps, users, hours, defaults):
+        self.first_day = first_day
+        self.days = days
+        self.staff = staff  # (7, 24) середня кількість людей, nan - години не було
+        self.gaps = gaps  # (7, 24) скільки днів година була без людей
+        self.users = users
+        self.hours = hours  # години кожного користувача за період
+        self.defaults = defaults  # назва -> (24,) людей на годину, -1 - години немає
+
+    def worst_gaps(self, count):
+        """[(weekday, hour, days without anyone), ...] most frequent first."""
+        order = np.argsort(-self.gaps, axis=None, kind="stable")[:count]
+        weekdays, hours = np.unravel_index(order, self.gaps.shape)
+        return [(int(weekday), int(hour), int(self.gaps[weekday, hour]))
+                for weekday, hour in zip(weekdays, hours) if self.gaps[weekday, hour]]
+
+    def shares(self, count):
+        """[(user_id, share of all worked hours), ...] biggest first."""
+        total = self.hours.sum()
+        if not total:
+            return []
+        order = np.argsort(-self.hours, kind="stable")[:count]
+        return [(self.users[column], self.hours[column] / total) for column in order if self.hours[column]]
+
+
+def compute_coverage(first_day, masks, enabled, users, defaults):
+    """masks is (days, users) and enabled (days,) as stored by hours_history; defaults maps a name to a Schedule."""
+    occupancy = unpack_hours(masks)  # (days, users, 24)
+    open_hours = unpack_hours(enabled).astype(bool)  # (days, 24)
+    staffing = occupancy.sum(axis=1)  # (days, 24)
+    weekdays = (np.arange(len(enabled)) + first_day.weekday()) % 7
+
+    staff_sum = np.zeros((7, HOURS))
+    open_days = np.zeros((7, HOURS))
+    gaps = np.zeros((7, HOURS), dtype=np.int64)
+    np.add.at(staff_sum, weekdays, staffing * open_hours)
+    np.add.at(open_days, weekdays, open_hours)
+    np.add.at(gaps, weekdays, open_hours & (staffing == 0))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        staff = np.where(open_days > 0, staff_sum / open_days, np.nan)
+
+    default_staff = {}
+    for name, schedule in defaults.items():
+        if schedule is None:
+            continue
+        counts = unpack_hours(list(schedule.users.values()) or [0]).sum(axis=0).astype(np.int64)
+        default_staff[name] = np.where(unpack_hours(schedule.enabled).astype(bool), counts, -1)
+
+    hours = occupancy.sum(axis=(0, 2)) if len(users) else np.zeros(0, dtype=np.int64)
+    return Coverage(first_day, len(enabled), staff, gaps, users, hours, default_staff)
+
+
+def shade(value, top):
+    if np.isnan(value):
+        return " "
+    if value <= 0:
+        return SHADES[0]
+    return SHADES[min(len(SHADES) - 1, max(1, int(np.ceil(value / top * (len(SHADES) - 1)))))]
+
+
+def count_char(value):
+    if value < 0:
+        return " "
+    return str(value) if value < 10 else "+"
+
+
+def render_coverage(coverage, names, gaps_count=5, shares_count=10):
+    """HTML text of /coverage; names maps user_id to a display name."""
+    ruler = "".join(f"{hour:<6}" for hour in range(0, HOURS, 6))
+    lines = []
+    if coverage.days:
+        last_day = coverage.first_day + timedelta(days=coverage.days - 1)
+        top = np.nanmax(coverage.staff) if not np.all(np.isnan(coverage.staff)) else 0
+        lines.append(f"Середня кількість людей на годину за {coverage.days} днів "
+                     f"(з {coverage.first_day:%d.%m} по {last_day:%d.%m}):")
+        lines.append("<pre>")
+        lines.append(f"    {ruler}")
+        for weekday, name in enumerate(WEEKDAY_NAMES):
+            lines.append(f"{name}  " + "".join(shade(value, top) for value in coverage.staff[weekday]))
+        lines.append("</pre>")
+        lines.append(f"{SHADES[0]} - нікого, {SHADES[-1]} - до {top:.1f} людей, порожньо - години немає в графіку")
+    else:
+        lines.append("Ще немає історії відпрацьованих днів.")
+
+    if coverage.defaults:
+        lines.append("\nЛюдей у стандартних графіках:")
+        lines.append("<pre>")
+        lines.append(f"         {ruler}")
+        for name, counts in coverage.defaults.items():
+            lines.append(f"{name:<9}" + "".join(count_char(int(value)) for value in counts))
+        lines.append("</pre>")
+
+    worst_gaps = coverage.worst_gaps(gaps_count)
+    if worst_gaps:
+        lines.append("\nНайчастіше без людей:")
+        for weekday, hour, days in worst_gaps:
+            lines.append(f"{WEEKDAY_NAMES[weekday]} {slot_name(hour)}: {days} дн.")
+
+    shares = coverage.shares(shares_count)
+    if shares:
+        lines.append("\nЧастка відпрацьованих годин:")
+        for user_id, share in shares:
+            lines.append(f"{html.escape(names.get(user_id, user_id))}: {share:.1%}")
+    return "\n".join(lines)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import time
+
+from common.names import CachedUser, name_cache
+from common.render_cache import render_cache
+from common.storage import store, data_key
+
+# Як часто оновлювати last_seen на диску для вже відомого користувача (секунди)
+LAST_SEEN_RESOLUTION = 3600
+
+
+def directory_key(chat_id):
+    return data_key("directory", chat_id)
+
+
+class UserDirectory:
+    """Per-chat directory of users seen in updates, with a username -> user_id index.
+
+    Filled passively from every processed update, so admin commands can find
+    @username without asking Telegram about every user in the statistics.
+    """
+
+    def __init__(self):
+        self._usernames = {}
+
+    def _load(self, chat_id):
+        key = directory_key(chat_id)
+        users = store.get(key)
+        if users is None:
+            users = {}
+            store.put(key, users)
+        if key not in self._usernames:
+            self._usernames[key] = {
+                record["username"].lower(): user_id
+                for user_id, record in users.items() if record.get("username")
+            }
+        return users, self._usernames[key]
+
+    def remember(self, chat_id, user):
+        """Records a telegram User/Chat (anything with id, username and first_name)."""
+        if user is None or user.id is None:
+            return
+        user_id = str(user.id)
+        first_name = getattr(user, "first_name", None)
+        username = getattr(user, "username", None)
+        name_cache.set(user_id, CachedUser(user.id, first_name, username))
+
+        users, usernames = self._load(chat_id)
+        record = users.get(user_id)
+        now = int(time.time())
+        if (record and record.get("username") == username and record.get("first_name") == first_name
+                and now - record.get("last_seen", 0) < LAST_SEEN_RESOLUTION):
+            return
+
+        if record and record.get("first_name") != first_name:
+            # Відрендерені графіки чату показують старе ім'я
+            render_cache.invalidate(chat_id)
+        if record and record.get("username"):
+            usernames.pop(record["username"].lower(), None)
+        users[user_id] = {"username": username, "first_name": first_name, "last_seen": now}
+        if username:
+            usernames[username.lower()] = user_id
+        store.put(directory_key(chat_id), users)
+
+    def find(self, chat_id, username):
+        _, usernames = self._load(chat_id)
+        return usernames.get(username.lstrip('@').lower())
+
+    def knows(self, chat_id, user_id):
+        users, _ = self._load(chat_id)
+        return str(user_id) in users
+
+
+user_directory = UserDirectory()
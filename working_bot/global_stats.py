@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+
+from leaderboards import Leaderboard
+from common.storage import store, stats_key, data_key
+
+# Зведені суми по всіх чатах: {"users": {user_id: [години, сяйво]}, "chats": {chat_id: [...]}}
+GLOBAL_KEY = data_key("aggregates", "global")
+GLOBAL_METRICS = ("total", "currency")
+GLOBAL_SCOPES = ("users", "chats")
+
+
+def contributions_key(chat_id):
+    # What every user of the chat currently adds to the global sums
+    return data_key("aggregates", chat_id)
+
+
+def user_contribution(user_stats):
+    return [user_stats.get(metric, 0) for metric in GLOBAL_METRICS]
+
+
+class GlobalStats:
+    """Hours and currency of every user and every chat summed across all chats.
+
+    Each chat remembers what its users last contributed, so a statistics
+    write only applies the difference to the global sums. The contributions
+    are persisted with every change, the sums once per store flush. The sums
+    are built from all statistics once, when the global record does not exist
+    yet; ``build`` does it off the event loop, writes made meanwhile are
+    applied when it finishes. Rankings are kept sorted in memory. Changes run
+    under the store lock, so the sums are never saved half-updated.
+    """
+
+    def __init__(self):
+        self._sums = None
+        self._boards = None
+        self._stale = set()  # chats written before the sums were ready
+        self._changed = False
+        self._building = threading.Lock()
+
+    @property
+    def ready(self):
+        return self._sums is not None
+
+    def top(self, scope, metric, count):
+        """[(user_id or chat_id, value), ...] with the highest values."""
+        if not self.ready:
+            self.build()
+        with store.lock:
+            return self._boards[scope, metric].top(count)
+
+    def on_stats_change(self, key, data, rows):
+        kind, chat_id, _ = key
+        if kind != "stats":
+            return
+        with store.lock:
+            if not self.ready and not self._load():
+                # Суми ще не побудовані: build() перечитає цей чат наприкінці
+                self._stale.add(chat_id)
+                return
+            self._apply(chat_id, data, rows)
+
+    def sync_chat(self, chat_id):
+        """Re-reads a chat whose statistics were rewritten behind the store (SQLite rollover)."""
+        self.on_stats_change(stats_key(chat_id), store.get(stats_key(chat_id)) or {}, None)
+
+    def save(self):
+        """Puts the sums into the store if they changed; runs before every flush."""
+        with store.lock:
+            if self._changed:
+                # Копія: потік запису серіалізує її, поки обробники міняють суми
+                store.put(GLOBAL_KEY, {scope: dict(values) for scope, values in self._sums.items()})
+                self._changed = False
+
+    def build(self):
+        """Loads the sums, building them from every chat's statistics the first time.
+
+        The first build reads all statistics, so call it at startup and off the
+        event loop; the store lock is only held for one chat at a time.
+        """
+        with self._building:
+            with store.lock:
+                if self.ready or self._load():
+                    return
+            logging.info("Building global statistics from all chats")
+            sums = {scope: {} for scope in GLOBAL_SCOPES}
+            boards = {(scope, metric): Leaderboard() for scope in GLOBAL_SCOPES for metric in GLOBAL_METRICS}
+            chats = store.backend.list_chats()
+            for chat_id in chats:
+                stats = store.get(stats_key(chat_id)) or {}
+                with store.lock:
+                    self._apply(chat_id, stats, None, contributions={}, sums=sums, boards=boards)
+            with store.lock:
+                self._sums, self._boards = sums, boards
+                # Written during the build: the ones built already only get the difference,
+                # chats the backend does not list yet (never flushed) are counted from scratch
+                for chat_id in self._stale:
+                    self._apply(chat_id, store.get(stats_key(chat_id)) or {}, None,
+                                contributions=None if chat_id in chats else {})
+                self._stale.clear()
+                self._changed = True
+            self.save()
+            logging.info(f"Global statistics built from {len(chats)} chats")
+
+    def _load(self):
+        """Loads the saved sums; False when they were never built."""
+        sums = store.get(GLOBAL_KEY)
+        if sums is None:
+            return False
+        self._sums = sums
+        self._boards = {(scope, metric): Leaderboard() for scope in GLOBAL_SCOPES for metric in GLOBAL_METRICS}
+        for scope in GLOBAL_SCOPES:
+            for entity_id, values in sums[scope].items():
+                self._set(scope, entity_id, values)
+        for chat_id in self._stale:
+            self._apply(chat_id, store.get(stats_key(chat_id)) or {}, None)
+        self._stale.clear()
+        return True
+
+    def _apply(self, chat_id, data, rows, contributions=None, sums=None, boards=None):
+        sums = self._sums if sums is None else sums
+        boards = self._boards if boards is None else boards
+        if contributions is None:
+            contributions = store.get(contributions_key(chat_id)) or {}
+        user_ids = set(data) | set(contributions) if rows is None else rows
+        changed = False
+        for user_id in user_ids:
+            new_values = user_contribution(data[user_id]) if user_id in data else None
+            old_values = contributions.get(user_id)
+            if new_values == old_values:
+                continue
+            delta = [new - old for new, old in zip(new_values or [0, 0], old_values or [0, 0])]
+            self._add(sums, boards, "users", user_id, delta)
+            self._add(sums, boards, "chats", chat_id, delta)
+            if new_values is None:
+                del contributions[user_id]
+            else:
+                contributions[user_id] = new_values
+            changed = True
+        if changed:
+            store.put(contributions_key(chat_id), contributions)
+            self._changed = True
+
+    def _add(self, sums, boards, scope, entity_id, delta):
+        values = [value + change for value, change in zip(sums[scope].get(entity_id, [0, 0]), delta)]
+        if any(values):
+            sums[scope][entity_id] = values
+        else:
+            sums[scope].pop(entity_id, None)
+            values = None
+        self._set(scope, entity_id, values, boards)
+
+    def _set(self, scope, entity_id, values, boards=None):
+        boards = self._boards if boards is None else boards
+        for index, metric in enumerate(GLOBAL_METRICS):
+            boards[scope, metric].set(entity_id, values[index] if values is not None else None)
+
+
+global_stats = GlobalStats()
+store.add_listener(global_stats.on_stats_change)
+store.add_flush_hook(global_stats.save)
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+import base64
+import os
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+
+from common.storage import store, data_key
+
+# Скільки днів історії зберігаємо для кожного чату
+HISTORY_DAYS = 400
+
+
+def history_key(chat_id):
+    return data_key("hours_history", chat_id)
+
+
+def _encode(array):
+    return base64.b64encode(array.astype('<u4').tobytes()).decode('ascii')
+
+
+def _decode(text, shape):
+    return np.frombuffer(base64.b64decode(text), dtype='<u4').astype(np.uint32).reshape(shape)
+
+
+class HoursHistory:
+    """Worked hours of one chat, one row per day and one column per user.
+
+    Each cell is the user's bit mask of that day (bit ``h`` is the slot
+    ``h:00 - h+1:00``, as in schedule_mask), so hours are popcounts and slot
+    coverage is a bit test. ``enabled`` holds the hours the day's schedule had.
+    """
+
+    def __init__(self, start=None, users=None, masks=None, enabled=None):
+        self.start = start  # день першого рядка
+        self.users = list(users or [])
+        self._columns = {user_id: column for column, user_id in enumerate(self.users)}
+        self.masks = masks if masks is not None else np.zeros((0, len(self.users)), dtype=np.uint32)
+        self.enabled = enabled if enabled is not None else np.zeros(0, dtype=np.uint32)
+
+    @property
+    def days(self):
+        return len(self.enabled)
+
+    @property
+    def end(self):
+        """Day after the last row."""
+        return self.start + timedelta(days=self.days) if self.start else None
+
+    def add_day(self, day, schedule):
+        """Records the schedule a day was worked by; recording the same day twice does not double it."""
+        if self.start is None:
+            self.start = day
+        if day < self.start:
+            missing = (self.start - day).days
+            self.masks = np.vstack([np.zeros((missing, len(self.users)), dtype=np.uint32), self.masks])
+            self.enabled = np.concatenate([np.zeros(missing, dtype=np.uint32), self.enabled])
+            self.start = day
+        row = (day - self.start).days
+        if row >= self.days:
+            missing = row + 1 - self.days
+            self.masks = np.vstack([self.masks, np.zeros((missing, len(self.users)), dtype=np.uint32)])
+            self.enabled = np.concatenate([self.enabled, np.zeros(missing, dtype=np.uint32)])
+
+        new_users = [str(user_id) for user_id in schedule.users if str(user_id) not in self._columns]
+        if new_users:
+            for user_id in new_users:
+                self._columns[user_id] = len(self.users)
+                self.users.append(user_id)
+            self.masks = np.hstack([self.masks, np.zeros((self.days, len(new_users)), dtype=np.uint32)])
+
+        self.enabled[row] |= schedule.enabled
+        for user_id, mask in schedule.users.items():
+            self.masks[row, self._columns[str(user_id)]] |= mask & schedule.enabled
+
+    def trim(self, keep_days=HISTORY_DAYS):
+        if self.days > keep_days:
+            dropped = self.days - keep_days
+            self.masks = self.masks[dropped:].copy()
+            self.enabled = self.enabled[dropped:].copy()
+            self.start += timedelta(days=dropped)
+
+    def rows(self, first_day, last_day):
+        """Row slice of first_day .. last_day inclusive, clipped to the stored days."""
+        if self.start is None:
+            return slice(0, 0)
+        first = max((first_day - self.start).days, 0)
+        last = min((last_day - self.start).days + 1, self.days)
+        return slice(first, max(first, last))
+
+    def hours(self, first_day, last_day):
+        """Worked hours per user (aligned with ``users``) summed over the days."""
+        return np.bitwise_count(self.masks[self.rows(first_day, last_day)]).sum(axis=0, dtype=np.int64)
+
+    def top(self, first_day, last_day, count):
+        hours = self.hours(first_day, last_day)
+        order = np.argsort(-hours, kind="stable")[:count]
+        return [(self.users[column], int(hours[column])) for column in order if hours[column] > 0]
+
+    def to_record(self):
+        return {
+            "start": self.start.isoformat() if self.start else None,
+            "users": self.users,
+            "masks": _encode(self.masks),
+            "enabled": _encode(self.enabled),
+        }
+
+    @classmethod
+    def from_record(cls, record):
+        if not record or not record.get("start"):
+            return cls()
+        enabled = _decode(record["enabled"], (-1,))
+        masks = _decode(record["masks"], (len(enabled), len(record["users"])))
+        return cls(date.fromisoformat(record["start"]), record["users"], masks, enabled)
+
+
+class HistoryIndex:
+    """Decoded HoursHistory per chat; the store only sees the compact record."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histories = {}
+        self._records = {}  # the record record_day last wrote for each chat
+
+    def on_history_change(self, key, data, rows):
+        # A record written by someone else (a rollover worker process) replaces the decoded one
+        kind, chat_id, _ = key
+        if kind == "hours_history" and self._records.get(chat_id) is not data:
+            self._histories.pop(chat_id, None)
+            self._records.pop(chat_id, None)
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self._histories = {}
+        self._records = {}
+
+    def get(self, chat_id):
+        chat_id = str(chat_id)
+        with self._lock:
+            history = self._histories.get(chat_id)
+            if history is None:
+                history = self._histories[chat_id] = HoursHistory.from_record(store.get(history_key(chat_id)))
+            return history
+
+    def record_day(self, chat_id, day, schedule):
+        history = self.get(chat_id)
+        with self._lock:
+            history.add_day(day, schedule)
+            history.trim()
+            record = self._records[str(chat_id)] = history.to_record()
+            store.put(history_key(chat_id), record)
+
+    def top(self, chat_id, first_day, last_day, count):
+        history = self.get(chat_id)
+        with self._lock:
+            return history.top(first_day, last_day, count)
+
+    def window(self, chat_id, first_day, last_day):
+        """(day of the first row, masks, enabled, users) copies of the stored days within the range."""
+        history = self.get(chat_id)
+        with self._lock:
+            rows = history.rows(first_day, last_day)
+            first_row_day = history.start + timedelta(days=rows.start) if history.start else first_day
+            return first_row_day, history.masks[rows].copy(), history.enabled[rows].copy(), list(history.users)
+
+
+hours_history = HistoryIndex()
+store.add_listener(hours_history.on_history_change)
+if hasattr(os, "register_at_fork"):
+    # The lock may be held by another thread of the bot at the fork
+    os.register_at_fork(after_in_child=hours_history.reset)
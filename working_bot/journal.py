@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from common.storage import store, schedule_key, SCHEDULES_DIR
+from common.schedule_mask import Schedule, slots_mask, hour_bit, parse_slot
+
+JOURNAL_FILE = os.path.join(SCHEDULES_DIR, "journal.log")
+
+# Як часто журнал зливається у файли графіків (секунди)
+COMPACT_INTERVAL = 60
+# Після скількох записів журнал зливається позачергово
+MAX_JOURNAL_ENTRIES = 500
+# Скільки останніх змін кожного чату можна скасувати через /undo
+UNDO_DEPTH = 20
+
+INVERSE_OPS = {
+    "add": "remove",
+    "remove": "add",
+    "add_slot": "remove_slot",
+    "remove_slot": "add_slot",
+}
+
+
+def apply_op(schedule, user_id, op, slots):
+    # Slots stay as names in the journal, so entries written before the bit masks still replay
+    if op == "add":
+        schedule.add(user_id, slots_mask(slots))
+    elif op == "remove":
+        schedule.remove(user_id, slots_mask(slots))
+    elif op == "add_slot":
+        # slots: {time_slot: users} so that undoing a slot removal brings the users back
+        added = schedule.enable(slots_mask(slots))
+        for time_slot, users in slots.items():
+            hour = parse_slot(time_slot)
+            if hour is not None and added & hour_bit(hour):
+                for slot_user in users:
+                    schedule.add(slot_user, hour_bit(hour))
+    elif op == "remove_slot":
+        schedule.disable(slots_mask(slots))
+
+
+def invert_ops(ops):
+    inverted = []
+    for entry in reversed(ops):
+        op = INVERSE_OPS[entry["op"]]
+        slots = entry["slots"]
+        if op == "add_slot" and not isinstance(slots, dict):
+            slots = {time_slot: [] for time_slot in slots}
+        inverted.append({"op": op, "slots": slots})
+    return inverted
+
+
+class ScheduleJournal:
+    """Append-only log of schedule edits on top of the cached schedules.
+
+    An edit is applied to the in-memory schedule and appended to the journal
+    as one JSON line, so it costs a single small write. ``compact`` (run by a
+    background thread) writes the touched schedules through the store and
+    drops the part of the journal they cover; edits logged meanwhile stay in
+    it. On start ``replay`` re-applies whatever was logged after the last
+    compaction.
+    """
+
+    def __init__(self, file_name=JOURNAL_FILE, compact_interval=COMPACT_INTERVAL,
+                 max_entries=MAX_JOURNAL_ENTRIES):
+        self.file_name = file_name
+        self.compact_interval = compact_interval
+        self.max_entries = max_entries
+        self._lock = threading.RLock()
+        self._compacting = threading.RLock()
+        self._pending = set()
+        self._entries = 0
+        self._size = 0  # bytes in the journal file
+        self._undo = {}
+        self._file = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, chat_id, schedule_type, user_id, ops, undoable=True):
+        """Logs ops already applied to the cached schedule. ops: [{"op": ..., "slots": ...}]"""
+        if not ops:
+            return
+        entry = {"chat": str(chat_id), "type": schedule_type, "user": user_id, "ops": ops}
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode('utf-8')
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.file_name, 'ab')
+                self._size = self._file.seek(0, os.SEEK_END)
+            self._file.write(line)
+            self._file.flush()
+            self._size += len(line)
+            self._pending.add(schedule_key(chat_id, schedule_type))
+            self._entries += 1
+            if undoable:
+                self._undo.setdefault(str(chat_id), deque(maxlen=UNDO_DEPTH)).append(entry)
+            if self._entries >= self.max_entries:
+                # Зливає фоновий потік, а не обробник, що записав зміну
+                self._wake.set()
+
+    def undo(self, chat_id, user_id=None):
+        """Reverts the last edit in the chat (optionally only the given user's) and returns its entry."""
+        with store.lock, self._lock:
+            history = self._undo.get(str(chat_id))
+            if not history:
+                return None
+            # By position: an older identical edit must stay in the history
+            for index in range(len(history) - 1, -1, -1):
+                if user_id is None or history[index]["user"] == user_id:
+                    entry = history[index]
+                    del history[index]
+                    break
+            else:
+                return None
+
+            schedule = store.get(schedule_key(chat_id, entry["type"]))
+            if schedule is None:
+                return None
+            inverted = invert_ops(entry["ops"])
+            for op in inverted:
+                apply_op(schedule, entry["user"], op["op"], op["slots"])
+
+            # Записуємо скасування в журнал як звичайну зміну, але без нового кроку для /undo
+            self.record(chat_id, entry["type"], entry["user"], inverted, undoable=False)
+            return entry
+
+    @contextmanager
+    def exclusive(self):
+        """Holds off compaction and schedule edits (they run under the store lock) for a rollover.
+
+        Takes the compaction lock before the store lock, in the same order as ``compact``.
+        """
+        with self._compacting, store.lock:
+            yield
+
+    def clear_undo(self, chat_id=None):
+        with self._lock:
+            if chat_id is None:
+                self._undo.clear()
+            else:
+                self._undo.pop(str(chat_id), None)
+
+    def replay(self):
+        if not os.path.exists(self.file_name):
+            return
+        replayed = 0
+        with store.lock, self._lock, open(self.file_name, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Обірваний останній рядок після падіння
+                    logging.warning(f"Skipping broken journal line: {line!r}")
+                    continue
+                key = schedule_key(entry["chat"], entry["type"])
+                schedule = store.get(key)
+                if schedule is None:
+                    schedule = Schedule()
+                    store.put(key, schedule)
+                for op in entry["ops"]:
+                    apply_op(schedule, entry["user"], op["op"], op["slots"])
+                self._pending.add(key)
+                replayed += 1
+            self._entries += replayed
+            self._size = os.path.getsize(self.file_name)
+        logging.info(f"Replayed {replayed} schedule journal entries")
+        self.compact()
+
+    def compact(self):
+        with self._compacting:
+            with self._lock:
+                # A journal of only broken lines is dropped too, new entries must not follow a torn one
+                if not self._pending and not self._size:
+                    return
+                pending = self._pending
+                entries = self._entries
+                size = self._size
+                self._pending = set()
+
+            # Disk I/O happens outside every lock, handlers keep editing meanwhile
+            for key in pending:
+                schedule = store.get(key)
+                if schedule is not None:
+                    store.put(key, schedule)
+            store.flush()
+
+            with self._lock:
+                if any(store.is_dirty(key) for key in pending):
+                    # Not everything reached the disk, keep the journal for the next attempt
+                    logging.warning("Schedule journal compaction postponed: flush failed")
+                    self._pending |= pending
+                    return
+                self._drop_head(size)
+                self._entries -= entries
+            logging.info(f"Compacted schedule journal: {len(pending)} schedules, {entries} entries")
+
+    def _drop_head(self, size):
+        """Removes the first ``size`` bytes of the journal, keeping what was logged after them."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        tail = b""
+        if os.path.exists(self.file_name):
+            with open(self.file_name, 'rb') as f:
+                f.seek(size)
+                tail = f.read()
+        tmp_name = self.file_name + ".tmp"
+        with open(tmp_name, 'wb') as f:
+            f.write(tail)
+        os.replace(tmp_name, self.file_name)
+        self._size = len(tail)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.replay()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self.compact()
+
+    def _run(self):
+        # Wakes up every compact_interval seconds, or early once max_entries edits pile up
+        while not self._stop.is_set():
+            self._wake.wait(self.compact_interval)
+            self._wake.clear()
+            if not self._stop.is_set():
+                self.compact()
+
+
+journal = ScheduleJournal()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from sortedcontainers import SortedList
+
+from common.storage import store, stats_key
+
+# Назва рейтингу -> значення користувача в ньому
+BOARD_VALUES = {
+    "currency": lambda user_stats: user_stats.get("currency", 0),
+    "total": lambda user_stats: user_stats.get("total", 0),
+    "yesterday": lambda user_stats: user_stats.get("yesterday", 0),
+}
+
+
+class Leaderboard:
+    """Users of one chat ordered by a value, highest first, ties by user id."""
+
+    def __init__(self):
+        self._entries = SortedList()  # (-value, user_id)
+        self._values = {}
+
+    def set(self, user_id, value):
+        old_value = self._values.get(user_id)
+        if old_value == value:
+            return
+        if old_value is not None:
+            self._entries.remove((-old_value, user_id))
+        if value is None:
+            del self._values[user_id]
+            return
+        self._values[user_id] = value
+        self._entries.add((-value, user_id))
+
+    def top(self, count, start=0):
+        return [(user_id, -value) for value, user_id in self._entries.islice(start, start + count)]
+
+    def user_ids(self):
+        return self._values.keys()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LeaderboardIndex:
+    """Per-chat leaderboards for every value in BOARD_VALUES, kept in sync with statistics writes.
+
+    A chat's boards are built on first use; afterwards each put() only moves
+    the users whose values changed. ``invalidate`` drops chats whose
+    statistics were rewritten behind the store (SQLite rollover).
+    """
+
+    def __init__(self):
+        self._chats = {}
+        self._lock = threading.Lock()
+
+    def top(self, chat_id, board, count, start=0):
+        """[(user_id, value), ...] of the places start..start+count of the chat's board."""
+        with self._lock:
+            return self._ensure(str(chat_id))[board].top(count, start)
+
+    def size(self, chat_id, board):
+        with self._lock:
+            return len(self._ensure(str(chat_id))[board])
+
+    def on_stats_change(self, key, data, rows):
+        kind, chat_id, _ = key
+        if kind != "stats":
+            return
+        with self._lock:
+            boards = self._chats.get(chat_id)
+            if boards is None:
+                return
+            if rows is None:
+                for user_id in set(data) | set(boards["total"].user_ids()):
+                    self._set(boards, user_id, data.get(user_id))
+                return
+            for user_id in rows:
+                self._set(boards, user_id, data.get(user_id))
+
+    def invalidate(self, chat_id=None):
+        with self._lock:
+            if chat_id is None:
+                self._chats.clear()
+            else:
+                self._chats.pop(str(chat_id), None)
+
+    def _ensure(self, chat_id):
+        boards = self._chats.get(chat_id)
+        if boards is None:
+            boards = self._chats[chat_id] = {board: Leaderboard() for board in BOARD_VALUES}
+            for user_id, user_stats in (store.get(stats_key(chat_id)) or {}).items():
+                self._set(boards, user_id, user_stats)
+        return boards
+
+    @staticmethod
+    def _set(boards, user_id, user_stats):
+        for board, value in BOARD_VALUES.items():
+            boards[board].set(user_id, value(user_stats) if user_stats is not None else None)
+
+
+leaderboards = LeaderboardIndex()
+store.add_listener(leaderboards.on_stats_change)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+
+from common.storage import store, data_key
+
+# Скільки відповідей моделі тримаємо і як довго (секунди)
+PROMPT_CACHE_SIZE = 500
+PROMPT_CACHE_TTL = 24 * 60 * 60
+# Збережені відповіді переживають перезапуск бота
+PROMPT_CACHE_KEY = data_key("llm_cache", "responses")
+# Як часто пишемо статистику кешу в лог, якщо були запити (секунди)
+METRICS_LOG_INTERVAL = 300
+
+PUNCTUATION_RE = re.compile(r'[^\w\s]+')
+SPACES_RE = re.compile(r'\s+')
+
+
+def normalize_prompt(prompt):
+    """'  Що таке ГРАФІК?? ' -> 'що таке графік': case, punctuation and spacing do not matter."""
+    return SPACES_RE.sub(' ', PUNCTUATION_RE.sub(' ', prompt.casefold())).strip()
+
+
+def context_digest(messages):
+    """Short hash of the conversation (summary and turns) sent before the prompt, '' for none."""
+    if not messages:
+        return ""
+    text = json.dumps(messages, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def cache_key(model, prompt, context=""):
+    # Prompts of only emoji or punctuation normalize to nothing and are not cached
+    normalized = normalize_prompt(prompt)
+    if not normalized:
+        return None
+    return f"{model}\n{context}\n{normalized}" if context else f"{model}\n{normalized}"
+
+
+class PromptCache:
+    """LRU + TTL cache of model answers keyed by model, context and normalized prompt.
+
+    ``context`` is the context_digest of the conversation sent along with the
+    prompt, so an answer given in one conversation is only reused for the
+    same question asked with the same summary and turns. Expiry uses wall-clock time so that persisted entries stay valid across
+    restarts; with ``persist`` the entries are kept in the store.
+    """
+
+    def __init__(self, max_size=PROMPT_CACHE_SIZE, ttl=PROMPT_CACHE_TTL, persist=True):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.persist = persist
+        self._entries = None
+        self._metrics_logged = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def _load(self):
+        if self._entries is None:
+            saved = store.get(PROMPT_CACHE_KEY) if self.persist else None
+            self._entries = OrderedDict(saved or {})
+        return self._entries
+
+    def _save(self):
+        if self.persist:
+            store.put(PROMPT_CACHE_KEY, self._entries)
+
+    def get(self, model, prompt, context=""):
+        entries = self._load()
+        key = cache_key(model, prompt, context)
+        entry = entries.get(key) if key else None
+        if entry is not None and entry[0] < time.time():
+            del entries[key]
+            self._save()
+            self.expired += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+        else:
+            entries.move_to_end(key)
+            self.hits += 1
+        self._log_metrics()
+        return entry[1] if entry is not None else None
+
+    def set(self, model, prompt, response, context=""):
+        entries = self._load()
+        key = cache_key(model, prompt, context)
+        if not key:
+            return
+        entries[key] = [time.time() + self.ttl, response]
+        entries.move_to_end(key)
+        while len(entries) > self.max_size:
+            entries.popitem(last=False)
+        self._save()
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def summary(self):
+        return (f"LLM cache: {len(self._load())} answers, {self.hits} hits / {self.misses} misses "
+                f"({self.hit_rate():.0%}), {self.expired} expired")
+
+    def _log_metrics(self):
+        now = time.monotonic()
+        if now - self._metrics_logged > METRICS_LOG_INTERVAL:
+            self._metrics_logged = now
+            logging.info(self.summary())
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+
+# Скільки запитів до моделі виконуються одночасно на весь бот
+MAX_IN_FLIGHT = 4
+# Скільки запитів одного чату можуть чекати в черзі, решта відкидається
+MAX_QUEUE_PER_CHAT = 3
+# Запит, що чекав довше (секунди), вже нікому не потрібен і відкидається
+MAX_QUEUE_WAIT = 60
+# Як часто пишемо метрики в лог, якщо був трафік (секунди)
+METRICS_LOG_INTERVAL = 300
+
+
+class LlmBusyError(Exception):
+    """The prompt was dropped: the chat's queue was full or it waited too long."""
+
+
+class LlmJob:
+    __slots__ = ("chat_id", "call", "future", "queued_at")
+
+    def __init__(self, chat_id, call, future):
+        self.chat_id = chat_id
+        self.call = call
+        self.future = future
+        self.queued_at = time.monotonic()
+
+
+class LlmScheduler:
+    """Runs LLM calls with a global in-flight limit and a fair share per chat.
+
+    Every chat has its own FIFO queue and the queues are served round-robin,
+    so a busy group can not hold up the others. ``submit`` raises
+    LlmBusyError when the chat already has ``max_queue`` prompts waiting or
+    when the prompt waited longer than ``max_wait`` for a free slot.
+    """
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, max_queue=MAX_QUEUE_PER_CHAT, max_wait=MAX_QUEUE_WAIT):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._queues = OrderedDict()  # chat_id -> deque of LlmJob, in round-robin order
+        self._in_flight = 0
+        self._tasks = set()  # running jobs; the event loop keeps only weak references to tasks
+        self._metrics_logged = time.monotonic()
+        self.completed = 0
+        self.failed = 0
+        self.dropped_full = 0
+        self.dropped_stale = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    async def submit(self, chat_id, call):
+        """Queues ``call()`` (a coroutine function) for chat_id and returns its result."""
+        queue = self._queues.get(chat_id)
+        if queue is not None and len(queue) >= self.max_queue:
+            self.dropped_full += 1
+            raise LlmBusyError(f"queue of chat {chat_id} is full")
+        job = LlmJob(chat_id, call, asyncio.get_running_loop().create_future())
+        self._queues.setdefault(chat_id, deque()).append(job)
+        self._pump()
+        return await job.future
+
+    def _next_job(self):
+        while self._queues:
+            chat_id, queue = self._queues.popitem(last=False)
+            job = queue.popleft()
+            if queue:
+                self._queues[chat_id] = queue  # у кінець черги чатів
+            if job.future.cancelled():
+                continue
+            if time.monotonic() - job.queued_at > self.max_wait:
+                self.dropped_stale += 1
+                job.future.set_exception(LlmBusyError(f"prompt of chat {chat_id} waited too long"))
+                continue
+            return job
+        return None
+
+    def _pump(self):
+        while self._in_flight < self.max_in_flight:
+            job = self._next_job()
+            if job is None:
+                return
+            self._in_flight += 1
+            task = asyncio.create_task(self._run(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job):
+        started = time.monotonic()
+        waited = started - job.queued_at
+        try:
+            result = await job.call()
+        except Exception as e:
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self.completed += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            latency = time.monotonic() - started
+            self._in_flight -= 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            if started - self._metrics_logged > METRICS_LOG_INTERVAL:
+                self._metrics_logged = started
+                logging.info(self.summary())
+            self._pump()
+
+    def metrics(self):
+        done = self.completed + self.failed
+        return {
+            "in_flight": self._in_flight,
+            "queued": sum(len(queue) for queue in self._queues.values()),
+            "completed": self.completed,
+            "failed": self.failed,
+            "dropped_full": self.dropped_full,
+            "dropped_stale": self.dropped_stale,
+            "avg_wait": self.wait_total / done if done else 0.0,
+            "max_wait": self.wait_max,
+            "avg_latency": self.latency_total / done if done else 0.0,
+            "max_latency": self.latency_max,
+        }
+
+    def summary(self):
+        metrics = self.metrics()
+        return (f"LLM queue: {metrics['in_flight']} in flight, {metrics['queued']} queued, "
+                f"{metrics['completed']} done / {metrics['failed']} failed, "
+                f"dropped {metrics['dropped_full']} (full) / {metrics['dropped_stale']} (stale), "
+                f"wait avg {metrics['avg_wait']:.2f}s max {metrics['max_wait']:.2f}s, "
+                f"model avg {metrics['avg_latency']:.2f}s max {metrics['max_latency']:.2f}s")
+
+
+llm_scheduler = LlmScheduler()
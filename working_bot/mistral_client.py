@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import logging
+
+import httpx
+
+MISTRAL_MODEL = "open-mistral-nemo"
+# Таймаути запиту до Mistral (секунди): з'єднання, відповідь моделі, очікування вільного з'єднання
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 60
+POOL_TIMEOUT = 30
+# Скільки з'єднань тримаємо відкритими між запитами
+MAX_CONNECTIONS = 10
+MAX_KEEPALIVE_CONNECTIONS = 5
+
+
+class MistralClient:
+    """Async client of the Mistral chat completions API.
+
+    One httpx.AsyncClient with a keep-alive connection pool is created on
+    first use (inside the running event loop) and reused for every request,
+    so a reply never blocks the loop and does not pay for a new TLS handshake.
+    Errors are logged and turned into an empty answer, as before.
+    """
+
+    def __init__(self, api_url, api_key, model=MISTRAL_MODEL, timeout=None, limits=None):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout or httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT, pool=POOL_TIMEOUT)
+        self.limits = limits or httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                             max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS)
+        self._client = None
+
+    def start(self):
+        """Builds the client up front; creating the SSL context takes a noticeable moment."""
+        self._http()
+
+    def _http(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers={"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"},
+                timeout=self.timeout, limits=self.limits)
+        return self._client
+
+    async def complete(self, messages):
+        """Answer of the model to a list of {"role", "content"} messages, "" on any error."""
+        data = {"model": self.model, "messages": messages}
+        try:
+            response = await self._http().post(self.api_url, json=data)
+            response.raise_for_status()
+            response_data = response.json()
+            return response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
+        except (httpx.HTTPError, ValueError) as e:
+            logging.error(f"Error occurred during Mistral API request: {e!r}")
+            return ""
+
+    async def ask(self, message):
+        return await self.complete([{"role": "user", "content": message}])
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
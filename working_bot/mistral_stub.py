@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# Локальна заміна Mistral API для перевірок і бенчмарків: відповідає у форматі chat completions із затримкою.
+# Використання: python mistral_stub.py [порт] [затримка_секунд]
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 8089
+DEFAULT_DELAY = 0.5
+API_PATH = "/v1/chat/completions"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1, щоб клієнт міг тримати з'єднання відкритим
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.send_error(400, "Invalid JSON")
+            return
+        time.sleep(self.server.delay)
+        messages = request.get("messages") or [{}]
+        body = json.dumps({
+            "id": f"stub-{self.server.requests}",
+            "object": "chat.completion",
+            "model": request.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": f"stub: {messages[-1].get('content', '')}"},
+                "finish_reason": "stop",
+            }],
+        }, ensure_ascii=False).encode("utf-8")
+        self.server.requests += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(port=0, delay=DEFAULT_DELAY):
+    """Serves the stub from a daemon thread; returns (server, api_url). Port 0 picks a free port."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    server.delay = delay
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}{API_PATH}"
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_DELAY
+    server, api_url = start_stub(port, delay)
+    print(f"Mistral stub on {api_url}, delay {delay}s")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
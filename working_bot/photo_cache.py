@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+
+from telegram import InputMediaPhoto
+from telegram.error import BadRequest
+
+from common.storage import store, data_key
+
+# Усі file_id зберігаються одним записом сховища
+FILE_IDS_KEY = data_key("file_ids", "photos")
+
+
+def file_version(path):
+    # A replaced or edited image gets a new version and is uploaded again
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+class PhotoCache:
+    """Telegram file_id of every image uploaded from disk, keyed by path and file version.
+
+    The first send uploads the file, later sends reuse the returned file_id.
+    A file_id Telegram no longer accepts is dropped and the file uploaded again.
+    """
+
+    def _entries(self):
+        entries = store.get(FILE_IDS_KEY)
+        if entries is None:
+            entries = {}
+            store.put(FILE_IDS_KEY, entries)
+        return entries
+
+    def get(self, path, version=None):
+        entry = self._entries().get(path)
+        if entry and entry["version"] == (version or file_version(path)):
+            return entry["file_id"]
+        return None
+
+    def remember(self, path, file_id, version=None):
+        entries = self._entries()
+        entries[path] = {"version": version or file_version(path), "file_id": file_id}
+        store.put(FILE_IDS_KEY, entries)
+
+    def forget(self, path):
+        entries = self._entries()
+        if entries.pop(path, None) is not None:
+            store.put(FILE_IDS_KEY, entries)
+
+    async def _call(self, call, path, version):
+        file_id = self.get(path, version)
+        if file_id:
+            try:
+                return await call(file_id)
+            except BadRequest as e:
+                if "not modified" in str(e):
+                    raise
+                logging.warning(f"Cached file_id for {path} was rejected, uploading again: {e}")
+                self.forget(path)
+
+        with open(path, 'rb') as f:
+            message = await call(f)
+        if getattr(message, "photo", None):
+            self.remember(path, message.photo[-1].file_id, version)
+        return message
+
+    async def send(self, send_photo, path, version=None, **kwargs):
+        """send_photo is e.g. message.reply_photo or bot.send_photo; returns the sent message.
+
+        ``version`` saves the stat() call when the caller already knows it (see skins.Skin).
+        """
+        return await self._call(lambda photo: send_photo(photo=photo, **kwargs), path, version)
+
+    async def edit(self, edit_message_media, path, version=None, caption=None, parse_mode=None, **kwargs):
+        """Replaces the photo of a sent message; kwargs (e.g. reply_markup) go to edit_message_media."""
+        return await self._call(
+            lambda photo: edit_message_media(media=InputMediaPhoto(photo, caption=caption, parse_mode=parse_mode),
+                                             **kwargs),
+            path, version)
+
+
+photo_cache = PhotoCache()
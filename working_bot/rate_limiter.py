@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from telegram.ext import BaseRateLimiter
+
+from common.outbound import outbound, method_priority, SEND_METHODS
+
+
+class OutboundRateLimiter(BaseRateLimiter):
+    """Routes every Bot API request of the application through the outbound dispatcher.
+
+    ``rate_limit_args`` of a call, when given, is used as its priority.
+    """
+
+    def __init__(self, dispatcher=outbound):
+        self.dispatcher = dispatcher
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        await self.dispatcher.stop()
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        priority = rate_limit_args if rate_limit_args is not None else method_priority(endpoint)
+        chat_id = data.get("chat_id") if endpoint in SEND_METHODS else None
+        return await self.dispatcher.run(lambda: callback(*args, **kwargs), chat_id, priority)
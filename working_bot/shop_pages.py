@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+
+from PIL import Image, ImageDraw, ImageFont
+
+from photo_cache import photo_cache
+from skins import SKINS_DIR
+
+# Готові сторінки магазину; каталог не є категорією скінів, тож каталог скінів його не сканує
+SHOP_PAGES_DIR = os.path.join(SKINS_DIR, ".pages")
+TILE_SIZE = 320  # Клітинка одного скіна на сторінці (пікселі)
+TILE_PADDING = 16
+PAGE_COLUMNS = 3
+PAGE_BACKGROUND = (255, 255, 255)
+NUMBER_COLOR = (40, 40, 40)
+PAGE_QUALITY = 85
+
+
+def page_version(skins):
+    """Changes whenever a skin of the page is added, removed or replaced."""
+    digest = hashlib.sha1("\n".join(f"{skin.path}:{skin.version}" for skin in skins).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def page_path(category, page_number, version):
+    return os.path.join(SHOP_PAGES_DIR, f"{category}_{page_number}_{version}.jpg")
+
+
+def render_page(category, page_number, skins):
+    """Draws the skins of a shop page into one numbered grid image; returns (path, version).
+
+    A page is drawn once per set of skin files, the previous render of the
+    same page is deleted together with its file_id. Blocking, run it in a thread.
+    """
+    version = page_version(skins)
+    path = page_path(category, page_number, version)
+    if os.path.exists(path):
+        return path, version
+
+    columns = min(len(skins), PAGE_COLUMNS)
+    rows = (len(skins) + columns - 1) // columns
+    page = Image.new("RGB", (columns * TILE_SIZE, rows * TILE_SIZE), PAGE_BACKGROUND)
+    draw = ImageDraw.Draw(page)
+    font = ImageFont.load_default(size=TILE_SIZE // 10)
+    for index, skin in enumerate(skins):
+        left = index % columns * TILE_SIZE
+        top = index // columns * TILE_SIZE
+        with Image.open(skin.path) as image:
+            image = image.convert("RGBA")
+        image.thumbnail((TILE_SIZE - 2 * TILE_PADDING, TILE_SIZE - 2 * TILE_PADDING))
+        page.paste(image, (left + (TILE_SIZE - image.width) // 2, top + (TILE_SIZE - image.height) // 2), image)
+        # Номер збігається з номером скіна в підписі сторінки
+        draw.text((left + TILE_PADDING // 2, top + TILE_PADDING // 4), str(index + 1), fill=NUMBER_COLOR, font=font)
+
+    os.makedirs(SHOP_PAGES_DIR, exist_ok=True)
+    temp_path = path + ".tmp"
+    page.save(temp_path, "JPEG", quality=PAGE_QUALITY)
+    os.replace(temp_path, path)
+
+    prefix = f"{category}_{page_number}_"
+    for name in os.listdir(SHOP_PAGES_DIR):
+        if name.startswith(prefix) and name != os.path.basename(path):
+            old_path = os.path.join(SHOP_PAGES_DIR, name)
+            photo_cache.forget(old_path)
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+    return path, version
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import threading
+
+SKINS_DIR = "skins"
+# Категорія магазину -> каталог зі скінами
+SKIN_CATEGORIES = {
+    "profile": "profile_skins",
+    "kiss": "kiss_skins",
+    "hug": "hug_skins",
+    "dance": "dance_skins",
+}
+SKIN_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+SKIN_PRICE = 100
+# Як часто перевіряємо, чи змінились каталоги скінів (секунди)
+CATALOG_POLL_INTERVAL = 30
+
+
+class Skin:
+    __slots__ = ("name", "category", "path", "size", "mtime_ns", "price")
+
+    def __init__(self, name, category, path, size, mtime_ns, price=SKIN_PRICE):
+        self.name = name
+        self.category = category  # каталог, напр. "profile_skins"
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.price = price
+
+    @property
+    def version(self):
+        return f"{self.mtime_ns}:{self.size}"
+
+
+class SkinCatalog:
+    """All skins in memory: name -> Skin, plus a sorted name list per category.
+
+    A background thread re-scans a category only when the mtime of its
+    directory changes, so lookups never touch the filesystem.
+    """
+
+    def __init__(self, skins_dir=SKINS_DIR, poll_interval=CATALOG_POLL_INTERVAL):
+        self.skins_dir = skins_dir
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._dir_mtimes = {}
+        self._by_category = {}
+        self._by_name = {}
+        self._loaded = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _scan(self, category):
+        directory = os.path.join(self.skins_dir, category)
+        skins = {}
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith(SKIN_EXTENSIONS) and entry.is_file():
+                        stat = entry.stat()
+                        skins[entry.name] = Skin(entry.name, category, entry.path, stat.st_size, stat.st_mtime_ns)
+        except OSError as e:
+            logging.error(f"Error loading skins from {directory}: {e}")
+        return skins
+
+    def refresh(self):
+        changed = False
+        for category in SKIN_CATEGORIES.values():
+            try:
+                mtime = os.stat(os.path.join(self.skins_dir, category)).st_mtime_ns
+            except OSError:
+                mtime = None
+            if self._loaded and self._dir_mtimes.get(category) == mtime:
+                continue
+            skins = self._scan(category)
+            with self._lock:
+                self._dir_mtimes[category] = mtime
+                self._by_category[category] = [skins[name] for name in sorted(skins)]
+            changed = True
+        if changed:
+            with self._lock:
+                by_name = {}
+                # Як і раніше, при однакових назвах перемагає перша категорія
+                for category in SKIN_CATEGORIES.values():
+                    for skin in self._by_category.get(category, []):
+                        by_name.setdefault(skin.name, skin)
+                self._by_name = by_name
+            logging.info(f"Skin catalog loaded: {len(by_name)} skins")
+        self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.refresh()
+
+    def find(self, name, category=None):
+        """Skin by file name, optionally only within one category directory."""
+        self._ensure_loaded()
+        if category is None:
+            return self._by_name.get(name)
+        for skin in self._by_category.get(category, []):
+            if skin.name == name:
+                return skin
+        return None
+
+    def names(self, category):
+        self._ensure_loaded()
+        return [skin.name for skin in self._by_category.get(category, [])]
+
+    def page(self, category, page_number, per_page):
+        """(skins of the page, total skins in the category)."""
+        self._ensure_loaded()
+        skins = self._by_category.get(category, [])
+        start_index = page_number * per_page
+        return skins[start_index:start_index + per_page], len(skins)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.refresh()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"Skin catalog refresh failed: {e}")
+
+
+skin_catalog = SkinCatalog()
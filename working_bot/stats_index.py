@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from common.storage import store, stats_key
+
+
+def normalize_name(name):
+    return name.strip().casefold()
+
+
+class NameIndex:
+    """Custom name -> user_id index per chat, kept in sync with every statistics write.
+
+    Names are compared case-insensitively. A chat's index is built on first
+    use and afterwards updated from the store's put() notifications.
+    ``version(chat_id)`` changes whenever a custom name in the chat changes.
+    Writes come from handlers and from rollover threads alike, so every
+    access goes through one lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._by_name = {}
+        self._by_user = {}
+        self._versions = {}
+
+    def find(self, chat_id, name):
+        with self._lock:
+            by_name, _ = self._ensure(str(chat_id))
+            return by_name.get(normalize_name(name))
+
+    def version(self, chat_id):
+        chat_id = str(chat_id)
+        with self._lock:
+            self._ensure(chat_id)
+            return self._versions.get(chat_id, 0)
+
+    def is_taken(self, chat_id, name, user_id=None):
+        owner = self.find(chat_id, name)
+        return owner is not None and owner != str(user_id)
+
+    def on_stats_change(self, key, data, rows):
+        kind, chat_id, _ = key
+        if kind != "stats":
+            return
+        with self._lock:
+            if chat_id not in self._by_name:
+                return
+            if rows is None:
+                self._build(chat_id, data)
+                return
+            for user_id in rows:
+                self._set(chat_id, user_id, data.get(user_id, {}).get("name"))
+
+    def _ensure(self, chat_id):
+        if chat_id not in self._by_name:
+            self._build(chat_id, store.get(stats_key(chat_id)) or {})
+        return self._by_name[chat_id], self._by_user[chat_id]
+
+    def _build(self, chat_id, stats):
+        old_names = self._by_user.get(chat_id)
+        self._by_name[chat_id] = {}
+        self._by_user[chat_id] = {}
+        for user_id, user_stats in list(stats.items()):
+            self._set(chat_id, user_id, user_stats.get("name"), bump=False)
+        if old_names is not None and old_names != self._by_user[chat_id]:
+            self._bump(chat_id)
+
+    def _set(self, chat_id, user_id, name, bump=True):
+        # by_user keeps names as they are shown, by_name is keyed by the normalized form
+        by_name = self._by_name[chat_id]
+        by_user = self._by_user[chat_id]
+        old_name = by_user.pop(user_id, None)
+        if old_name is not None and by_name.get(normalize_name(old_name)) == user_id:
+            del by_name[normalize_name(old_name)]
+        if name:
+            by_user[user_id] = name
+            by_name.setdefault(normalize_name(name), user_id)
+        if bump and old_name != (name or None):
+            self._bump(chat_id)
+
+    def _bump(self, chat_id):
+        self._versions[chat_id] = self._versions.get(chat_id, 0) + 1
+
+
+name_index = NameIndex()
+store.add_listener(name_index.on_stats_change)
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Модулі бота імпортують один одного як верхньорівневі (from journal import journal),
+# спільні з refactor_aiogram_bot - з пакета common на рівень вище
+BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(BOT_DIR))
+sys.path.insert(0, BOT_DIR)
+
+# bot.py бере токени з config.py, а сховище створює каталоги в поточному каталозі
+SANDBOX = tempfile.mkdtemp(prefix="working_bot_tests_")
+with open(os.path.join(SANDBOX, "config.py"), "w", encoding="utf-8") as f:
+    f.write('TELEGRAM_TOKEN = "123456:TEST"\n'
+            'ADMIN_IDS = []\n'
+            'MISTRAL_API_KEY = "test"\n'
+            'MISTRAL_API_URL = "http://127.0.0.1:9/v1/chat/completions"\n')
+sys.path.insert(0, SANDBOX)
+os.chdir(SANDBOX)
+
+from common.storage import store, JsonBackend  # noqa: E402
+from leaderboards import leaderboards  # noqa: E402
+from global_stats import global_stats  # noqa: E402
+from hours_history import hours_history  # noqa: E402
+from stats_index import name_index  # noqa: E402
+from directory import user_directory  # noqa: E402
+
+
+def reset_caches():
+    """Forgets everything the shared singletons loaded, as after a restart."""
+    store._cache.clear()
+    store._dirty.clear()
+    store._dirty_rows.clear()
+    leaderboards.invalidate()
+    global_stats._sums = None
+    global_stats._boards = None
+    global_stats._stale.clear()
+    global_stats._changed = False
+    hours_history.reset()
+    name_index._by_name.clear()
+    name_index._by_user.clear()
+    user_directory._usernames.clear()
+
+
+@pytest.fixture
+def json_store(tmp_path, monkeypatch):
+    """The shared store on an empty JSON tree in tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(store, "backend", JsonBackend())
+    reset_caches()
+    yield store
+    reset_caches()
+
+
+@pytest.fixture
+def sqlite_store(tmp_path, monkeypatch):
+    """The shared store on an empty SQLite database in tmp_path."""
+    from common.sqlite_storage import SqliteBackend
+    monkeypatch.chdir(tmp_path)
+    backend = SqliteBackend(str(tmp_path / "bot.db"))
+    monkeypatch.setattr(store, "backend", backend)
+    reset_caches()
+    yield store
+    reset_caches()
+    backend.close()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from global_stats import global_stats, GLOBAL_KEY
+from common.schedule_mask import Schedule
+from common.storage import store, schedule_key, stats_key
+from conftest import reset_caches
+
+
+def test_first_write_of_an_unflushed_chat_is_counted(json_store):
+    store.put(schedule_key("-1", "today"), Schedule.from_legacy({"15:00 - 16:00": [1]}))
+    store.flush()
+    # Чат -2 ще не записаний на диск, тож побудова сум його не бачить
+    store.put(schedule_key("-2", "today"), Schedule.from_legacy({"15:00 - 16:00": [2]}))
+    store.put(stats_key("-2"), {"2": {"total": 4, "currency": 1}})
+
+    assert dict(global_stats.top("users", "total", 5)) == {"2": 4}
+    assert dict(global_stats.top("chats", "currency", 5)) == {"-2": 1}
+
+
+def test_sums_follow_row_writes_and_survive_a_restart(json_store):
+    store.put(stats_key("-1"), {"1": {"total": 3}, "2": {"total": 5}})
+    stats = store.get(stats_key("-1"))
+    stats["1"]["total"] = 10
+    store.put(stats_key("-1"), stats, rows=["1"])
+    del stats["2"]
+    store.put(stats_key("-1"), stats, rows=["2"])
+    store.put(stats_key("-2"), {"1": {"total": 1}})
+    assert dict(global_stats.top("users", "total", 5)) == {"1": 11}
+
+    store.flush()
+    reset_caches()
+    assert dict(global_stats.top("users", "total", 5)) == {"1": 11}
+    assert dict(global_stats.top("chats", "total", 5)) == {"-1": 10, "-2": 1}
+
+
+def test_writes_before_the_build_wait_for_it(json_store):
+    store.put(stats_key("-1"), {"1": {"total": 2}})
+    store.flush()
+    reset_caches()
+
+    # Запис зі статистикою не будує суми сам, а лише чекає на build()
+    stats = store.get(stats_key("-1"))
+    stats["1"]["total"] = 7
+    store.put(stats_key("-1"), stats, rows=["1"])
+    assert not global_stats.ready
+    assert store.backend.read(GLOBAL_KEY) is None
+
+    global_stats.build()
+    assert dict(global_stats.top("users", "total", 5)) == {"1": 7}
+
+
+def test_writes_during_the_build_are_counted(json_store, monkeypatch):
+    store.put(schedule_key("-1", "today"), Schedule.from_legacy({"15:00 - 16:00": [1]}))
+    store.put(stats_key("-1"), {"1": {"total": 2}})
+    store.flush()
+    reset_caches()
+    list_chats = store.backend.list_chats
+
+    def list_chats_while_writing():
+        # Обробники пишуть, поки потік будує суми
+        store.put(stats_key("-1"), {"1": {"total": 3}})
+        store.put(stats_key("-2"), {"5": {"total": 4}})
+        return list_chats()
+
+    monkeypatch.setattr(store.backend, "list_chats", list_chats_while_writing)
+    global_stats.build()
+    assert dict(global_stats.top("users", "total", 5)) == {"5": 4, "1": 3}
+    assert dict(global_stats.top("chats", "total", 5)) == {"-2": 4, "-1": 3}
+
+
+def test_sums_are_saved_once_per_flush(json_store):
+    store.put(stats_key("-1"), {"1": {"total": 1}})
+    global_stats.build()
+    store.flush()
+
+    for total in range(2, 5):
+        store.put(stats_key("-1"), {"1": {"total": total}})
+        assert not store.is_dirty(GLOBAL_KEY)
+    store.flush()
+    assert store.backend.read(GLOBAL_KEY)["users"] == {"1": [4, 0]}
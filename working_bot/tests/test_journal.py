@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+from journal import ScheduleJournal
+from common.schedule_edit import compile_edit, apply_edit
+from common.schedule_mask import Schedule
+from common.storage import store, schedule_key
+from conftest import reset_caches
+
+CHAT = "-100"
+KEY = schedule_key(CHAT, "today")
+TEMPLATE = {"15:00 - 16:00": [], "16:00 - 17:00": [], "17:00 - 18:00": [5], "18:00 - 19:00": []}
+
+
+@pytest.fixture
+def journal(json_store, tmp_path):
+    store.put(KEY, Schedule.from_legacy(TEMPLATE))
+    store.flush()
+    journal = ScheduleJournal(str(tmp_path / "journal.log"), max_entries=100)
+    yield journal
+    journal.stop()
+
+
+def edit(journal, user_id, text):
+    diff = apply_edit(store.get(KEY), user_id, compile_edit(text))
+    journal.record(CHAT, "today", user_id, diff.journal_ops())
+
+
+def slots(schedule):
+    # Порядок людей у годині після запису на диск може змінитися, важливо хто саме
+    return {time_slot: set(users) for time_slot, users in schedule.items()}
+
+
+def journal_lines(journal):
+    with open(journal.file_name, encoding='utf-8') as f:
+        return f.read().splitlines()
+
+
+def test_replay_restores_edits_lost_in_a_crash(journal):
+    edit(journal, 7, "+15-17")
+    edit(journal, 8, "+16-18")
+    edit(journal, 7, "-16")
+    edited = store.get(KEY).copy()
+
+    # Падіння: кеш втрачено, на диску лише графік до змін і журнал
+    reset_caches()
+    assert slots(store.get(KEY)) == slots(Schedule.from_legacy(TEMPLATE))
+
+    ScheduleJournal(journal.file_name).replay()
+    assert slots(store.get(KEY)) == slots(edited)
+    assert journal_lines(journal) == []
+    reset_caches()
+    assert slots(store.get(KEY)) == slots(edited)
+
+
+def test_undo_round_trips(journal):
+    edit(journal, 7, "+15-17")
+    edit(journal, 8, "+17")
+    edit(journal, 7, "-15")
+
+    assert journal.undo(CHAT, 7)["user"] == 7
+    assert journal.undo(CHAT, 8)["user"] == 8
+    assert journal.undo(CHAT, 7)["user"] == 7
+    assert journal.undo(CHAT) is None
+    assert slots(store.get(KEY)) == slots(Schedule.from_legacy(TEMPLATE))
+
+    # Скасування теж у журналі: після падіння графік відновлюється вже без змін
+    reset_caches()
+    ScheduleJournal(journal.file_name).replay()
+    assert slots(store.get(KEY)) == slots(Schedule.from_legacy(TEMPLATE))
+
+
+def test_undo_removes_the_latest_of_identical_edits(journal):
+    edit(journal, 7, "+15")
+    edit(journal, 8, "+16")
+    edit(journal, 7, "-15")
+    edit(journal, 7, "+15")
+
+    journal.undo(CHAT, 7)
+    # Лишились "+15", "+16", "-15" користувачів 7, 8, 7 - останнім скасовується "-15"
+    entry = journal.undo(CHAT)
+    assert (entry["user"], entry["ops"][0]["op"]) == (7, "remove")
+    assert journal.undo(CHAT)["user"] == 8
+
+
+def test_compaction_keeps_edits_logged_while_flushing(journal, monkeypatch):
+    edit(journal, 7, "+15")
+    flush = store.flush
+
+    def flush_with_concurrent_edit():
+        edit(journal, 8, "+16")
+        flush()
+
+    monkeypatch.setattr(store, "flush", flush_with_concurrent_edit)
+    journal.compact()
+    monkeypatch.setattr(store, "flush", flush)
+
+    lines = journal_lines(journal)
+    assert len(lines) == 1 and '"user": 8' in lines[0]
+    edited = store.get(KEY).copy()
+    reset_caches()
+    ScheduleJournal(journal.file_name).replay()
+    assert slots(store.get(KEY)) == slots(edited)
+
+
+def test_record_leaves_compaction_to_the_background_thread(json_store, tmp_path):
+    store.put(KEY, Schedule.from_legacy(TEMPLATE))
+    journal = ScheduleJournal(str(tmp_path / "journal.log"), max_entries=2)
+    edit(journal, 7, "+15")
+    edit(journal, 7, "+16")
+    assert len(journal_lines(journal)) == 2
+    assert journal._wake.is_set()
+
+    journal.start()
+    journal._thread.join(timeout=0.5)
+    assert journal_lines(journal) == []
+    journal.stop()
+
+
+def test_edit_during_a_forced_sqlite_rollover_is_kept(sqlite_store, tmp_path, monkeypatch):
+    import bot
+    journal = ScheduleJournal(str(tmp_path / "journal.log"))
+    monkeypatch.setattr(bot, "journal", journal)
+    monkeypatch.setattr(bot.lazy_rollover, "ensure", lambda chat_id: None)
+    store.put(KEY, Schedule.from_legacy(TEMPLATE))
+    store.put(schedule_key(CHAT, "tomorrow"), Schedule.from_legacy({"16:00 - 17:00": [], "17:00 - 18:00": []}))
+    store.flush()
+
+    compact = journal.compact
+    editors = []
+
+    def compact_while_editing():
+        compact()
+        # Правка приходить між зливанням журналу і переносом дня
+        editor = threading.Thread(target=bot.apply_schedule_edit, args=(CHAT, "today", 8, compile_edit("+16")))
+        editor.start()
+        # Правка чекає на замок сховища, поки /update не скине кеш
+        editor.join(timeout=0.2)
+        editors.append(editor)
+
+    monkeypatch.setattr(journal, "compact", compact_while_editing)
+    bot.update_schedules()
+    editors[0].join()
+
+    # Правка дочекалась переносу і лягла на новий сьогоднішній графік
+    assert slots(store.get(KEY)) == {"16:00 - 17:00": {8}, "17:00 - 18:00": set()}
+    monkeypatch.setattr(journal, "compact", compact)
+    journal.compact()
+    reset_caches()
+    assert slots(store.get(KEY)) == {"16:00 - 17:00": {8}, "17:00 - 18:00": set()}
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from conversation import ConversationMemory
+from llm_cache import PromptCache, context_digest
+
+
+def context(conversations, chat_id, message):
+    return context_digest(conversations.build_prompt(chat_id, message)[:-1])
+
+
+def test_answers_are_reused_only_in_the_same_conversation_context():
+    cache = PromptCache(persist=False)
+    conversations = ConversationMemory()
+    assert context(conversations, -1, "Привіт!") == ""
+    cache.set("model", "Привіт!", "Вітаю", context(conversations, -1, "Привіт!"))
+    assert cache.get("model", "  привіт ", context(conversations, -2, "привіт")) == "Вітаю"
+
+    # Чати з однаковою історією ділять відповіді, з іншою - ні
+    for chat_id in (-1, -2):
+        conversations.remember(chat_id, "Хто чергує?", "Олена")
+    conversations.remember(-3, "Хто чергує?", "Петро")
+    cache.set("model", "А завтра?", "Тарас", context(conversations, -1, "А завтра?"))
+    assert cache.get("model", "А завтра?", context(conversations, -2, "А завтра?")) == "Тарас"
+    assert cache.get("model", "А завтра?", context(conversations, -3, "А завтра?")) is None
+    assert cache.get("model", "А завтра?") is None
+    assert (cache.hits, cache.misses) == (2, 2)
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from llm_scheduler import LlmScheduler
+
+
+def test_chats_are_served_round_robin_within_the_in_flight_cap():
+    async def scenario():
+        scheduler = LlmScheduler(max_in_flight=2, max_queue=4)
+        started = []
+        running = {}
+        peak = 0
+
+        def prompt(name):
+            async def call():
+                nonlocal peak
+                started.append(name)
+                running[name] = asyncio.Event()
+                peak = max(peak, len(running))
+                await running[name].wait()
+                del running[name]
+                return name
+            return call
+
+        # Галаслива група встигає поставити чотири запити раніше за інших
+        submits = [scheduler.submit(chat_id, prompt(f"{chat_id}{number}"))
+                   for chat_id, count in (("A", 4), ("B", 2), ("C", 1))
+                   for number in range(1, count + 1)]
+        results = asyncio.gather(*submits)
+        await asyncio.sleep(0)
+        while len(started) < len(submits) or running:
+            await asyncio.sleep(0.001)
+            assert len(running) <= 2
+            if running:
+                running[next(iter(running))].set()  # завершуємо найстаріший запит
+
+        assert await results == ["A1", "A2", "A3", "A4", "B1", "B2", "C1"]
+        assert peak == 2
+        # Після двох перших запитів групи A решта чатів чекає не всю її чергу, а по одному запиту
+        assert started == ["A1", "A2", "A3", "B1", "C1", "A4", "B2"]
+        assert scheduler.metrics()["completed"] == 7
+
+    asyncio.run(scenario())
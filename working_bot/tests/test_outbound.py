@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+from datetime import timedelta
+
+import pytest
+from telegram.error import RetryAfter
+
+from common.outbound import OutboundDispatcher, GROUP_BURST, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+
+
+def test_interactive_calls_are_granted_before_background_ones():
+    async def scenario():
+        dispatcher = OutboundDispatcher()
+        granted = []
+
+        async def send(name, chat_id, priority):
+            await dispatcher.acquire(chat_id, priority)
+            granted.append(name)
+
+        await asyncio.gather(
+            send("getChat 1", None, PRIORITY_BACKGROUND),
+            send("getChat 2", None, PRIORITY_BACKGROUND),
+            send("sendMessage", -1, PRIORITY_INTERACTIVE),
+        )
+        await dispatcher.stop()
+        return granted
+
+    assert asyncio.run(scenario()) == ["sendMessage", "getChat 1", "getChat 2"]
+
+
+def test_a_chat_out_of_tokens_does_not_hold_up_other_chats():
+    async def scenario():
+        dispatcher = OutboundDispatcher()
+        granted = []
+
+        async def send(chat_id):
+            await dispatcher.acquire(chat_id)
+            granted.append(chat_id)
+
+        # Шосте повідомлення групі -1 чекає на токен ~3 секунди, група -2 - ні
+        busy = [asyncio.create_task(send(-1)) for _ in range(GROUP_BURST + 1)]
+        await asyncio.wait_for(send(-2), 1)
+        await dispatcher.stop()
+        for task in busy:
+            task.cancel()
+        return granted
+
+    assert asyncio.run(scenario()) == [-1] * GROUP_BURST + [-2]
+
+
+def flood_call(failures, seconds, calls):
+    async def call():
+        calls.append(time.monotonic())
+        if len(calls) <= failures:
+            raise RetryAfter(timedelta(seconds=seconds))
+        return "ok"
+    return call
+
+
+def test_retry_after_pauses_the_chat_and_retries():
+    async def scenario():
+        dispatcher = OutboundDispatcher()
+        calls = []
+        started = time.monotonic()
+        result = await dispatcher.run(flood_call(1, 0.2, calls), -1)
+        # Інший чат пауза не зачіпає
+        await asyncio.wait_for(dispatcher.acquire(-2), 0.1)
+        await dispatcher.stop()
+        return result, calls, started, dispatcher.retries
+
+    result, calls, started, retries = asyncio.run(scenario())
+    assert result == "ok" and retries == 1
+    assert len(calls) == 2 and calls[1] - calls[0] >= 0.2
+
+
+def test_retry_after_gives_up_after_max_retries():
+    async def scenario():
+        dispatcher = OutboundDispatcher(max_retries=1)
+        calls = []
+        try:
+            with pytest.raises(RetryAfter):
+                await dispatcher.run(flood_call(5, 0.01, calls), -1)
+        finally:
+            await dispatcher.stop()
+        return calls
+
+    assert len(asyncio.run(scenario())) == 2
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import copy
+import threading
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import bot
+from global_stats import global_stats
+from hours_history import hours_history
+from leaderboards import leaderboards
+from common.rollover import run_rollover, meta_key, LazyRollover, rolling_over
+from common.schedule_mask import Schedule
+from common.storage import store, schedule_key, stats_key
+from conftest import reset_caches
+
+TODAY = {
+    "-1": {"15:00 - 16:00": [1], "16:00 - 17:00": [1, 2]},
+    "-2": {"15:00 - 16:00": [1, 3], "16:00 - 17:00": [3], "17:00 - 18:00": [3]},
+    "-3": {"20:00 - 21:00": [2], "21:00 - 22:00": [2]},
+}
+WORKED_DAY = date(2026, 10, 14)
+
+
+@pytest.fixture(autouse=True)
+def no_lazy_rollover(monkeypatch):
+    monkeypatch.setattr(bot.lazy_rollover, "ensure", lambda chat_id: None)
+
+
+def seed_chats():
+    for chat_id, today in TODAY.items():
+        store.put(schedule_key(chat_id, "today"), Schedule.from_legacy(today))
+    store.flush()
+    store.put(stats_key("-1"), {"1": {"total": 10, "yesterday": 0, "currency": 0}})
+    store.flush()
+
+
+def derived_state():
+    return {
+        "global_users": dict(global_stats.top("users", "total", 5)),
+        "global_chats": dict(global_stats.top("chats", "total", 5)),
+        "chat_top": dict(leaderboards.top("-1", "total", 5)),
+        "history": dict(hours_history.top("-2", WORKED_DAY, WORKED_DAY, 5)),
+    }
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_pool_rollover_keeps_aggregates_in_sync(json_store, executor):
+    seed_chats()
+    # Індекси вже зібрані до переносу, як у працюючому боті
+    before = derived_state()
+    assert before["global_users"] == {"1": 10}
+
+    report = run_rollover(bot.rollover_chat, list(TODAY), bot.kyiv_tz.localize(datetime(2026, 10, 15)),
+                          workers=2, executor=executor)
+    assert report.failed == []
+
+    expected = {
+        "global_users": {"1": 13, "2": 3, "3": 3},
+        "global_chats": {"-1": 13, "-2": 4, "-3": 2},
+        "chat_top": {"1": 12, "2": 1},
+        "history": {"3": 3, "1": 1},
+    }
+    assert derived_state() == expected
+
+    # Те саме після перезапуску, тобто з того, що записано на диск
+    store.flush()
+    reset_caches()
+    assert derived_state() == expected
+
+
+def mark_yesterday(chat_ids):
+    yesterday = datetime.now(bot.kyiv_tz).date() - timedelta(days=1)
+    for chat_id in chat_ids:
+        store.put(meta_key(chat_id), {"rolled_through": yesterday.isoformat()})
+
+
+def assert_not_replayed(chat_id):
+    # Справжній ensure (фікстура підміняє його лише на об'єкті)
+    stats = copy.deepcopy(store.get(stats_key(chat_id)))
+    LazyRollover.ensure(bot.lazy_rollover, chat_id)
+    assert store.get(stats_key(chat_id)) == stats
+
+
+def test_pool_rollover_records_the_day(json_store):
+    seed_chats()
+    mark_yesterday(TODAY)
+    now = datetime.now(bot.kyiv_tz)
+    run_rollover(bot.rollover_chat, list(TODAY), now, workers=2)
+
+    for chat_id in TODAY:
+        assert store.get(meta_key(chat_id)) == {"rolled_through": now.date().isoformat()}
+    assert_not_replayed("-1")
+
+
+def test_sqlite_forced_rollover_records_the_day(sqlite_store):
+    seed_chats()
+    mark_yesterday(TODAY)
+    bot.update_schedules()
+
+    today = datetime.now(bot.kyiv_tz).date().isoformat()
+    for chat_id in TODAY:
+        assert store.get(meta_key(chat_id)) == {"rolled_through": today}
+    assert_not_replayed("-1")
+
+
+def test_ensure_catches_up_every_missed_day(json_store):
+    default = {"15:00 - 16:00": [9]}
+    store.put(schedule_key("-1", "today"), Schedule.from_legacy({"15:00 - 16:00": [7], "16:00 - 17:00": [7]}))
+    store.put(schedule_key("-1", "tomorrow"), Schedule.from_legacy({"15:00 - 16:00": [8]}))
+    store.put(schedule_key("-1", "weekday_default"), Schedule.from_legacy(default))
+    store.put(schedule_key("-1", "weekend_default"), Schedule.from_legacy(default))
+    today = datetime.now(bot.kyiv_tz).date()
+    store.put(meta_key("-1"), {"rolled_through": (today - timedelta(days=3)).isoformat()})
+
+    lazy = LazyRollover(bot.rollover_chat, bot.kyiv_tz)
+    lazy.ensure("-1")
+
+    # Три пропущені дні: сьогоднішній графік, завтрашній і стандартний
+    stats = store.get(stats_key("-1"))
+    assert {user_id: user_stats["total"] for user_id, user_stats in stats.items()} == {"7": 2, "8": 1, "9": 1}
+    assert {user_id: user_stats["yesterday"] for user_id, user_stats in stats.items()} == {"7": 0, "8": 0, "9": 1}
+    assert store.get(meta_key("-1")) == {"rolled_through": today.isoformat()}
+    assert dict(hours_history.top("-1", today - timedelta(days=3), today, 5)) == {"7": 2, "8": 1, "9": 1}
+
+    # Повторне звернення того ж дня нічого не переносить
+    lazy.ensure("-1")
+    lazy._checked.clear()
+    lazy.ensure("-1")
+    assert {user_id: user_stats["total"] for user_id, user_stats in stats.items()} == {"7": 2, "8": 1, "9": 1}
+
+
+def test_ensure_starts_tracking_an_unknown_chat(json_store):
+    seed_chats()
+    lazy = LazyRollover(bot.rollover_chat, bot.kyiv_tz)
+    lazy.ensure("-1")
+    assert store.get(meta_key("-1")) == {"rolled_through": datetime.now(bot.kyiv_tz).date().isoformat()}
+    assert store.get(stats_key("-1")) == {"1": {"total": 10, "yesterday": 0, "currency": 0}}
+
+
+def test_sweep_rolls_idle_chats(json_store, monkeypatch):
+    monkeypatch.setattr("common.rollover.SWEEP_PAUSE", 0)
+    seed_chats()
+    mark_yesterday(TODAY)
+    lazy = LazyRollover(bot.rollover_chat, bot.kyiv_tz)
+    lazy.sweep()
+
+    today = datetime.now(bot.kyiv_tz).date().isoformat()
+    for chat_id in TODAY:
+        assert store.get(meta_key(chat_id)) == {"rolled_through": today}
+    assert dict(global_stats.top("users", "total", 5)) == {"1": 13, "2": 3, "3": 3}
+
+
+@pytest.mark.parametrize("backend,executor", [("json", "thread"), ("json", "process"), ("sqlite", None)])
+def test_forced_update_rolls_a_chat_over_once(backend, executor, request, monkeypatch):
+    request.getfixturevalue(f"{backend}_store")
+    # Справжній ensure: /update не має перед переносом ще й доганяти пропущений день
+    monkeypatch.delattr(bot.lazy_rollover, "ensure")
+    monkeypatch.setattr(bot.lazy_rollover, "_checked", {})
+    monkeypatch.setattr(bot, "ROLLOVER_EXECUTOR", executor)
+    store.put(schedule_key("-1", "today"), Schedule.from_legacy({"15:00 - 16:00": [7]}))
+    store.put(schedule_key("-1", "tomorrow"), Schedule.from_legacy({"15:00 - 16:00": [8]}))
+    store.flush()
+    mark_yesterday(["-1"])
+
+    bot.update_schedules()
+
+    stats = store.get(stats_key("-1"))
+    assert {user_id: user_stats["total"] for user_id, user_stats in stats.items()} == {"7": 1}
+    assert store.get(schedule_key("-1", "today")).to_legacy() == {"15:00 - 16:00": [8]}
+    assert store.get(meta_key("-1")) == {"rolled_through": datetime.now(bot.kyiv_tz).date().isoformat()}
+
+
+def test_catch_up_runs_off_the_event_loop(json_store, monkeypatch):
+    monkeypatch.delattr(bot.lazy_rollover, "ensure")
+    monkeypatch.setattr(bot.lazy_rollover, "_checked", {})
+    seed_chats()
+    mark_yesterday(["-1"])
+    update = type("Update", (), {"effective_chat": type("Chat", (), {"id": -1})()})()
+    sweep_holds_chat = threading.Event()
+    release = threading.Event()
+
+    def sweep():
+        with rolling_over("-1"):
+            sweep_holds_chat.set()
+            release.wait(5)
+
+    async def handle_while_the_sweep_holds_the_chat():
+        ticks = 0
+        catch_up = asyncio.create_task(bot.catch_up_rollover(update, None))
+        # Цикл подій живий, поки обробник чекає на чат
+        while ticks < 5:
+            await asyncio.sleep(0.01)
+            ticks += 1
+        assert not catch_up.done()
+        release.set()
+        await catch_up
+
+    holder = threading.Thread(target=sweep)
+    holder.start()
+    sweep_holds_chat.wait(5)
+    asyncio.run(handle_while_the_sweep_holds_the_chat())
+    holder.join()
+    assert bot.lazy_rollover.is_current("-1")
+    assert store.get(stats_key("-1"))["1"]["total"] == 12
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+import bot
+from common.names import name_cache
+from common.schedule_mask import Schedule
+
+CHAT = "-300"
+
+
+class FlakyBot:
+    """get_chat fails for the first ``failures`` calls, as on a network hiccup."""
+
+    def __init__(self, failures):
+        self.failures = failures
+
+    async def get_chat(self, user_id):
+        if self.failures:
+            self.failures -= 1
+            raise TimeoutError("Timed out")
+        return type("Chat", (), {"id": int(user_id), "first_name": "Olena", "username": None})()
+
+
+class Context:
+    def __init__(self, bot):
+        self.bot = bot
+
+
+class Update:
+    effective_chat = type("Chat", (), {"id": CHAT})()
+
+
+@pytest.fixture
+def schedule(json_store):
+    name_cache._entries.clear()
+    return Schedule.from_legacy({"15:00 - 16:00": [41], "16:00 - 17:00": []})
+
+
+def render(schedule, flaky_bot):
+    return asyncio.run(bot.get_schedule_text(schedule, "01.01.2027", Context(flaky_bot), Update()))
+
+
+def test_text_with_an_unresolved_name_is_not_cached(schedule):
+    flaky_bot = FlakyBot(failures=1)
+    assert "unknown" in render(schedule, flaky_bot)
+    # Той самий графік і ті самі імена: тепер get_chat відповідає, і ім'я з'являється
+    text = render(schedule, flaky_bot)
+    assert "Olena" in text and "unknown" not in text
+    assert render(schedule, FlakyBot(failures=5)) == text
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+
+import pytest
+from PIL import Image
+
+import bot
+import shop_pages
+from photo_cache import photo_cache
+from skins import Skin
+
+
+def make_skins(tmp_path, count, color=(200, 0, 0)):
+    skins = []
+    for index in range(count):
+        path = str(tmp_path / f"skin{index}.png")
+        Image.new("RGBA", (64, 48), color).save(path)
+        stat = os.stat(path)
+        skins.append(Skin(f"skin{index}", "profile_skins", path, stat.st_size, stat.st_mtime_ns))
+    return skins
+
+
+@pytest.fixture
+def pages_dir(json_store, tmp_path, monkeypatch):
+    directory = str(tmp_path / "pages")
+    monkeypatch.setattr(shop_pages, "SHOP_PAGES_DIR", directory)
+    return directory
+
+
+def test_page_is_rendered_once_per_set_of_skins(pages_dir, tmp_path):
+    skins = make_skins(tmp_path, 5)
+    path, version = shop_pages.render_page("profile", 0, skins)
+    with Image.open(path) as page:
+        assert page.size == (3 * shop_pages.TILE_SIZE, 2 * shop_pages.TILE_SIZE)
+    assert shop_pages.render_page("profile", 0, skins) == (path, version)
+
+    # Замінений скін - нова картинка сторінки, стара видаляється разом з file_id
+    photo_cache.remember(path, "old-file-id", version)
+    skins[2].mtime_ns += 1
+    new_path, new_version = shop_pages.render_page("profile", 0, skins)
+    assert new_version != version
+    assert os.listdir(pages_dir) == [os.path.basename(new_path)]
+    assert photo_cache.get(path, version) is None
+
+
+class FakeMessage:
+    def __init__(self, photo):
+        self.photo = photo
+
+
+class FakeQuery:
+    def __init__(self, data, photo):
+        self.data = data
+        self.message = FakeMessage(photo)
+        self.calls = []
+
+    async def edit_message_media(self, **kwargs):
+        self.calls.append(("editMessageMedia", kwargs))
+        return FakeMessage([type("PhotoSize", (), {"file_id": "page-file-id"})()])
+
+    async def answer(self, *args):
+        self.calls.append(("answerCallbackQuery", args))
+
+
+class FakeUpdate:
+    def __init__(self, query):
+        self.callback_query = query
+        self.effective_chat = type("Chat", (), {"id": -100})()
+
+
+def test_turning_a_page_is_one_media_edit(pages_dir, tmp_path, monkeypatch):
+    skins = make_skins(tmp_path, 7)
+    monkeypatch.setattr(bot, "get_skin_page", lambda category, page_number: (
+        skins[page_number * bot.SKINS_PER_PAGE:(page_number + 1) * bot.SKINS_PER_PAGE], len(skins)))
+
+    query = FakeQuery("shop 1 profile", photo=[object()])
+    asyncio.run(bot.turn_shop_page(FakeUpdate(query), None))
+
+    assert [name for name, _ in query.calls] == ["editMessageMedia", "answerCallbackQuery"]
+    edit = query.calls[0][1]
+    assert "2. `skin6`" in edit["media"].caption
+    assert [button.callback_data for button in edit["reply_markup"].inline_keyboard[0]] == ["shop 0 profile"]
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import copy
+from datetime import datetime, timedelta
+
+import pytest
+
+import bot
+from global_stats import global_stats
+from common.schedule_mask import Schedule
+from common.storage import store, schedule_key, stats_key
+from conftest import reset_caches
+
+CHAT = "-100"
+SCHEDULE_TYPES = ("today", "tomorrow", "weekday_default", "weekend_default")
+
+
+def day_start(year, month, day):
+    return bot.kyiv_tz.localize(datetime(year, month, day))
+
+
+def seed_chat():
+    # Чат без збережених стандартних графіків
+    store.put(schedule_key(CHAT, "today"), Schedule.from_legacy({
+        "15:00 - 16:00": [7], "16:00 - 17:00": [7, 8], "17:00 - 18:00": []}))
+    store.put(schedule_key(CHAT, "tomorrow"), Schedule.from_legacy({
+        "09:00 - 10:00": [8], "10:00 - 11:00": []}))
+    store.put(stats_key(CHAT), {"7": {"total": 5, "yesterday": 1, "daily": {"3": 5}, "currency": 40, "name": "Seven"}})
+    store.flush()
+
+
+def snapshot():
+    """What the bot sees after a restart: schedules, statistics and derived rankings."""
+    store.flush()
+    reset_caches()
+    return copy.deepcopy({
+        "chats": sorted(store.backend.list_chats()),
+        "schedules": {schedule_type: (schedule.to_legacy() if schedule is not None else None)
+                      for schedule_type in SCHEDULE_TYPES
+                      for schedule in [store.get(schedule_key(CHAT, schedule_type))]},
+        "stats": bot.load_statistics(CHAT),
+        "global": global_stats.top("users", "total", 5),
+    })
+
+
+def roll_days(first_day, days):
+    seed_chat()
+    snapshots = []
+    for offset in range(days):
+        bot.rollover_chat(CHAT, first_day + timedelta(days=offset))
+        snapshots.append(snapshot())
+    return snapshots
+
+
+@pytest.fixture(autouse=True)
+def no_lazy_rollover(monkeypatch):
+    # Тут дні перемикаються вручну, фоновий перенос не має втручатися
+    monkeypatch.setattr(bot.lazy_rollover, "ensure", lambda chat_id: None)
+
+
+@pytest.fixture
+def json_snapshots(json_store):
+    return roll_days(day_start(2026, 10, 15), 5)
+
+
+@pytest.fixture
+def sqlite_snapshots(sqlite_store):
+    return roll_days(day_start(2026, 10, 15), 5)
+
+
+def test_sqlite_rollover_matches_json(json_snapshots, sqlite_snapshots):
+    for day, (json_state, sqlite_state) in enumerate(zip(json_snapshots, sqlite_snapshots)):
+        assert sqlite_state == json_state, f"backends diverged after rollover {day + 1}"
+
+
+def test_rollover_without_stored_defaults_keeps_the_chat(sqlite_snapshots):
+    for state in sqlite_snapshots:
+        assert state["chats"] == [CHAT]
+        assert state["schedules"]["today"]
+        assert state["schedules"]["tomorrow"]
+    # Після перших двох днів у графіках нікого немає, вчорашні години обнуляються
+    assert sqlite_snapshots[-1]["stats"]["7"]["yesterday"] == 0
+    assert sqlite_snapshots[-1]["stats"]["7"]["total"] == 7
+
+
+def test_rollover_uses_the_default_of_the_day_type(sqlite_snapshots):
+    # 16.10.2026 - п'ятниця: на суботу береться вихідний шаблон, на понеділок - будній
+    friday, saturday, sunday = sqlite_snapshots[1:4]
+    assert list(friday["schedules"]["tomorrow"]) == list(bot.empty_weekend)
+    assert list(sunday["schedules"]["tomorrow"]) == list(bot.empty_weekday)
+    assert saturday["schedules"]["weekend_default"] is not None
+
+
+def test_every_data_kind_is_migrated():
+    from directory import directory_key
+    from global_stats import GLOBAL_KEY, contributions_key
+    from hours_history import history_key
+    from llm_cache import PROMPT_CACHE_KEY
+    from photo_cache import FILE_IDS_KEY
+    from common.rollover import meta_key
+    from common.storage import DATA_KINDS
+
+    keys = [directory_key(CHAT), GLOBAL_KEY, contributions_key(CHAT), history_key(CHAT),
+            PROMPT_CACHE_KEY, FILE_IDS_KEY, meta_key(CHAT)]
+    assert {key[0] for key in keys} <= set(DATA_KINDS)
+
+
+def test_migration_copies_the_whole_json_tree(json_store, tmp_path):
+    from common.migrate_to_sqlite import migrate
+    from common.sqlite_storage import SqliteBackend
+    from common.storage import DATA_KINDS, data_key
+
+    seed_chat()
+    for kind in DATA_KINDS:
+        store.put(data_key(kind, CHAT), {"kind": kind, "values": [1, 2]})
+    store.flush()
+
+    migrate(str(tmp_path / "bot.db"))
+    backend = SqliteBackend(str(tmp_path / "bot.db"))
+    try:
+        assert backend.list_chats() == [CHAT]
+        for schedule_type in ("today", "tomorrow"):
+            key = schedule_key(CHAT, schedule_type)
+            assert backend.read(key) == store.backend.read(key)
+        assert backend.read(stats_key(CHAT)) == store.backend.read(stats_key(CHAT))
+        for kind in DATA_KINDS:
+            assert backend.read(data_key(kind, CHAT)) == {"kind": kind, "values": [1, 2]}
+    finally:
+        backend.close()
+
+
+def test_put_leaves_flushing_to_the_background_thread(json_store, monkeypatch):
+    monkeypatch.setattr(store, "max_dirty", 2)
+    monkeypatch.setattr(store, "_wake", type(store._wake)())
+    store.put(stats_key("-1"), {})
+    store.put(stats_key("-2"), {})
+    # Обробник лише будить потік запису, сам на диск нічого не пише
+    assert store.is_dirty(stats_key("-1")) and store.is_dirty(stats_key("-2"))
+    assert store._wake.is_set()
+    store.flush()
+    assert store.backend.read(stats_key("-2")) == {}
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from update_processor import ChatUpdateProcessor
+
+
+class Update:
+    def __init__(self, chat_id):
+        self.effective_chat = type("Chat", (), {"id": chat_id})()
+
+
+def test_chats_run_concurrently_and_each_chat_in_order():
+    async def scenario():
+        processor = ChatUpdateProcessor()
+        log = []
+        slow_reply = asyncio.Event()
+
+        async def handle(name, wait=None):
+            log.append(f"{name} start")
+            if wait:
+                await wait.wait()
+            log.append(f"{name} end")
+
+        tasks = [
+            asyncio.create_task(processor.process_update(Update(-1), handle("A1", slow_reply))),
+            asyncio.create_task(processor.process_update(Update(-1), handle("A2"))),
+            asyncio.create_task(processor.process_update(Update(-2), handle("B1"))),
+        ]
+        await asyncio.sleep(0.01)
+        # Чат -2 не чекає на повільне оновлення чату -1, а друге оновлення чату -1 - чекає
+        assert log == ["A1 start", "B1 start", "B1 end"]
+        slow_reply.set()
+        await asyncio.gather(*tasks)
+        assert log[3:] == ["A1 end", "A2 start", "A2 end"]
+        assert processor._chats == {}
+
+    asyncio.run(scenario())
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from telegram.ext import BaseUpdateProcessor
+
+# Скільки оновлень обробляються одночасно на весь бот
+MAX_CONCURRENT_UPDATES = 256
+
+
+class ChatUpdateProcessor(BaseUpdateProcessor):
+    """Handles updates of different chats concurrently and updates of one chat in order.
+
+    A slow handler (a chatbot reply, a send held back by the rate limiter)
+    then delays only its own chat. Handlers of one chat still never
+    interleave, so their read-modify-write of the chat's schedules and
+    statistics is as safe as with sequential processing.
+    """
+
+    def __init__(self, max_concurrent_updates=MAX_CONCURRENT_UPDATES):
+        super().__init__(max_concurrent_updates)
+        self._chats = {}  # chat_id -> [asyncio.Lock, updates queued or running]
+
+    async def do_process_update(self, update, coroutine):
+        chat = getattr(update, "effective_chat", None)
+        chat_id = chat.id if chat else None
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            entry = self._chats[chat_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[chat_id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass